@@ -15,6 +15,7 @@ from .auxiliary import *
 # from . import analysis
 from . import filtering
 from . import plotting
+from . import spectral
 from . import utils
 from . import utils_
 from .utils_ import metrics
@@ -9,7 +9,9 @@ __all__ = ['linregress_ting',
            'three_consecutive_bins_above_q',
            'score_hmm_time_resolved',
            'score_hmm_logprob_cumulative',
-           'pooled_time_swap_bst']
+           'pooled_time_swap_bst',
+           'time_swap_counts',
+           'unit_id_shuffle_counts']
 
 import warnings
 import copy
@@ -21,9 +23,21 @@ from scipy import stats
 from .. import hmmutils
 from ..core import SpikeTrainArray
 from .. import auxiliary
-from ..decoding import decode1D as decode
+from ..decoding import BayesianDecoder
 from ..decoding import k_fold_cross_validation
 from ..decoding import get_mode_pth_from_array, get_mean_pth_from_array
+from ..utils_ import copying
+
+def _get_decoder(tuningcurve, bst):
+    """Return a BayesianDecoder for the events in bst.
+
+    tuningcurve may already be a BayesianDecoder, so that its model terms
+    are computed once, and reused when scoring many events or shuffles. Its
+    decode method raises a ValueError if its ds differs from bst.ds.
+    """
+    if isinstance(tuningcurve, BayesianDecoder):
+        return tuningcurve
+    return BayesianDecoder(tuningcurve, ds=bst.ds)
 
 def get_line_of_best_Davidson_score(bst, tuningcurve, w=3, n_samples=50000):
     tc = tuningcurve
@@ -93,7 +107,7 @@ def get_line_of_best_Davidson_score(bst, tuningcurve, w=3, n_samples=50000):
         return score, best_ri
 
     # decode neural activity
-    posterior_array, bdries, mode_pth, mean_pth = decode(bst=bst, ratemap=tc, xmax=310)
+    posterior_array, bdries, mode_pth, mean_pth = _get_decoder(tc, bst).decode(bst)
 
     # precondition matrix kernel for banded summation
     k = np.zeros((2*w+1, 3))
@@ -317,8 +331,7 @@ def score_Davidson_final_bst_fast(bst, tuningcurve, w=None, n_shuffles=2000, n_s
     else:
         raise ValueError("n_shuffles must be an integer!")
 
-    posterior, bdries, mode_pth, mean_pth = decode(bst=bst,
-                                                   ratemap=tuningcurve)
+    posterior, bdries, mode_pth, mean_pth = _get_decoder(tuningcurve, bst).decode(bst)
 
     # precondition matrix kernel for banded summation
     k = np.zeros((2*w+1, 3))
@@ -468,8 +481,7 @@ def score_Davidson_final_bst(bst, tuningcurve, w=None, n_shuffles=2000, n_sample
     else:
         raise ValueError("n_shuffles must be an integer!")
 
-    posterior, bdries, mode_pth, mean_pth = decode(bst=bst,
-                                                   ratemap=tuningcurve)
+    posterior, bdries, mode_pth, mean_pth = _get_decoder(tuningcurve, bst).decode(bst)
 
     # precondition matrix kernel for banded summation
     k = np.zeros((2*w+1, 3))
@@ -533,7 +545,7 @@ def linregress_ting(bst, tuningcurve, n_shuffles=250):
     else:
         raise ValueError("n_shuffles must be an integer!")
 
-    posterior, bdries, mode_pth, mean_pth = decode(bst=bst, ratemap=tuningcurve)
+    posterior, bdries, mode_pth, mean_pth = _get_decoder(tuningcurve, bst).decode(bst)
 
 #     bdries = np.insert(np.cumsum(bst.lengths), 0, 0)
     r2values = np.zeros(bst.n_epochs)
@@ -582,7 +594,7 @@ def linregress_array(posterior):
 def linregress_bst(bst, tuningcurve):
     """perform linear regression on all the events in bst, and return the slopes, intercepts, and R^2 values"""
 
-    posterior, bdries, mode_pth, mean_pth = decode(bst=bst, ratemap=tuningcurve)
+    posterior, bdries, mode_pth, mean_pth = _get_decoder(tuningcurve, bst).decode(bst)
 
     slopes = np.zeros(bst.n_epochs)
     intercepts = np.zeros(bst.n_epochs)
@@ -621,24 +633,91 @@ def time_swap_array(posterior):
 
 def time_swap_bst(bst):
     """Time swap on BinnedSpikeTrainArray, swapping only within each epoch."""
-    out = copy.deepcopy(bst) # should this be deep? YES! Oh my goodness, yes!
+    out = copying.copy_without(bst, '_data') # data is replaced below
     shuffled = np.arange(bst.n_bins)
     edges = np.insert(np.cumsum(bst.lengths),0,0)
     for ii in range(bst.n_epochs):
         segment = shuffled[edges[ii]:edges[ii+1]]
         shuffled[edges[ii]:edges[ii+1]] = np.random.permutation(segment)
 
-    out._data = out._data[:,shuffled]
+    out._data = bst._data[:,shuffled]
+    out.__renew__()
 
     return out
 
 def pooled_time_swap_bst(bst):
     """Time swap on BinnedSpikeTrainArray, swapping within entire bst."""
-    out = copy.deepcopy(bst) # should this be deep? YES! Oh my goodness, yes!
+    out = copying.copy_without(bst, '_data') # data is replaced below
     shuffled = np.random.permutation(bst.n_bins)
-    out._data = out._data[:,shuffled]
+    out._data = bst._data[:,shuffled]
+    out.__renew__()
     return out
 
+def _epoch_index(lengths, n_bins):
+    """Return the epoch index of every bin."""
+    if lengths is None:
+        lengths = [n_bins]
+    lengths = np.atleast_1d(lengths).astype(int)
+    if lengths.sum() != n_bins:
+        raise ValueError("lengths must sum to the number of bins!")
+    return np.repeat(np.arange(len(lengths)), lengths)
+
+def time_swap_counts(data, lengths=None, *, n_shuffles=1, random_state=None):
+    """Time swap surrogates of a spike count matrix, swapping only within
+    each epoch, as in time_swap_bst.
+
+    Parameters
+    ----------
+    data : array_like
+        Spike counts with shape (n_units, n_bins), e.g., bst.data.
+    lengths : array_like, optional
+        Number of bins of every epoch, e.g., bst.lengths. Default is a
+        single epoch.
+    n_shuffles : int, optional
+        Number of surrogates. Default is 1.
+    random_state : int or np.random.RandomState, optional
+        Seed or random number generator.
+
+    Returns
+    -------
+    surrogates : array
+        Spike counts with shape (n_shuffles, n_units, n_bins), e.g., to
+        be decoded by BayesianDecoder.decode_surrogates.
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    data = np.asarray(data)
+    epoch_idx = _epoch_index(lengths, data.shape[1])
+
+    # random keys offset by the epoch index permute bins only within epochs
+    keys = random_state.rand(n_shuffles, data.shape[1]) + epoch_idx
+    shuffled = np.argsort(keys, axis=1)
+
+    return np.transpose(data[:, shuffled], (1, 0, 2))
+
+def unit_id_shuffle_counts(data, lengths=None, *, n_shuffles=1, random_state=None):
+    """Unit ID shuffle surrogates of a spike count matrix, permuting the
+    units independently within each epoch, as in unit_id_shuffle_bst.
+
+    Takes the same parameters as time_swap_counts.
+
+    Returns
+    -------
+    surrogates : array
+        Spike counts with shape (n_shuffles, n_units, n_bins).
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    data = np.asarray(data)
+    n_units, n_bins = data.shape
+    epoch_idx = _epoch_index(lengths, n_bins)
+
+    # unit permutation of every shuffle and epoch, and then of every bin
+    permutations = np.argsort(random_state.rand(n_shuffles, epoch_idx[-1] + 1, n_units), axis=2)
+    units = np.transpose(permutations[:, epoch_idx, :], (0, 2, 1))
+
+    return data[units, np.arange(n_bins)]
+
 def pooled_incoherent_shuffle_bst(bst):
     """Incoherent shuffle on BinnedSpikeTrainArray, swapping within entire bst."""
     raise NotImplementedError('function not done yet!')
@@ -839,8 +918,8 @@ def trajectory_score_bst(bst, tuningcurve, w=None, n_shuffles=250,
     bst : BinnedSpikeTrainArray
         BinnedSpikeTrainArray containing all the candidate events to
         score.
-    tuningcurve : TuningCurve1D
-        Tuning curve to decode events in bst.
+    tuningcurve : TuningCurve1D or BayesianDecoder
+        Tuning curve (or decoder) to decode events in bst.
     w : int, optional (default is 0)
         Half band width for calculating the trajectory score. If w=0,
         then only the probabilities falling directly under the line are
@@ -872,8 +951,7 @@ def trajectory_score_bst(bst, tuningcurve, w=None, n_shuffles=250,
     else:
         raise ValueError("n_shuffles must be an integer!")
 
-    posterior, bdries, mode_pth, mean_pth = decode(bst=bst,
-                                                   ratemap=tuningcurve)
+    posterior, bdries, mode_pth, mean_pth = _get_decoder(tuningcurve, bst).decode(bst)
 
     # idea: cycle each column so that the top w rows are the band
     # surrounding the regression line
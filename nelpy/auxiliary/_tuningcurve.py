@@ -1,12 +1,18 @@
-__all__ = ['TuningCurve1D', 'TuningCurve2D', 'DirectionalTuningCurve1D']
+__all__ = ['TuningCurve1D', 'TuningCurve2D', 'DirectionalTuningCurve1D',
+           'TuningCurve1DAccumulator', 'TuningCurve2DAccumulator',
+           'TuningCurveND', 'conditional_tuningcurves']
 
 import copy
 import numpy as np
 import numbers
 import scipy.ndimage.filters
+import scipy.sparse
 import warnings
 
+from concurrent.futures import ThreadPoolExecutor
+
 from .. import utils
+from ..utils_ import cache
 
 # TODO: TuningCurve2D
 # 1. init from rate map
@@ -23,6 +29,101 @@ warnings.formatwarning = lambda message, category, filename, lineno, \
         message, category, filename, lineno, line='')
 
 
+def _accumulate_by_bin(data, bin_idx, n_bins):
+    """Sum the columns of data into bins.
+
+    The accumulation is done as a single sparse matrix product with the
+    one-hot (n_samples, n_bins) bin matrix, so that all units are handled at
+    once, and memory stays linear in the number of samples.
+
+    Parameters
+    ----------
+    data : array of shape (n_units, n_samples)
+    bin_idx : array of shape (n_samples,)
+        Bin (from 0 to n_bins-1) of each sample.
+    n_bins : int
+
+    Returns
+    -------
+    out : array of shape (n_units, n_bins)
+        out[u, b] is the sum of data[u, t] over all t with bin_idx[t] == b.
+    """
+    n_samples = len(bin_idx)
+    onehot = scipy.sparse.csr_matrix((np.ones(n_samples), (np.arange(n_samples), bin_idx)),
+                                     shape=(n_samples, n_bins))
+    return np.asarray((onehot.T @ np.asarray(data, dtype=float).T).T)
+
+def _extend_extern_to(extern, bin_centers):
+    """Return extern, with its first and last sample times moved out to the
+    first and last bin centers if these fall outside of them, so that extern
+    can be interpolated at all bin centers. The support of extern is
+    extended to include the moved samples."""
+    if bin_centers[0] < extern._time[0]:
+        extern = copy.copy(extern)
+        extern._time = np.array(extern._time) # don't modify the caller's buffer
+        extern._time[0] = bin_centers[0]
+        support = np.array(extern._support.time, ndmin=2)
+        support[0, 0] = min(support[0, 0], bin_centers[0])
+        extern._support = type(extern._support)(support)
+        extern._interp = None
+    if bin_centers[-1] > extern._time[-1]:
+        extern = copy.copy(extern)
+        extern._time = np.array(extern._time) # don't modify the caller's buffer
+        extern._time[-1] = bin_centers[-1]
+        support = np.array(extern._support.time, ndmin=2)
+        # supports are half-open, so the stop must lie beyond the last sample:
+        support[-1, 1] = max(support[-1, 1], np.nextafter(bin_centers[-1], np.inf))
+        extern._support = type(extern._support)(support)
+        extern._interp = None
+    return extern
+
+def _normalized_gaussian_filter(ratemap, weights, *, sigma, truncate):
+    """Smooth the ratemaps of all units at once by normalized convolution.
+
+    The weighted ratemaps (for occupancy weights, the spike counts) and the
+    weights are smoothed separately with a Gaussian kernel, and then divided,
+    so that bins without weight (e.g., unvisited bins, or bins outside of a
+    mask) do not bleed into the estimate. Bins without weight keep their
+    values.
+
+    Parameters
+    ----------
+    ratemap : array of shape (n_units,) + weights.shape
+    weights : array
+        Non-negative weight of every external correlate bin.
+    sigma : tuple of float
+        Standard deviation (in bins) along every external correlate axis.
+    truncate : float
+        Kernel bandwidth, in standard deviations.
+    """
+    weights = np.asarray(weights, dtype=float)
+    unit_axes = (0,)*(ratemap.ndim - weights.ndim)
+    numerator = scipy.ndimage.filters.gaussian_filter(
+        ratemap*weights, sigma=unit_axes + tuple(sigma), truncate=truncate,
+        mode='constant')
+    denominator = scipy.ndimage.filters.gaussian_filter(
+        weights, sigma=tuple(sigma), truncate=truncate, mode='constant')
+
+    out = np.array(ratemap, dtype=float)
+    valid = weights > 0
+    out[..., valid] = numerator[..., valid] / denominator[valid]
+    return out
+
+def _spatial_information_batch(ratemaps):
+    """Spatial information (as in utils.spatial_information) of a batch of
+    ratemaps with shape (n_batch, n_units, n_bins).
+
+    Returns
+    -------
+    si : array of shape (n_batch, n_units)
+    """
+    # floor every ratemap at its smallest positive firing rate:
+    positive = np.where(ratemaps > 0, ratemaps, np.inf)
+    bkg_rate = positive.reshape(len(ratemaps), -1).min(axis=1)
+    ratemaps = np.maximum(ratemaps, bkg_rate[:, np.newaxis, np.newaxis])
+    ratio = ratemaps / ratemaps.mean(axis=-1, keepdims=True)
+    return np.mean(ratio*np.log2(ratio), axis=-1)
+
 ########################################################################
 # class TuningCurve2D
 ########################################################################
@@ -424,16 +525,7 @@ class TuningCurve2D:
         # sample times within a support epoch, we can assume that the signal
         # stayed roughly constant for that one sample duration.
 
-        if self._bst._bin_centers[0] < self._extern.time[0]:
-            self._extern = copy.copy(self._extern)
-            self._extern.time[0] = self._bst._bin_centers[0]
-            self._extern._interp = None
-            # raise ValueError('interpolated sample requested before first sample of extern!')
-        if self._bst._bin_centers[-1] > self._extern.time[-1]:
-            self._extern = copy.copy(self._extern)
-            self._extern.time[-1] = self._bst._bin_centers[-1]
-            self._extern._interp = None
-            # raise ValueError('interpolated sample requested after last sample of extern!')
+        self._extern = _extend_extern_to(self._extern, self._bst._bin_centers)
 
         x, y = self.trans_func(self._extern, at=self._bst.bin_centers)
 
@@ -474,14 +566,15 @@ class TuningCurve2D:
         if ext_bin_idx_y.min() == 0:
             raise ValueError("ext values less than 'ext_ymin'")
 
-        ratemap = np.zeros((self.n_units, self.n_xbins, self.n_ybins))
-
-        for tt, (bidxx, bidxy) in enumerate(zip(ext_bin_idx_x, ext_bin_idx_y)):
-            ratemap[:,bidxx-1, bidxy-1] += self._bst.data[:,tt]
+        # accumulate the spike counts of all units over raveled (x, y) bins:
+        ext_bin_idx = np.ravel_multi_index((ext_bin_idx_x - 1, ext_bin_idx_y - 1),
+                                           (self.n_xbins, self.n_ybins))
+        ratemap = _accumulate_by_bin(self._bst.data, ext_bin_idx,
+                                     self.n_xbins*self.n_ybins)
+        ratemap = ratemap.reshape(self.n_units, self.n_xbins, self.n_ybins)
 
         # apply minimum observation duration
-        for uu in range(self.n_units):
-            ratemap[uu][self.occupancy*self._bst.ds < min_duration] = 0
+        ratemap[:, self.occupancy*self._bst.ds < min_duration] = 0
 
         return ratemap / self._bst.ds
 
@@ -559,7 +652,8 @@ class TuningCurve2D:
     def __len__(self):
         return self.n_units
 
-    def smooth(self, *, sigma=None, bw=None, inplace=False, mode=None, cval=None):
+    def smooth(self, *, sigma=None, bw=None, inplace=False, mode=None,
+               cval=None, normalized=False):
         """Smooths the tuning curve with a Gaussian kernel.
 
         mode : {‘reflect’, ‘constant’, ‘nearest’, ‘mirror’, ‘wrap’}, optional
@@ -568,6 +662,13 @@ class TuningCurve2D:
             ‘reflect’
         cval : scalar, optional
             Value to fill past edges of input if mode is ‘constant’. Default is 0.0
+        normalized : bool, optional
+            If True, smooth by normalized convolution: the spike counts
+            (rates weighted by occupancy) and the occupancy are smoothed
+            separately and then divided, so that unvisited bins, bins
+            outside of the mask, and the borders do not bleed into the
+            estimate. Unvisited bins keep their values. mode and cval are
+            ignored. Default is False.
         """
         if sigma is None:
             sigma = 0.1 # in units of extern
@@ -588,7 +689,16 @@ class TuningCurve2D:
         else:
             out = self
 
-        if self.mask is None:
+        if normalized:
+            weights = self.occupancy
+            if self.mask is not None:
+                weights = weights*np.nan_to_num(self.mask)
+            out._ratemap = _normalized_gaussian_filter(self.ratemap, weights,
+                                                       sigma=(sigma_x, sigma_y),
+                                                       truncate=bw)
+            if self.mask is not None:
+                out._ratemap = out._ratemap*self.mask
+        elif self.mask is None:
             if self.n_units > 1:
                 out._ratemap = scipy.ndimage.filters.gaussian_filter(self.ratemap, sigma=(0,sigma_x, sigma_y), truncate=bw, mode=mode, cval=cval)
             else:
@@ -787,12 +897,31 @@ class TuningCurve1D:
                                     label=label)
             return
 
+        # re-use an identical, previously computed tuning curve if possible:
+        key = cache.make_key('TuningCurve1D', bst=bst, extern=extern,
+                             sigma=sigma, bw=bw, n_extern=n_extern,
+                             transform_func=transform_func,
+                             minbgrate=minbgrate, extmin=extmin,
+                             extmax=extmax, label=label,
+                             min_duration=min_duration)
+        hit, tuningcurve = cache.get(key)
+        if hit:
+            self.__dict__ = tuningcurve.__dict__
+            if transform_func is None:
+                self.trans_func = self._trans_func
+            return
+
         self._bst = bst
         self._extern = extern
 
         if minbgrate is None:
             minbgrate = 0.01 # Hz minimum background firing rate
 
+        # remember how the ratemap was regularized (for shuffle statistics):
+        self._minbgrate = minbgrate
+        self._sigma = sigma
+        self._bw = bw
+
         if n_extern is not None:
             if extmin is not None and extmax is not None:
                 self._bins = np.linspace(extmin, extmax, n_extern+1)
@@ -830,6 +959,8 @@ class TuningCurve1D:
         # optionally detach _bst and _extern to save space when pickling, for example
         self._detach()
 
+        cache.put(key, self)
+
     @property
     def is2d(self):
         return False
@@ -887,6 +1018,133 @@ class TuningCurve1D:
 
         return utils.spatial_information(ratemap=self.ratemap)
 
+    def spatial_information_significance(self, *, bst, extern, n_shuffles=100,
+                                         sigma=None, bw=None, minbgrate=None,
+                                         random_state=None, batch_size=None,
+                                         n_jobs=1):
+        """Shuffle significance of the spatial information of each unit.
+
+        As in Markus et al. (1994), the spike counts are circularly shifted
+        in time against the external correlate, and the spatial information
+        of the observed data is compared to that of the shifted data. All
+        shuffled ratemaps are computed as batched (n_shuffles, n_units,
+        n_bins) operations, using the same occupancy, min_duration,
+        background firing rate and smoothing as the observed ratemap.
+
+        Parameters
+        ----------
+        bst : BinnedSpikeTrainArray
+            Binned spike trains that the tuning curve was computed from.
+        extern : AnalogSignalArray
+            External correlate that the tuning curve was computed from.
+        n_shuffles : int, optional
+            Number of random circular shifts. Default is 100.
+        sigma, bw, minbgrate : float, optional
+            Smoothing and minimum background firing rate, as passed to the
+            constructor. Default is to use those of this tuning curve.
+        random_state : int or np.random.RandomState, optional
+            Seed or random number generator used to draw the shifts.
+        batch_size : int, optional
+            Number of shuffles computed at a time. Default is chosen such
+            that every batch holds about 4 million (spike, shuffle) pairs.
+        n_jobs : int, optional
+            Number of threads over which the batches are distributed.
+            Default is 1.
+
+        Returns
+        -------
+        zscores : array of shape (n_units,)
+            Observed spatial information, standardized by the mean and
+            standard deviation of the shuffle distribution.
+        pvalues : array of shape (n_units,)
+            Fraction of shuffles (counting the observed data as one) with
+            spatial information at least as large as the observed one.
+        """
+        from ..filtering import _get_n_jobs
+
+        if sigma is None:
+            sigma = getattr(self, '_sigma', None)
+        if bw is None:
+            bw = getattr(self, '_bw', None)
+        if bw is None:
+            bw = 4
+        if minbgrate is None:
+            minbgrate = getattr(self, '_minbgrate', 0.01)
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+
+        if bst.n_units != self.n_units:
+            raise ValueError("bst has {} units, but the tuning curve has {}!".format(
+                bst.n_units, self.n_units))
+        if list(bst.unit_ids) != list(self.unit_ids):
+            raise ValueError("bst must have the same unit_ids as the tuning curve!")
+
+        # occupancy, and external correlate bin of every time bin:
+        tc = copy.copy(self)
+        tc._bst = bst
+        tc._extern = extern
+        occupancy = tc._compute_occupancy() # also extends tc._extern to bst
+        ext = tc.trans_func(tc._extern, at=bst.bin_centers)
+        if np.any(np.isnan(ext)):
+            raise ValueError("extern is not defined at every bin of bst!")
+        ext_bin_idx = np.digitize(ext, self.bins, right=True)
+        if ext_bin_idx.max() > self.n_bins:
+            raise ValueError("ext values greater than 'ext_max' ({})".format(self.bins[-1]))
+        if ext_bin_idx.min() == 0:
+            raise ValueError("ext values less than 'ext_min' ({})".format(self.bins[0]))
+        ext_bin_idx -= 1
+
+        n_time = len(ext_bin_idx)
+        if n_time < 2:
+            raise ValueError("at least two time bins are needed to shuffle!")
+        # shift 0 is the observed data:
+        shifts = np.insert(random_state.randint(1, n_time, size=n_shuffles), 0, 0)
+
+        # only time bins with spikes contribute to the ratemaps:
+        units, times = np.nonzero(bst.data)
+        counts = bst.data[units, times].astype(float)
+        if batch_size is None:
+            batch_size = max(1, 2**22 // max(len(times), 1))
+
+        n_units, n_bins = self.n_units, self.n_bins
+        invalid = occupancy*bst.ds < self._min_duration
+        denom = np.where(occupancy == 0, 1, occupancy)*bst.ds
+        if sigma is not None and sigma > 0:
+            sigma_bins = sigma / ((self.bins[-1] - self.bins[0])/n_bins)
+        else:
+            sigma_bins = 0
+
+        def batch_si(batch_shifts):
+            """Spatial information of all units for a batch of shifts."""
+            n_batch = len(batch_shifts)
+            ext_idx = ext_bin_idx[(times + batch_shifts[:, np.newaxis]) % n_time]
+            flat_idx = (np.arange(n_batch)[:, np.newaxis]*n_units + units)*n_bins + ext_idx
+            ratemaps = np.bincount(flat_idx.ravel(),
+                                   weights=np.tile(counts, n_batch),
+                                   minlength=n_batch*n_units*n_bins)
+            ratemaps = ratemaps.reshape(n_batch, n_units, n_bins)
+            ratemaps[:, :, invalid] = 0
+            ratemaps /= denom
+            ratemaps[ratemaps < minbgrate] = minbgrate
+            if sigma_bins > 0:
+                ratemaps = scipy.ndimage.filters.gaussian_filter(
+                    ratemaps, sigma=(0, 0, sigma_bins), truncate=bw, mode='reflect')
+            return _spatial_information_batch(ratemaps)
+
+        batches = [shifts[ii:ii+batch_size] for ii in range(0, len(shifts), batch_size)]
+        n_jobs = _get_n_jobs(n_jobs)
+        if n_jobs > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                si = np.vstack(list(executor.map(batch_si, batches)))
+        else:
+            si = np.vstack([batch_si(batch) for batch in batches])
+
+        observed, null = si[0], si[1:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            zscores = (observed - null.mean(axis=0)) / null.std(axis=0)
+        pvalues = (1 + np.sum(null >= observed, axis=0)) / (1 + n_shuffles)
+        return zscores, pvalues
+
     def spatial_sparsity(self):
         """Compute the spatial information and firing sparsity...
 
@@ -1076,16 +1334,7 @@ class TuningCurve1D:
         # sample times within a support epoch, we can assume that the signal
         # stayed roughly constant for that one sample duration.
 
-        if self._bst._bin_centers[0] < self._extern.time[0]:
-            self._extern = copy.copy(self._extern)
-            self._extern.time[0] = self._bst._bin_centers[0]
-            self._extern._interp = None
-            # raise ValueError('interpolated sample requested before first sample of extern!')
-        if self._bst._bin_centers[-1] > self._extern.time[-1]:
-            self._extern = copy.copy(self._extern)
-            self._extern.time[-1] = self._bst._bin_centers[-1]
-            self._extern._interp = None
-            # raise ValueError('interpolated sample requested after last sample of extern!')
+        self._extern = _extend_extern_to(self._extern, self._bst._bin_centers)
 
         ext = self.trans_func(self._extern, at=self._bst.bin_centers)
 
@@ -1110,14 +1359,11 @@ class TuningCurve1D:
         if ext_bin_idx.min() == 0:
             raise ValueError("ext values less than 'ext_min'")
 
-        ratemap = np.zeros((self.n_units, self.n_bins))
-
-        for tt, bidx in enumerate(ext_bin_idx):
-            ratemap[:,bidx-1] += self._bst.data[:,tt]
+        # accumulate the spike counts of all units and time bins at once:
+        ratemap = _accumulate_by_bin(self._bst.data, ext_bin_idx - 1, self.n_bins)
 
         # apply minimum observation duration
-        for uu in range(self.n_units):
-            ratemap[uu][self.occupancy*self._bst.ds < min_duration] = 0
+        ratemap[:, self.occupancy*self._bst.ds < min_duration] = 0
 
         return ratemap / self._bst.ds
 
@@ -1242,7 +1488,8 @@ class TuningCurve1D:
     def __len__(self):
         return self.n_units
 
-    def smooth(self, *, sigma=None, bw=None, inplace=False, mode=None, cval=None):
+    def smooth(self, *, sigma=None, bw=None, inplace=False, mode=None,
+               cval=None, normalized=False):
         """Smooths the tuning curve with a Gaussian kernel.
 
         mode : {‘reflect’, ‘constant’, ‘nearest’, ‘mirror’, ‘wrap’}, optional
@@ -1251,6 +1498,13 @@ class TuningCurve1D:
             ‘reflect’
         cval : scalar, optional
             Value to fill past edges of input if mode is ‘constant’. Default is 0.0
+        normalized : bool, optional
+            If True, smooth by normalized convolution: the spike counts
+            (rates weighted by occupancy) and the occupancy are smoothed
+            separately and then divided, so that unvisited bins, bins
+            outside of the mask, and the borders do not bleed into the
+            estimate. Unvisited bins keep their values. mode and cval are
+            ignored. Default is False.
         """
         if sigma is None:
             sigma = 0.1 # in units of extern
@@ -1269,7 +1523,10 @@ class TuningCurve1D:
         else:
             out = self
 
-        if self.n_units > 1:
+        if normalized:
+            out._ratemap = _normalized_gaussian_filter(self.ratemap, self.occupancy,
+                                                       sigma=(sigma,), truncate=bw)
+        elif self.n_units > 1:
             out._ratemap = scipy.ndimage.filters.gaussian_filter(self.ratemap, sigma=(0,sigma), truncate=bw, mode=mode, cval=cval)
         else:
             out._ratemap = scipy.ndimage.filters.gaussian_filter(self.ratemap, sigma=sigma, truncate=bw, mode=mode, cval=cval)
@@ -1535,8 +1792,13 @@ class DirectionalTuningCurve1D(TuningCurve1D):
     __attributes__ = ["_unit_ids_l2r", "_unit_ids_r2l"]
     __attributes__.extend(TuningCurve1D.__attributes__)
 
-    def __init__(self, *, bst_l2r, bst_r2l, bst_combined, extern, sigma=None, bw=None, n_extern=None, transform_func=None, minbgrate=None, extmin=0, extmax=1, extlabels=None, unit_ids=None, unit_labels=None, unit_tags=None, label=None, empty=False,
-    min_peakfiringrate=None, max_avgfiringrate=None, unimodal=False):
+    def __init__(self, *, bst_l2r=None, bst_r2l=None, bst_combined=None,
+                 extern=None, bst=None, direction=None, sigma=None, bw=None,
+                 n_extern=None, transform_func=None, minbgrate=None, extmin=0,
+                 extmax=1, extlabels=None, unit_ids=None, unit_labels=None,
+                 unit_tags=None, label=None, min_duration=None, empty=False,
+                 min_peakfiringrate=None, max_avgfiringrate=None,
+                 unimodal=False):
         """
 
         If sigma is nonzero, then smoothing is applied.
@@ -1547,6 +1809,15 @@ class DirectionalTuningCurve1D(TuningCurve1D):
             (3) n_extern, x_min, x_max, transform_func*
 
             transform_func operates on extern and returns a value that TuninCurve1D can interpret. If no transform is specified, the identity operator is assumed.
+
+        The directional tuning curves are estimated either from three
+        separate BinnedSpikeTrainArrays (bst_l2r, bst_r2l and bst_combined),
+        or, in a single pass, from one BinnedSpikeTrainArray (bst) together
+        with the running direction, which is either an array with one value
+        per time bin of bst (positive for left to right, negative for right
+        to left, and zero for neither), or a tuple of EpochArrays
+        (epochs_l2r, epochs_r2l). In the latter case, the non-directional
+        tuning curve is estimated from all time bins of bst.
         """
         # TODO: input validation
 
@@ -1556,6 +1827,13 @@ class DirectionalTuningCurve1D(TuningCurve1D):
                 exec("self." + attr + " = None")
             return
 
+        if bst is not None:
+            if direction is None:
+                raise ValueError("direction must be specified together with bst!")
+            bst_combined = bst
+        elif bst_l2r is None or bst_r2l is None or bst_combined is None:
+            raise ValueError("either bst and direction, or bst_l2r, bst_r2l and bst_combined must be specified!")
+
         # self._bst_combined = bst_combined
         self._extern = extern
 
@@ -1576,6 +1854,10 @@ class DirectionalTuningCurve1D(TuningCurve1D):
         else:
             raise NotImplementedError
 
+        if min_duration is None:
+            min_duration = 0
+
+        self._min_duration = min_duration
         self._min_peakfiringrate = min_peakfiringrate
         self._max_avgfiringrate = max_avgfiringrate
         self._unimodal = unimodal
@@ -1584,6 +1866,29 @@ class DirectionalTuningCurve1D(TuningCurve1D):
         self._unit_tags = bst_combined.unit_tags  # no input validation yet
         self.label = label
 
+        if bst is not None:
+            # all direction-conditioned occupancies and ratemaps at once:
+            if isinstance(direction, tuple):
+                conditions = {1: direction[0], -1: direction[1]}
+            else:
+                conditions = np.sign(direction)
+            acc = TuningCurve1DAccumulator(n_extern=n_extern, extmin=extmin,
+                                           extmax=extmax,
+                                           transform_func=transform_func)
+            accumulators, total = acc._conditional(bst, extern, conditions,
+                                                   categories=[1, -1])
+            kwargs = dict(sigma=sigma, bw=bw, minbgrate=minbgrate,
+                          min_duration=min_duration)
+            ratemap_l2r = accumulators[1].finalize(**kwargs).ratemap
+            ratemap_r2l = accumulators[-1].finalize(**kwargs).ratemap
+            combined = total.finalize(**kwargs)
+            self._occupancy = combined.occupancy
+            self._ratemap = combined.ratemap
+            self.trans_func = acc.trans_func
+            self._combine_directional(ratemap_l2r, ratemap_r2l)
+            self._detach()
+            return
+
         if transform_func is None:
             self.trans_func = self._trans_func
 
@@ -1632,8 +1937,14 @@ class DirectionalTuningCurve1D(TuningCurve1D):
         if sigma is not None:
             if sigma > 0:
                 self.smooth(sigma=sigma, bw=bw, inplace=True)
-        # store combined ratemap
-        ratemap = self.ratemap
+        self._combine_directional(ratemap_l2r, ratemap_r2l)
+
+        # optionally detach _bst and _extern to save space when pickling, for example
+        self._detach()
+
+    def _combine_directional(self, ratemap_l2r, ratemap_r2l):
+        """Replace the combined ratemap of units that are only active in
+        one direction by their directional ratemap."""
 
         # determine unit membership:
         l2r_unit_ids = self.restrict_units(ratemap_l2r)
@@ -1656,9 +1967,6 @@ class DirectionalTuningCurve1D(TuningCurve1D):
         self._unit_ids_l2r = l2r_only_unit_ids
         self._unit_ids_r2l = r2l_only_unit_ids
 
-        # optionally detach _bst and _extern to save space when pickling, for example
-        self._detach()
-
     def restrict_units(self, ratemap=None):
 
         if ratemap is None:
@@ -1681,4 +1989,954 @@ class DirectionalTuningCurve1D(TuningCurve1D):
 
     @property
     def unit_ids_r2l(self):
-        return self._unit_ids_r2l
\ No newline at end of file
+        return self._unit_ids_r2l
+
+########################################################################
+# class TuningCurve1DAccumulator / TuningCurve2DAccumulator
+########################################################################
+class _TuningCurveAccumulator:
+    """Base class for the incremental accumulation of tuning curves.
+
+    Accumulators hold the sufficient statistics of a tuning curve, namely
+    the occupancy (number of time bins) and the spike counts of every unit
+    in every external correlate bin, so that they can be updated with data
+    as it comes in, merged across sessions or workers, and finalized into a
+    tuning curve at any time.
+    """
+
+    def __init__(self, *, shape, transform_func=None, unit_ids=None,
+                 unit_labels=None, unit_tags=None):
+        self._shape = shape
+        self._occupancy = np.zeros(shape)
+        self._counts = None
+        self._ds = None
+        self._unit_ids = None
+        self._unit_labels = unit_labels
+        self._unit_tags = unit_tags
+        if unit_ids is not None:
+            self._init_units(unit_ids, unit_labels, unit_tags)
+
+        if transform_func is None:
+            self.trans_func = self._trans_func
+        else:
+            self.trans_func = transform_func
+
+    def _init_units(self, unit_ids, unit_labels, unit_tags):
+        self._unit_ids = np.array(unit_ids, ndmin=1)
+        if unit_labels is None:
+            unit_labels = self._unit_ids
+        self._unit_labels = np.array(unit_labels, ndmin=1)
+        self._unit_tags = unit_tags
+        self._counts = np.zeros((len(self._unit_ids),) + self._shape)
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        if self._ds is None:
+            return "<empty %s%s>" % (self.__class__.__name__, address_str)
+        return "<%s%s> %s units, %s accumulated" % (
+            self.__class__.__name__, address_str, self.n_units,
+            utils.PrettyDuration(self.duration))
+
+    @property
+    def n_units(self):
+        """(int) The number of units."""
+        if self._unit_ids is None:
+            return 0
+        return len(self._unit_ids)
+
+    @property
+    def unit_ids(self):
+        """Unit IDs of the accumulated units."""
+        if self._unit_ids is None:
+            return []
+        return list(self._unit_ids)
+
+    @property
+    def ds(self):
+        """(float) Bin width (in seconds) of the accumulated data."""
+        return self._ds
+
+    @property
+    def occupancy(self):
+        """Number of accumulated time bins in every external correlate bin."""
+        return self._occupancy
+
+    @property
+    def counts(self):
+        """Accumulated spike counts of every unit in every external
+        correlate bin."""
+        return self._counts
+
+    @property
+    def duration(self):
+        """(float) Total accumulated duration (in seconds)."""
+        if self._ds is None:
+            return 0
+        return self._occupancy.sum()*self._ds
+
+    def update(self, bst, extern):
+        """Accumulate a chunk of binned spike trains and the corresponding
+        external correlate.
+
+        Parameters
+        ----------
+        bst : BinnedSpikeTrainArray
+            Chunk of binned spike trains, with the same units and bin width
+            as all previously accumulated chunks.
+        extern : AnalogSignalArray
+            External correlate, covering (at least) the chunk.
+
+        Returns
+        -------
+        self
+        """
+        if bst.isempty or bst.n_bins == 0:
+            return self
+
+        if self._ds is None:
+            self._ds = bst.ds
+        elif not np.isclose(bst.ds, self._ds):
+            raise ValueError("bin width {} does not match the accumulated bin width {}!".format(bst.ds, self._ds))
+
+        if self._unit_ids is None:
+            self._init_units(bst.unit_ids, bst.unit_labels, bst.unit_tags)
+        elif list(bst.unit_ids) != self.unit_ids:
+            raise ValueError("unit_ids of bst do not match the accumulated unit_ids!")
+
+        extern = _extend_extern_to(extern, bst._bin_centers)
+        ext_bin_idx = self._ext_bin_idx(extern, at=bst.bin_centers)
+
+        n_bins = self._occupancy.size
+        self._occupancy += np.bincount(ext_bin_idx, minlength=n_bins).reshape(self._shape)
+        self._counts += _accumulate_by_bin(bst.data, ext_bin_idx, n_bins).reshape(self._counts.shape)
+
+        return self
+
+    def _grouped_statistics(self, bst, extern, group_idx, n_groups):
+        """Occupancy and spike counts of every group of time bins of bst,
+        with shapes (n_groups,) + shape and (n_groups, n_units) + shape,
+        computed in a single pass. Does not modify the accumulator.
+
+        group_idx holds the group (in 0, ..., n_groups-1) of every time bin.
+        """
+        extern = _extend_extern_to(extern, bst._bin_centers)
+        ext_bin_idx = self._ext_bin_idx(extern, at=bst.bin_centers)
+
+        n_bins = self._occupancy.size
+        flat_idx = group_idx*n_bins + ext_bin_idx
+        occupancy = np.bincount(flat_idx, minlength=n_groups*n_bins)
+        counts = _accumulate_by_bin(bst.data, flat_idx, n_groups*n_bins)
+
+        occupancy = occupancy.reshape((n_groups,) + self._shape)
+        counts = counts.reshape((bst.n_units, n_groups) + self._shape)
+        return occupancy, np.swapaxes(counts, 0, 1)
+
+    def _epoch_statistics(self, bst, extern):
+        """Occupancy and spike counts of every epoch of bst; see
+        _grouped_statistics."""
+        epoch_idx = np.repeat(np.arange(bst.n_epochs), bst.lengths)
+        return self._grouped_statistics(bst, extern, epoch_idx, bst.n_epochs)
+
+    def _conditional(self, bst, extern, conditions, categories=None):
+        """Accumulators of the time bins of bst in every condition, and of
+        all time bins, computed in a single pass.
+
+        Returns
+        -------
+        accumulators : dict
+            Accumulator of every condition (category).
+        total : accumulator
+            Accumulator of all time bins of bst, including those that are
+            in none of the conditions.
+        """
+        categories, group_idx = _condition_idx(bst, conditions, categories)
+        n_groups = len(categories) + 1 # the last group is 'no condition'
+        occupancy, counts = self._grouped_statistics(bst, extern, group_idx, n_groups)
+
+        def from_statistics(occupancy, counts):
+            return self._from_statistics(occupancy, counts, ds=bst.ds,
+                                         unit_ids=bst.unit_ids,
+                                         unit_labels=bst.unit_labels,
+                                         unit_tags=bst.unit_tags)
+
+        accumulators = {category: from_statistics(occupancy[ii], counts[ii])
+                        for ii, category in enumerate(categories)}
+        total = from_statistics(occupancy.sum(axis=0), counts.sum(axis=0))
+
+        return accumulators, total
+
+    def _from_statistics(self, occupancy, counts, *, ds, unit_ids,
+                         unit_labels=None, unit_tags=None):
+        """Return a copy of the accumulator holding the given statistics."""
+        out = copy.copy(self)
+        out._init_units(unit_ids, unit_labels, unit_tags)
+        out._occupancy = occupancy
+        out._counts = counts
+        out._ds = ds
+        return out
+
+    def merge(self, other, *, inplace=False):
+        """Merge the statistics accumulated by another accumulator, e.g.,
+        from another session or worker.
+
+        Returns
+        -------
+        out : accumulator
+            Accumulator with the statistics of both accumulators.
+        """
+        if not isinstance(other, type(self)):
+            raise TypeError("can only merge {} objects!".format(self.__class__.__name__))
+        if not self._has_same_bins(other):
+            raise ValueError("accumulators must have identical external correlate bins!")
+
+        if not inplace:
+            out = copy.deepcopy(self)
+        else:
+            out = self
+
+        if other._ds is None:
+            return out
+        if out._ds is None:
+            out._ds = other._ds
+        elif not np.isclose(other._ds, out._ds):
+            raise ValueError("accumulators must have identical bin widths!")
+
+        if out._unit_ids is None:
+            out._init_units(other._unit_ids, other._unit_labels, other._unit_tags)
+        elif other.unit_ids != out.unit_ids:
+            raise ValueError("accumulators must have identical unit_ids!")
+
+        out._occupancy = out._occupancy + other._occupancy
+        out._counts = out._counts + other._counts
+
+        return out
+
+    def __add__(self, other):
+        return self.merge(other)
+
+    def _ratemap(self, *, minbgrate, min_duration):
+        """Ratemap (in Hz) of the accumulated statistics, computed exactly
+        as in the TuningCurve constructors."""
+        if self._ds is None:
+            raise ValueError("no data has been accumulated yet!")
+        if minbgrate is None:
+            minbgrate = 0.01 # Hz minimum background firing rate
+        if min_duration is None:
+            min_duration = 0
+
+        ratemap = self._counts / self._ds
+        # apply minimum observation duration
+        ratemap[:, self._occupancy*self._ds < min_duration] = 0
+        # normalize firing rate by occupancy
+        ratemap /= np.where(self._occupancy == 0, 1, self._occupancy)
+        # enforce minimum background firing rate
+        ratemap[ratemap < minbgrate] = minbgrate
+
+        return ratemap
+
+    def _finalize(self, tc, *, sigma, bw, minbgrate, min_duration):
+        tc._occupancy = self._occupancy.copy()
+        tc._min_duration = min_duration if min_duration is not None else 0
+        tc._minbgrate = minbgrate if minbgrate is not None else 0.01
+        tc._sigma = sigma
+        tc._bw = bw
+        if sigma is not None:
+            if sigma > 0:
+                tc.smooth(sigma=sigma, bw=bw, inplace=True)
+        return tc
+
+def _condition_idx(bst, conditions, categories=None):
+    """Return the categories, and the category index of every time bin of
+    bst (len(categories) for time bins that are in none of them).
+
+    conditions is either an array_like with the category of every time bin,
+    or a dict of {category: EpochArray}.
+    """
+    if isinstance(conditions, dict):
+        if categories is None:
+            categories = list(conditions)
+        group_idx = np.full(bst.n_bins, len(categories))
+        centers = bst.bin_centers
+        for ii, category in enumerate(categories):
+            epochs = conditions[category]
+            if epochs.isempty:
+                continue
+            epoch_idx = np.searchsorted(epochs.starts, centers, side='right') - 1
+            inside = (epoch_idx >= 0) & (centers < epochs.stops[np.maximum(epoch_idx, 0)])
+            group_idx[inside] = ii
+    else:
+        conditions = np.asarray(conditions)
+        if len(conditions) != bst.n_bins:
+            raise ValueError("conditions must have one entry per time bin of bst!")
+        if categories is None:
+            categories, group_idx = np.unique(conditions, return_inverse=True)
+            categories = categories.tolist()
+        else:
+            group_idx = np.full(bst.n_bins, len(categories))
+            for ii, category in enumerate(categories):
+                group_idx[conditions == category] = ii
+    return categories, group_idx
+
+def conditional_tuningcurves(*, bst, extern, conditions, n_extern, extmin=0,
+                             extmax=1, sigma=None, bw=None, minbgrate=None,
+                             min_duration=None, transform_func=None,
+                             combined=False):
+    """Tuning curves (1-dimensional) conditioned on a categorical variable,
+    such as running direction, context or trial type.
+
+    The occupancy and spike counts of all conditions are computed in a
+    single pass over bst, with one grouped accumulation.
+
+    Parameters
+    ----------
+    bst : BinnedSpikeTrainArray
+    extern : AnalogSignalArray
+    conditions : array_like or dict
+        Either the condition (category) of every time bin of bst, or a dict
+        of {condition: EpochArray}, in which case time bins in none of the
+        epochs are in no condition. Epochs of different conditions should
+        not overlap.
+    n_extern, extmin, extmax, sigma, bw, minbgrate, min_duration, transform_func :
+        As in TuningCurve1D.
+    combined : bool, optional
+        If True, also return the tuning curve of all time bins of bst.
+
+    Returns
+    -------
+    tuningcurves : dict
+        TuningCurve1D of every condition.
+    combined : TuningCurve1D
+        Only if combined is True.
+    """
+    acc = TuningCurve1DAccumulator(n_extern=n_extern, extmin=extmin,
+                                   extmax=extmax,
+                                   transform_func=transform_func)
+    accumulators, total = acc._conditional(bst, extern, conditions)
+    kwargs = dict(sigma=sigma, bw=bw, minbgrate=minbgrate,
+                  min_duration=min_duration)
+    tuningcurves = {category: accumulator.finalize(label=category, **kwargs)
+                    for category, accumulator in accumulators.items()}
+    if combined:
+        return tuningcurves, total.finalize(**kwargs)
+    return tuningcurves
+
+class TuningCurve1DAccumulator(_TuningCurveAccumulator):
+    """Incremental accumulator of 1-dimensional tuning curves.
+
+    Parameters
+    ----------
+    n_extern : int
+        Number of external correlate bins.
+    extmin, extmax : float, optional
+        Range of the external correlate. Default is [0, 1].
+    transform_func : callable, optional
+        transform_func(extern, at) maps extern into the values to be
+        binned. Default is the identity.
+    unit_ids, unit_labels, unit_tags : optional
+        Default is to take these from the first accumulated chunk.
+
+    Examples
+    --------
+    >>> acc = TuningCurve1DAccumulator(n_extern=50, extmin=0, extmax=100)
+    >>> for bst_chunk, pos_chunk in stream:
+    ...     acc.update(bst_chunk, pos_chunk)
+    >>> tc = acc.finalize(sigma=3)
+    """
+
+    def __init__(self, *, n_extern, extmin=0, extmax=1, transform_func=None,
+                 unit_ids=None, unit_labels=None, unit_tags=None):
+        self._bins = np.linspace(extmin, extmax, n_extern+1)
+        super().__init__(shape=(n_extern,), transform_func=transform_func,
+                         unit_ids=unit_ids, unit_labels=unit_labels,
+                         unit_tags=unit_tags)
+
+    @property
+    def bins(self):
+        """External correlate bins."""
+        return self._bins
+
+    @property
+    def n_bins(self):
+        """(int) Number of external correlates (bins)."""
+        return len(self.bins) - 1
+
+    def _has_same_bins(self, other):
+        return np.array_equal(self.bins, other.bins)
+
+    def _trans_func(self, extern, at):
+        """Default transform function to map extern into numerical bins"""
+
+        _, ext = extern.asarray(at=at)
+
+        return np.atleast_1d(ext)
+
+    def _ext_bin_idx(self, extern, at):
+        ext = self.trans_func(extern, at=at)
+
+        ext_bin_idx = np.digitize(ext, self.bins, right=True)
+        # make sure that all the events fit between extmin and extmax:
+        if ext_bin_idx.max() > self.n_bins:
+            raise ValueError("ext values greater than 'ext_max'")
+        if ext_bin_idx.min() == 0:
+            raise ValueError("ext values less than 'ext_min'")
+
+        return ext_bin_idx - 1
+
+    def finalize(self, *, sigma=None, bw=None, minbgrate=None,
+                 min_duration=None, label=None):
+        """Return the TuningCurve1D of the accumulated statistics.
+
+        The accumulator itself is unchanged, so that it can be finalized
+        again after further updates.
+
+        Parameters
+        ----------
+        sigma, bw, minbgrate, min_duration, label : optional
+            As in TuningCurve1D.
+
+        Returns
+        -------
+        tc : TuningCurve1D
+        """
+        ratemap = self._ratemap(minbgrate=minbgrate, min_duration=min_duration)
+        tc = TuningCurve1D(ratemap=ratemap, extmin=self.bins[0],
+                           extmax=self.bins[-1], unit_ids=self._unit_ids,
+                           unit_labels=self._unit_labels,
+                           unit_tags=self._unit_tags, label=label)
+        return self._finalize(tc, sigma=sigma, bw=bw, minbgrate=minbgrate,
+                              min_duration=min_duration)
+
+class TuningCurve2DAccumulator(_TuningCurveAccumulator):
+    """Incremental accumulator of 2-dimensional tuning curves.
+
+    Parameters
+    ----------
+    ext_nx, ext_ny : int
+        Number of external correlate bins along x and y.
+    ext_xmin, ext_xmax, ext_ymin, ext_ymax : float, optional
+        Range of the external correlate. Default is [0, 1] along both x
+        and y.
+    transform_func : callable, optional
+        transform_func(extern, at) maps extern into the (x, y) values to be
+        binned. Default takes the first two signals of extern.
+    unit_ids, unit_labels, unit_tags : optional
+        Default is to take these from the first accumulated chunk.
+    """
+
+    def __init__(self, *, ext_nx, ext_ny, ext_xmin=0, ext_xmax=1, ext_ymin=0,
+                 ext_ymax=1, transform_func=None, unit_ids=None,
+                 unit_labels=None, unit_tags=None):
+        self._xbins = np.linspace(ext_xmin, ext_xmax, ext_nx+1)
+        self._ybins = np.linspace(ext_ymin, ext_ymax, ext_ny+1)
+        super().__init__(shape=(ext_nx, ext_ny), transform_func=transform_func,
+                         unit_ids=unit_ids, unit_labels=unit_labels,
+                         unit_tags=unit_tags)
+
+    @property
+    def xbins(self):
+        """External correlate bins."""
+        return self._xbins
+
+    @property
+    def ybins(self):
+        """External correlate bins."""
+        return self._ybins
+
+    @property
+    def n_xbins(self):
+        """(int) Number of external correlates (bins)."""
+        return len(self.xbins) - 1
+
+    @property
+    def n_ybins(self):
+        """(int) Number of external correlates (bins)."""
+        return len(self.ybins) - 1
+
+    def _has_same_bins(self, other):
+        return (np.array_equal(self.xbins, other.xbins)
+                and np.array_equal(self.ybins, other.ybins))
+
+    def _trans_func(self, extern, at):
+        """Default transform function to map extern into numerical bins.
+
+        Assumes first signal is x-dim, second is y-dim.
+        """
+
+        _, ext = extern.asarray(at=at)
+        x, y = ext[0,:], ext[1,:]
+
+        return np.atleast_1d(x), np.atleast_1d(y)
+
+    def _ext_bin_idx(self, extern, at):
+        x, y = self.trans_func(extern, at=at)
+
+        ext_bin_idx_x = np.digitize(x, self.xbins, right=True)
+        ext_bin_idx_y = np.digitize(y, self.ybins, right=True)
+
+        # make sure that all the events fit between extmin and extmax:
+        if ext_bin_idx_x.max() > self.n_xbins:
+            raise ValueError("ext values greater than 'ext_xmax'")
+        if ext_bin_idx_x.min() == 0:
+            raise ValueError("ext values less than 'ext_xmin'")
+        if ext_bin_idx_y.max() > self.n_ybins:
+            raise ValueError("ext values greater than 'ext_ymax'")
+        if ext_bin_idx_y.min() == 0:
+            raise ValueError("ext values less than 'ext_ymin'")
+
+        return np.ravel_multi_index((ext_bin_idx_x - 1, ext_bin_idx_y - 1),
+                                    (self.n_xbins, self.n_ybins))
+
+    def finalize(self, *, sigma=None, bw=None, minbgrate=None,
+                 min_duration=None, label=None):
+        """Return the TuningCurve2D of the accumulated statistics.
+
+        The accumulator itself is unchanged, so that it can be finalized
+        again after further updates.
+
+        Parameters
+        ----------
+        sigma, bw, minbgrate, min_duration, label : optional
+            As in TuningCurve2D.
+
+        Returns
+        -------
+        tc : TuningCurve2D
+        """
+        ratemap = self._ratemap(minbgrate=minbgrate, min_duration=min_duration)
+        tc = TuningCurve2D(ratemap=ratemap, ext_xmin=self.xbins[0],
+                           ext_xmax=self.xbins[-1], ext_ymin=self.ybins[0],
+                           ext_ymax=self.ybins[-1], unit_ids=self._unit_ids,
+                           unit_labels=self._unit_labels,
+                           unit_tags=self._unit_tags, label=label)
+        return self._finalize(tc, sigma=sigma, bw=bw, minbgrate=minbgrate,
+                              min_duration=min_duration)
+
+########################################################################
+# class TuningCurveND
+########################################################################
+class TuningCurveND:
+    """Tuning curves (N-dimensional) of multiple units.
+
+    Occupancy, spike counts and firing rates are only stored for visited
+    external correlate bins (in coordinate format, as raveled bin indices),
+    since high-dimensional occupancy (e.g., position x speed x head
+    direction) is mostly empty. Unvisited bins have the minimum background
+    firing rate.
+
+    Smoothing is a normalized convolution: the spike counts and occupancy
+    are smoothed separately with a separable Gaussian kernel along the
+    chosen axes, over the visited bins only, and then divided, so that
+    unvisited bins do not bleed into the estimate.
+
+    Parameters
+    ----------
+    bst : BinnedSpikeTrainArray
+    extern : AnalogSignalArray
+        External correlates, with one signal per dimension (unless a
+        transform_func is given).
+    n_extern : sequence of int
+        Number of bins along every dimension.
+    extmin, extmax : sequence of float
+        Range of the external correlates along every dimension.
+    bins : sequence of array_like, optional
+        Bin edges along every dimension, instead of n_extern, extmin and
+        extmax.
+    transform_func : callable, optional
+        transform_func(extern, at) maps extern into an array of shape
+        (n_dims, n_time) of values to be binned. Default takes all signals
+        of extern.
+    sigma : float or sequence of float, optional
+        Standard deviation of the Gaussian smoothing kernel (in units of
+        extern), for all axes, or per dimension (0 or None for none).
+        Default is no smoothing.
+    bw : float, optional
+        Kernel bandwidth, in standard deviations. Default is 4.
+    axes : sequence of int, optional
+        Axes to smooth along, when sigma is a scalar. Default is all axes.
+    minbgrate : float, optional
+        Minimum background firing rate (in Hz). Default is 0.01.
+    min_duration : float, optional
+        Minimum occupancy (in seconds) for a bin to be considered visited.
+        Default is 0.
+    unit_ids, unit_labels, unit_tags, label : optional
+        Default is to take the unit information from bst.
+    """
+
+    __attributes__ = ["_ratemap", "_occupancy", "_counts", "_visited",
+                      "_bins", "_ds", "_unit_ids", "_unit_labels",
+                      "_unit_tags", "_label"]
+
+    def __init__(self, *, bst=None, extern=None, n_extern=None, extmin=None,
+                 extmax=None, bins=None, transform_func=None, sigma=None,
+                 bw=None, axes=None, minbgrate=None, min_duration=None,
+                 extlabels=None, unit_ids=None, unit_labels=None,
+                 unit_tags=None, label=None, empty=False):
+
+        # if an empty object is requested, return it:
+        if empty:
+            for attr in self.__attributes__:
+                exec("self." + attr + " = None")
+            return
+
+        assert bst is not None, "bst must be specified!"
+        assert extern is not None, "extern must be specified!"
+
+        if bins is None:
+            if n_extern is None or extmin is None or extmax is None:
+                raise ValueError("either bins, or n_extern, extmin and extmax must be specified!")
+            bins = [np.linspace(lo, hi, n+1) for n, lo, hi
+                    in zip(n_extern, extmin, extmax)]
+        self._bins = [np.asarray(edges, dtype=float) for edges in bins]
+        self._extlabels = extlabels
+
+        if minbgrate is None:
+            minbgrate = 0.01 # Hz minimum background firing rate
+        if min_duration is None:
+            min_duration = 0
+        self._minbgrate = minbgrate
+        self._min_duration = min_duration
+
+        self._unit_ids = list(bst.unit_ids) if unit_ids is None else list(unit_ids)
+        self._unit_labels = bst.unit_labels if unit_labels is None else unit_labels
+        self._unit_tags = bst.unit_tags if unit_tags is None else unit_tags
+        self.label = label
+
+        if transform_func is None:
+            self.trans_func = self._trans_func
+        else:
+            self.trans_func = transform_func
+
+        self._ds = bst.ds
+        self._compute_statistics(bst, extern)
+        self.smooth(sigma=sigma, bw=bw, axes=axes, inplace=True)
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        if self.isempty:
+            return "<empty TuningCurveND" + address_str + ">"
+        shapestr = " with shape %s" % (self.shape,)
+        return "<TuningCurveND%s>%s, %s of %s bins visited" % (
+            address_str, shapestr, self.n_visited, self.n_bins)
+
+    def _trans_func(self, extern, at):
+        """Default transform function to map extern into numerical bins;
+        every signal of extern is one dimension."""
+
+        _, ext = extern.asarray(at=at)
+
+        return np.atleast_2d(ext)
+
+    def _ext_bin_idx(self, extern, at):
+        """Raveled external correlate bin index of every time bin."""
+        ext = self.trans_func(extern, at=at)
+        if len(ext) != self.n_dims:
+            raise ValueError("extern has {} dimensions, but {} sets of bins were given!".format(len(ext), self.n_dims))
+
+        multi_idx = []
+        for dim, (values, edges) in enumerate(zip(ext, self.bins)):
+            ext_bin_idx = np.digitize(values, edges, right=True)
+            # make sure that all the events fit between extmin and extmax:
+            if ext_bin_idx.max() > len(edges) - 1:
+                raise ValueError("ext values greater than 'extmax' along axis {}".format(dim))
+            if ext_bin_idx.min() == 0:
+                raise ValueError("ext values less than 'extmin' along axis {}".format(dim))
+            multi_idx.append(ext_bin_idx - 1)
+
+        return np.ravel_multi_index(multi_idx, self.ext_shape)
+
+    def _compute_statistics(self, bst, extern):
+        """Compute the occupancy and spike counts of all visited bins."""
+        extern = _extend_extern_to(extern, bst._bin_centers)
+        ext_bin_idx = self._ext_bin_idx(extern, at=bst.bin_centers)
+
+        visited, inverse = np.unique(ext_bin_idx, return_inverse=True)
+        occupancy = np.bincount(inverse, minlength=len(visited))
+        counts = _accumulate_by_bin(bst.data, inverse, len(visited))
+
+        # bins with too little occupancy are considered unvisited:
+        valid = occupancy*self._ds >= self._min_duration
+        self._visited = visited[valid]
+        self._occupancy = occupancy[valid]
+        self._counts = counts[:, valid]
+
+    def smooth(self, *, sigma=None, bw=None, axes=None, inplace=False):
+        """Smooth the tuning curves by normalized convolution with a
+        separable Gaussian kernel.
+
+        The firing rates are always recomputed from the unsmoothed spike
+        counts and occupancy, so that smoothing does not compound.
+
+        Parameters
+        ----------
+        sigma : float or sequence of float, optional
+            Standard deviation of the kernel (in units of extern), for all
+            axes, or per dimension. Default is no smoothing.
+        bw : float, optional
+            Kernel bandwidth, in standard deviations. Default is 4.
+        axes : sequence of int, optional
+            Axes to smooth along, when sigma is a scalar. Default is all
+            axes.
+        inplace : bool, optional
+
+        Returns
+        -------
+        out : TuningCurveND
+        """
+        if bw is None:
+            bw = 4
+        if sigma is None:
+            sigma = 0
+        if np.isscalar(sigma):
+            if axes is None:
+                axes = range(self.n_dims)
+            sigmas = [sigma if axis in axes else 0 for axis in range(self.n_dims)]
+        else:
+            sigmas = [s if s is not None else 0 for s in sigma]
+            if len(sigmas) != self.n_dims:
+                raise ValueError("sigma must be a scalar, or have one value per dimension!")
+
+        if not inplace:
+            out = copy.deepcopy(self)
+        else:
+            out = self
+
+        counts = out._counts
+        occupancy = out._occupancy.astype(float)
+        for axis, sigma_ext in enumerate(sigmas):
+            if sigma_ext > 0:
+                width = (out.bins[axis][-1] - out.bins[axis][0])/out.ext_shape[axis]
+                kernel = _sparse_gaussian_kernel(out._visited, out.ext_shape,
+                                                 axis=axis,
+                                                 sigma=sigma_ext/width,
+                                                 truncate=bw)
+                counts = np.asarray((kernel @ counts.T).T)
+                occupancy = kernel @ occupancy
+
+        ratemap = counts / (occupancy*out._ds)
+        # enforce minimum background firing rate
+        ratemap[ratemap < out._minbgrate] = out._minbgrate
+        out._ratemap = ratemap
+        out._sigma = sigmas
+        out._bw = bw
+
+        return out
+
+    @property
+    def n_dims(self):
+        """(int) Number of dimensions of the external correlates."""
+        return len(self._bins)
+
+    @property
+    def bins(self):
+        """List of external correlate bin edges, one per dimension."""
+        return self._bins
+
+    @property
+    def bin_centers(self):
+        """List of external correlate bin centers, one per dimension."""
+        return [(edges[1:] + edges[:-1])/2 for edges in self.bins]
+
+    @property
+    def ext_shape(self):
+        """(tuple) Number of external correlate bins along every
+        dimension."""
+        return tuple(len(edges) - 1 for edges in self.bins)
+
+    @property
+    def n_bins(self):
+        """(int) Total number of external correlate bins."""
+        return int(np.prod(self.ext_shape))
+
+    @property
+    def n_visited(self):
+        """(int) Number of visited external correlate bins."""
+        return len(self._visited)
+
+    @property
+    def visited(self):
+        """Multi-indices (tuple of arrays, one per dimension) of the
+        visited external correlate bins."""
+        return np.unravel_index(self._visited, self.ext_shape)
+
+    @property
+    def occupancy(self):
+        """Dense occupancy (in number of time bins) with shape ext_shape."""
+        occupancy = np.zeros(self.n_bins)
+        occupancy[self._visited] = self._occupancy
+        return occupancy.reshape(self.ext_shape)
+
+    @property
+    def ratemap(self):
+        """Dense ratemap (in Hz) with shape (n_units,) + ext_shape."""
+        ratemap = np.full((self.n_units, self.n_bins), self._minbgrate, dtype=float)
+        ratemap[:, self._visited] = self._ratemap
+        return ratemap.reshape((self.n_units,) + self.ext_shape)
+
+    @property
+    def sparse_ratemap(self):
+        """Firing rates (in Hz) of the visited bins only, with shape
+        (n_units, n_visited); see visited for their multi-indices."""
+        return self._ratemap
+
+    @property
+    def n_units(self):
+        """(int) The number of units."""
+        try:
+            return len(self._unit_ids)
+        except TypeError: # when unit_ids is an integer
+            return 1
+        except AttributeError:
+            return 0
+
+    @property
+    def shape(self):
+        """(tuple) The shape of the (dense) TuningCurveND ratemap."""
+        return (self.n_units,) + self.ext_shape
+
+    @property
+    def isempty(self):
+        """(bool) True if TuningCurveND is empty"""
+        try:
+            return len(self._ratemap) == 0
+        except TypeError: #TypeError should happen if ratemap = None
+            return True
+
+    def __len__(self):
+        return self.n_units
+
+    @property
+    def unit_ids(self):
+        """Unit IDs contained in the SpikeTrain."""
+        return list(self._unit_ids)
+
+    @property
+    def unit_labels(self):
+        """Labels corresponding to units contained in the SpikeTrain."""
+        if self._unit_labels is None:
+            warnings.warn("unit labels have not yet been specified")
+        return self._unit_labels
+
+    @property
+    def unit_tags(self):
+        """Tags corresponding to units contained in the SpikeTrain"""
+        if self._unit_tags is None:
+            warnings.warn("unit tags have not yet been specified")
+        return self._unit_tags
+
+    @property
+    def label(self):
+        """Label pertaining to the source of the spike train."""
+        if self._label is None:
+            warnings.warn("label has not yet been specified")
+        return self._label
+
+    @label.setter
+    def label(self, val):
+        if val is not None:
+            try:  # cast to str:
+                label = str(val)
+            except TypeError:
+                raise TypeError("cannot convert label to string")
+        else:
+            label = val
+        self._label = label
+
+    def _unit_subset_by_idx(self, idx):
+        out = copy.copy(self)
+        out._ratemap = self._ratemap[idx]
+        out._counts = self._counts[idx]
+        out._unit_ids = (np.asanyarray(self._unit_ids)[idx]).tolist()
+        if self._unit_labels is not None:
+            out._unit_labels = (np.asanyarray(self._unit_labels)[idx]).tolist()
+        return out
+
+    def __getitem__(self, idx):
+        """TuningCurveND unit index access."""
+        if self.isempty:
+            return self
+        if isinstance(idx, int):
+            idx = [idx]
+        try:
+            return self._unit_subset_by_idx(idx)
+        except Exception:
+            raise TypeError(
+                'unsupported subsctipting type {}'.format(type(idx)))
+
+    def _unit_subset(self, unit_list):
+        """Return a TuningCurveND restricted to a subset of units.
+
+        Parameters
+        ----------
+        unit_list : array-like
+            Array or list of unit_ids.
+        """
+        unit_subset_ids = []
+        for unit in unit_list:
+            try:
+                id = self.unit_ids.index(unit)
+            except ValueError:
+                warnings.warn("unit_id " + str(unit) + " not found in TuningCurveND; ignoring")
+                pass
+            else:
+                unit_subset_ids.append(id)
+
+        if len(unit_subset_ids) == 0:
+            warnings.warn("no units remaining in requested unit subset")
+            return TuningCurveND(empty=True)
+
+        return self._unit_subset_by_idx(unit_subset_ids)
+
+    def reorder_units_by_ids(self, neworder, *, inplace=False):
+        """Reorder units according to a specified order.
+
+        neworder must be list-like, of size (n_units,) and in terms of
+        unit_ids
+
+        Return
+        ------
+        out : reordered TuningCurveND
+        """
+        neworder = [self.unit_ids.index(x) for x in neworder]
+        out = self._unit_subset_by_idx(neworder)
+        if inplace:
+            self.__dict__ = out.__dict__
+            return self
+        return copy.deepcopy(out)
+
+def _sparse_gaussian_kernel(visited, ext_shape, *, axis, sigma, truncate):
+    """Sparse matrix of Gaussian weights (along axis) between the visited
+    (raveled) bins, with shape (n_visited, n_visited).
+
+    Parameters
+    ----------
+    visited : array
+        Sorted, raveled indices of the visited bins.
+    ext_shape : tuple
+        Shape of the (dense) external correlate bins.
+    axis : int
+    sigma : float
+        Standard deviation, in bins.
+    truncate : float
+        Kernel bandwidth, in standard deviations.
+    """
+    n_visited = len(visited)
+    coords = np.unravel_index(visited, ext_shape)[axis]
+    stride = int(np.prod(ext_shape[axis+1:]))
+    radius = int(truncate*sigma + 0.5)
+
+    rows, cols, weights = [], [], []
+    for offset in range(-radius, radius+1):
+        # visited bins whose neighbour at offset is within range...
+        source = np.flatnonzero((coords + offset >= 0)
+                                & (coords + offset < ext_shape[axis]))
+        neighbours = visited[source] + offset*stride
+        # ...and visited too:
+        pos = np.minimum(np.searchsorted(visited, neighbours), n_visited - 1)
+        found = visited[pos] == neighbours
+        rows.append(source[found])
+        cols.append(pos[found])
+        weights.append(np.full(found.sum(), np.exp(-0.5*(offset/sigma)**2)))
+
+    return scipy.sparse.csr_matrix((np.concatenate(weights),
+                                    (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(n_visited, n_visited))
@@ -228,8 +228,8 @@ class RinglikeTrajectory(_analogsignalarray.AnalogSignalArray):
         first_timestamps_per_epoch_idx[empty_epoch_ids] = 0
         last_timestamps_per_epoch_idx = np.cumsum(lengths)-1
         last_timestamps_per_epoch_idx[empty_epoch_ids] = 0
-        first_timestamps_per_epoch = self.time[first_timestamps_per_epoch_idx]
-        last_timestamps_per_epoch = self.time[last_timestamps_per_epoch_idx]
+        first_timestamps_per_epoch = self._time[first_timestamps_per_epoch_idx]
+        last_timestamps_per_epoch = self._time[last_timestamps_per_epoch_idx]
 
         boundary_times = []
         boundary_vals = []
@@ -59,7 +59,7 @@ def excise_disk(pos, midpoint, radius, radius_pct=None):
     dist_to_midpoint = np.sqrt(((pos.ydata.T - midpoint)**2).sum(axis=1))
     indisk_idx = np.argwhere(dist_to_midpoint > radius_pct*radius).squeeze()
 
-    local_pos = _position.PositionArray(pos.ydata[:,indisk_idx], timestamps=pos.time[indisk_idx])
+    local_pos = _position.PositionArray(pos.ydata[:,indisk_idx], timestamps=pos._time[indisk_idx])
 
     return local_pos
 
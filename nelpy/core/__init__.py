@@ -9,8 +9,8 @@ __all__ = ['EpochArray',
            'AnalogSignalArray',
            'SpikeTrainArray',
            'BinnedSpikeTrainArray',
-           'EventArray']
-        #    'ValueEventArray',
+           'EventArray',
+           'ValueEventArray']
         #    'StatefulEventArray']
 
 """ Auxiliary data objects """
@@ -19,7 +19,7 @@ from ._epocharray import EpochArray
 """ Data container objects """
 from ._analogsignalarray import AnalogSignalArray
 from ._spiketrain import SpikeTrainArray, BinnedSpikeTrainArray
-from ._eventarray import EventArray #, ValueEventArray, StatefulEventArray
+from ._eventarray import EventArray, ValueEventArray #, StatefulEventArray
 
 """ Data linking objects """
 # from ._xxx import SignalGroup
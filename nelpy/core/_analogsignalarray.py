@@ -15,6 +15,8 @@ from .. import core
 from .. import auxiliary
 from .. import utils
 from .. import version
+from ..utils_ import copying
+from ..utils_ import cache
 
 # Force warnings.warn() to omit the source code line in the message
 formatwarning_orig = warnings.formatwarning
@@ -101,7 +103,7 @@ class TimestampSlicer(object):
 
     def _timestamp_generator(self, epoch_indices):
         for start, stop in epoch_indices:
-            yield self._parent._time[start: stop]
+            yield np.asarray(self._parent._time[start: stop])
 
     def __getitem__(self, idx):
         epochslice, signalslice = self._parent._epochsignalslicer[idx]
@@ -111,14 +113,14 @@ class TimestampSlicer(object):
 
         if len(epoch_indices) < 2:
             start, stop = epoch_indices[0]
-            return self._parent._time[start: stop]
+            return np.asarray(self._parent._time[start: stop])
         else:
             return self._timestamp_generator(epoch_indices)
 
     def plot_generator(self):
         epoch_indices = self._parent._data_epoch_indices()
         for start, stop in epoch_indices:
-            yield self._parent._time[start: stop]
+            yield np.asarray(self._parent._time[start: stop])
 
     def __iter__(self):
         self._index = 0
@@ -136,7 +138,360 @@ class TimestampSlicer(object):
 
         self._index +=1
 
-        return self._parent._time[start: stop]
+        return np.asarray(self._parent._time[start: stop])
+
+class MinMaxPyramid(object):
+    """Multi-resolution min/max decimation of an AnalogSignalArray.
+
+    Level 0 is the data itself, and every subsequent level summarizes
+    blocks of `base` consecutive entries of the previous level by their
+    minimum and maximum. Levels are computed within each epoch and for
+    each signal separately, so that envelopes never straddle epoch
+    boundaries, and narrow peaks (spikes, ripples) are never aliased away
+    the way they are when interpolating at regularly spaced points.
+
+    The pyramid is built once, after which retrieving an envelope at any
+    resolution only requires slicing into the appropriate level.
+
+    Parameters
+    ----------
+    parent : AnalogSignalArray
+    base : int, optional
+        Decimation factor between consecutive levels. Default is 4.
+    """
+
+    def __init__(self, parent, *, base=4):
+        if base < 2:
+            raise ValueError("base must be an integer >= 2")
+        self._base = int(base)
+        self._levels = []  # per epoch: list of (time, mins, maxs) per level
+        for start, stop in parent._data_epoch_indices():
+            time = np.asarray(parent._time[start:stop])
+            ydata = parent._ydata[:, start:stop]
+            levels = [(time, ydata, ydata)]
+            while levels[-1][0].size > self._base:
+                time, mins, maxs = levels[-1]
+                block_starts = np.arange(0, time.size, self._base)
+                levels.append((time[block_starts],
+                               np.minimum.reduceat(mins, block_starts, axis=1),
+                               np.maximum.reduceat(maxs, block_starts, axis=1)))
+            self._levels.append(levels)
+
+    @property
+    def base(self):
+        """(int) Decimation factor between consecutive levels."""
+        return self._base
+
+    @property
+    def n_levels(self):
+        """(int) Number of levels of the deepest epoch, including level 0."""
+        return max([len(levels) for levels in self._levels] + [0])
+
+    def envelope(self, n_points, *, start=None, stop=None):
+        """Return the min/max envelope at the resolution matching n_points.
+
+        The coarsest level with at least n_points blocks inside [start, stop]
+        is used, so that every output point summarizes as many samples as
+        possible without dropping below the requested resolution.
+
+        Parameters
+        ----------
+        n_points : int
+            Desired (minimum) number of envelope points in [start, stop],
+            typically the pixel width of the axis being drawn on.
+        start : float, optional
+            Left boundary of the requested time window. Default is the
+            start of the data.
+        stop : float, optional
+            Right boundary of the requested time window. Default is the
+            end of the data.
+
+        Returns
+        -------
+        envelopes : list of (xvals, ymin, ymax)
+            One namedtuple per non-empty epoch overlapping [start, stop],
+            where ymin and ymax have shape (n_signals, len(xvals)). One
+            additional block is included on either side of the window so
+            that lines continue to the axis edges.
+        """
+        MinMaxEnvelope = namedtuple('MinMaxEnvelope', ['xvals', 'ymin', 'ymax'])
+
+        if start is None:
+            start = -np.inf
+        if stop is None:
+            stop = np.inf
+
+        # count the number of samples in view, to select the level:
+        windows = []
+        n_samples = 0
+        for levels in self._levels:
+            time = levels[0][0]
+            frm, to = np.searchsorted(time, (start, stop))
+            windows.append((frm, to))
+            n_samples += to - frm
+        if n_samples == 0:
+            return []
+
+        n_points = max(int(n_points), 1)
+        level = int(np.floor(np.log(max(n_samples / n_points, 1)) / np.log(self._base)))
+
+        envelopes = []
+        for levels, (frm, to) in zip(self._levels, windows):
+            if to == frm:
+                continue
+            lvl = min(level, len(levels) - 1)
+            blocksize = self._base**lvl
+            time, mins, maxs = levels[lvl]
+            frm = max(frm // blocksize - 1, 0)
+            to = min(-(-to // blocksize) + 1, time.size)
+            envelopes.append(MinMaxEnvelope(xvals=time[frm:to],
+                                            ymin=mins[:, frm:to],
+                                            ymax=maxs[:, frm:to]))
+        return envelopes
+
+class RegularlySampledTime(object):
+    """Compact representation of regularly sampled timestamps.
+
+    Timestamps are stored as runs of regularly sampled data, each described
+    by its first timestamp t0 and its number of samples, with a common
+    sampling rate fs, so that timestamp k of run r is t0[r] + k/fs. Runs are
+    sorted and do not overlap.
+
+    The object behaves like a sorted, one dimensional array of timestamps
+    for indexing, slicing and searchsorted, all of which are computed by
+    index arithmetic. Timestamps are only materialized on demand, e.g.,
+    by np.asarray().
+
+    Parameters
+    ----------
+    t0 : array_like
+        First timestamp of each run.
+    n_samples : array_like
+        Number of samples in each run.
+    fs : float
+        Sampling rate in Hz.
+    """
+
+    def __init__(self, t0, n_samples, fs):
+        t0 = np.atleast_1d(np.asarray(t0, dtype=float))
+        n_samples = np.atleast_1d(np.asarray(n_samples, dtype=int))
+        nonempty = n_samples > 0
+        self._t0 = t0[nonempty]
+        self._n_samples = n_samples[nonempty]
+        self._fs = float(fs)
+        self._offsets = np.insert(np.cumsum(self._n_samples), 0, 0)
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        return "<RegularlySampledTime%s: %d samples in %d runs at %s Hz>" % (
+            address_str, len(self), self.n_runs, self._fs)
+
+    @property
+    def t0(self):
+        """(np.array) First timestamp of each run."""
+        return self._t0
+
+    @property
+    def n_samples(self):
+        """(np.array) Number of samples in each run."""
+        return self._n_samples
+
+    @property
+    def fs(self):
+        """(float) Sampling rate in Hz."""
+        return self._fs
+
+    @property
+    def n_runs(self):
+        """(int) Number of runs."""
+        return len(self._t0)
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    @property
+    def size(self):
+        return len(self)
+
+    @property
+    def ndim(self):
+        return 1
+
+    @property
+    def dtype(self):
+        return np.dtype(float)
+
+    @property
+    def nbytes(self):
+        """Number of bytes used by the compact representation."""
+        return self._t0.nbytes + self._n_samples.nbytes + self._offsets.nbytes
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+    def __array__(self, dtype=None):
+        offsets = np.repeat(self._offsets[:-1], self._n_samples)
+        time = np.repeat(self._t0, self._n_samples) + (np.arange(len(self)) - offsets) / self._fs
+        if dtype is not None:
+            time = time.astype(dtype)
+        return time
+
+    def _values(self, idx):
+        """Timestamps at (non-negative, in bounds) sample indices idx."""
+        run = np.searchsorted(self._offsets, idx, side='right') - 1
+        return self._t0[run] + (idx - self._offsets[run]) / self._fs
+
+    def __getitem__(self, key):
+        n_samples = len(self)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(n_samples)
+            if step == 1:
+                return self.take_ranges([start], [max(start, stop)])
+            key = np.arange(start, stop, step)
+        if isinstance(key, numbers.Integral):
+            if key < 0:
+                key += n_samples
+            if not 0 <= key < n_samples:
+                raise IndexError("index {} is out of bounds for size {}".format(key, n_samples))
+            return self._values(key)
+        key = np.asarray(key)
+        if key.dtype == bool:
+            if key.shape != (n_samples,):
+                raise IndexError("boolean index does not match the number of samples")
+            key = np.flatnonzero(key)
+        key = np.where(key < 0, key + n_samples, key)
+        if np.any((key < 0) | (key >= n_samples)):
+            raise IndexError("index out of bounds for size {}".format(n_samples))
+        return self._values(key)
+
+    def take_ranges(self, starts, stops):
+        """Return the timestamps within the sample index ranges
+        [starts[i], stops[i]), concatenated, as a new RegularlySampledTime."""
+        starts = np.atleast_1d(np.asarray(starts, dtype=int))
+        stops = np.atleast_1d(np.asarray(stops, dtype=int))
+        nonempty = stops > starts
+        starts, stops = starts[nonempty], stops[nonempty]
+        if starts.size == 0:
+            return RegularlySampledTime([], [], self._fs)
+        # each range may span several runs; split it into one piece per run:
+        first_run = np.searchsorted(self._offsets, starts, side='right') - 1
+        last_run = np.searchsorted(self._offsets, stops - 1, side='right') - 1
+        n_pieces = last_run - first_run + 1
+        piece_range = np.repeat(np.arange(len(starts)), n_pieces)
+        piece_offsets = np.insert(np.cumsum(n_pieces), 0, 0)[:-1]
+        run = first_run[piece_range] + np.arange(n_pieces.sum()) - np.repeat(piece_offsets, n_pieces)
+        piece_start = np.maximum(starts[piece_range], self._offsets[run])
+        piece_stop = np.minimum(stops[piece_range], self._offsets[run+1])
+        t0 = self._t0[run] + (piece_start - self._offsets[run]) / self._fs
+        return RegularlySampledTime(t0, piece_stop - piece_start, self._fs)
+
+    def insert(self, locs, values):
+        """Return a new RegularlySampledTime with single-sample runs at
+        times values inserted before sample indices locs (cf. np.insert)."""
+        locs = np.atleast_1d(np.asarray(locs, dtype=int))
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        cuts = np.union1d(self._offsets, locs)
+        piece_start, piece_stop = cuts[:-1], cuts[1:]
+        run = np.searchsorted(self._offsets, piece_start, side='right') - 1
+        run = np.clip(run, 0, max(self.n_runs - 1, 0))
+        if self.n_runs:
+            piece_t0 = self._t0[run] + (piece_start - self._offsets[run]) / self._fs
+        else:
+            piece_t0 = np.zeros(len(piece_start))
+        # inserted samples go before the piece that starts at the same index:
+        keys = np.concatenate((2*locs, 2*piece_start + 1))
+        order = np.argsort(keys, kind='mergesort')
+        t0 = np.concatenate((values, piece_t0))[order]
+        n_samples = np.concatenate((np.ones(len(locs), dtype=int), piece_stop - piece_start))[order]
+        return RegularlySampledTime(t0, n_samples, self._fs)
+
+    def searchsorted(self, v, side='left', sorter=None):
+        """Find the sample indices where elements of v should be inserted to
+        maintain order (cf. np.searchsorted), using index arithmetic."""
+        v = np.asarray(v, dtype=float)
+        if self.n_runs == 0:
+            return np.zeros(v.shape, dtype=int)
+        run = np.searchsorted(self._t0, v, side='right') - 1
+        before = run < 0
+        run = np.clip(run, 0, None)
+        t0 = self._t0[run]
+        n_samples = self._n_samples[run]
+        pos = (v - t0) * self._fs
+        if side == 'left':
+            k = np.ceil(pos)
+        else:
+            k = np.floor(pos) + 1
+        k = np.clip(k, 0, n_samples).astype(int)
+        # correct for floating point round-off, so that the result matches
+        # np.searchsorted on the materialized timestamps:
+        if side == 'left':
+            k = k - ((k > 0) & (t0 + (k-1) / self._fs >= v))
+            k = k + ((k < n_samples) & (t0 + k / self._fs < v))
+        else:
+            k = k - ((k > 0) & (t0 + (k-1) / self._fs > v))
+            k = k + ((k < n_samples) & (t0 + k / self._fs <= v))
+        out = self._offsets[run] + k
+        return np.where(before, 0, out)
+
+class LinearInterpolator(object):
+    """Linear interpolation of all signals at once.
+
+    This is a light-weight alternative to scipy.interpolate.interp1d with
+    kind='linear', which locates the requested points once (using
+    np.searchsorted) and then performs a vectorized linear interpolation
+    across all signals. A single signal is interpolated with np.interp
+    directly.
+
+    Parameters
+    ----------
+    time : array of shape (n_samples,)
+        Sorted sample times.
+    yvals : array of shape (n_signals, n_samples)
+        Sample values.
+    fill_value : scalar, optional
+        Value returned for points outside of [time[0], time[-1]]. Default
+        is np.nan.
+    """
+
+    def __init__(self, time, yvals, *, fill_value=np.nan):
+        if isinstance(time, RegularlySampledTime):
+            self.x = time # searchsorted and indexing use index arithmetic
+        else:
+            self.x = np.asarray(time, dtype=float)
+        self.y = np.atleast_2d(yvals)
+        self.fill_value = fill_value
+
+    def __call__(self, at):
+        at = np.asarray(at, dtype=float)
+        shape = at.shape
+        at = at.ravel()
+        n_signals, n_samples = self.y.shape
+
+        out_of_bounds = (at < self.x[0]) | (at > self.x[-1])
+
+        if n_samples < 2:
+            out = np.repeat(self.y, at.size, axis=1).astype(np.result_type(self.y, self.fill_value))
+        elif n_signals == 1 and not np.iscomplexobj(self.y) \
+                and isinstance(self.x, np.ndarray):
+            out = np.interp(at, self.x, self.y[0], left=self.fill_value, right=self.fill_value)
+            out = np.atleast_2d(out)
+        else:
+            idx = np.searchsorted(self.x, at, side='right') - 1
+            np.clip(idx, 0, n_samples - 2, out=idx)
+            x0 = self.x[idx]
+            frac = (at - x0) / (self.x[idx+1] - x0)
+            y0 = self.y[:, idx]
+            out = y0 + frac*(self.y[:, idx+1] - y0)
+
+        if np.any(out_of_bounds):
+            out = out.astype(np.result_type(out, self.fill_value), copy=False)
+            out[:, out_of_bounds] = self.fill_value
+
+        return out.reshape((n_signals,) + shape)
 
 def asa_init_wrapper(func):
     """Decorator that helps figure out timestamps, fs, and sample numbers"""
@@ -210,8 +565,9 @@ def asa_init_wrapper(func):
         else:
             time = kwargs.get('timestamps', None)
         if time is None:
-            time = np.linspace(0, ydata.shape[1]/fs, ydata.shape[1]+1)
-            time = time[:-1]
+            # regularly sampled data starting at t=0; timestamps are only
+            # materialized on demand:
+            time = RegularlySampledTime(0, ydata.shape[1], fs)
         else:
             if re_estimate_fs:
                 warnings.warn('fs was not specified, so we try to estimate it from the data...')
@@ -224,7 +580,9 @@ def asa_init_wrapper(func):
 
         kwargs['fs'] = fs
         kwargs['ydata'] = ydata
-        kwargs['timestamps'] = np.squeeze(time)
+        if not isinstance(time, RegularlySampledTime):
+            time = np.squeeze(time)
+        kwargs['timestamps'] = time
 
         func(args[0], **kwargs)
         return
@@ -347,14 +705,17 @@ class AnalogSignalArray:
         # Note: if both time and ydata are given and dimensionality does not
         # match, then TypeError!
 
-        time = np.squeeze(timestamps).astype(float)
-        if(time.shape[0] != ydata.shape[1]):
+        if isinstance(timestamps, RegularlySampledTime):
+            time = timestamps
+        else:
+            time = np.squeeze(timestamps).astype(float)
+        if(len(time) != ydata.shape[1]):
             # self.__init__([],empty=True)
             raise TypeError("time and ydata size mismatch! Note: ydata "
                             "is expected to have rows containing signals")
         #data is not sorted and user wants it to be
         # TODO: use faster is_sort from jagular
-        if not utils.is_sorted(time):
+        if not isinstance(time, RegularlySampledTime) and not utils.is_sorted(time):
             warnings.warn("Data is _not_ sorted! Data will be sorted "\
                             "automatically.")
             ind = np.argsort(time)
@@ -385,26 +746,44 @@ class AnalogSignalArray:
         else:
             warnings.warn("creating support from time and "
                             "sampling rate, fs!")
-            self._support = core.EpochArray(
-                utils.get_contiguous_segments(
-                    self.time,
-                    step=self._step,
-                    fs=fs,
-                    in_memory=in_memory))
+            if isinstance(self._time, RegularlySampledTime) and self._step is None:
+                # every run of regularly sampled data is a contiguous segment
+                self._support = core.EpochArray(
+                    np.column_stack((self._time.t0,
+                                     self._time.t0 + self._time.n_samples/self._time.fs)))
+            else:
+                self._support = core.EpochArray(
+                    utils.get_contiguous_segments(
+                        self.time,
+                        step=self._step,
+                        fs=fs,
+                        in_memory=in_memory))
             if merge_sample_gap > 0:
                 self._support = self._support.merge(gap=merge_sample_gap)
 
         if np.abs((self.fs - self._estimate_fs())/self.fs) > 0.01:
             warnings.warn("estimated fs and provided fs differ by more than 1%")
 
+        self.__bake__()
+
     def __bake__(self):
         """Fix object as-is, and bake a new hash.
 
-        For example, if a label has changed, or if an interp has been attached,
-        then the object's hash will change, and it needs to be baked
-        again for efficiency / consistency.
+        For example, if a label has changed, or if the data have been
+        replaced, then the object's content fingerprint will change, and it
+        needs to be baked again for efficiency / consistency.
         """
-        self._stored_hash_ = self.__hash__()
+        self._stored_hash_ = self.fingerprint
+
+    @property
+    def fingerprint(self):
+        """(str) Content fingerprint, i.e., a hash of the data buffers plus
+        metadata, used to key cached results (see nelpy.utils_.cache).
+
+        The fingerprint is computed from the current content on every
+        access, so that it reflects in-place changes such as add_signal().
+        """
+        return cache._content_fingerprint(self)
 
     # def _has_changed_data(self):
     #     """Compute hash on timestamps and ydata and compare to cached hash."""
@@ -412,14 +791,30 @@ class AnalogSignalArray:
 
     def _has_changed(self):
         """Compute hash on current object, and compare to previously stored hash"""
-        return self.__hash__() == self._stored_hash_
+        return self.fingerprint != self._stored_hash_
+
+    def __setattr__(self, name, value):
+        # replacing the data, timestamps or support invalidates the cached
+        # interpolation object and min/max pyramid (see _touch); after
+        # writing into the data buffer in place, call __renew__():
+        if name in ('_ydata', '_time', '_support'):
+            self._touch()
+        object.__setattr__(self, name, value)
+
+    def _touch(self):
+        """Mark the data as (possibly) changed, by incrementing the version
+        that cached interpolation objects and pyramids are keyed on."""
+        object.__setattr__(self, '_data_version', getattr(self, '_data_version', 0) + 1)
 
     def __renew__(self):
-        """Re-attach data slicers."""
+        """Re-attach data slicers, and drop cached results, e.g., after the
+        data have been changed in place."""
+        self._touch()
         self._epochsignalslicer = EpochSignalSlicer(self)
         self._epochdata = DataSlicer(self)
         self._epochtime = TimestampSlicer(self)
         self._interp = None
+        self._minmax_pyramid = None
         self.__bake__()
 
     def __call__(self, *args):
@@ -559,14 +954,38 @@ class AnalogSignalArray:
     def _estimate_fs(self, data=None):
         """Estimate the sampling rate of the data."""
         if data is None:
+            if isinstance(self._time, RegularlySampledTime):
+                return self._time.fs
             data = self.time
         return 1.0/np.median(np.diff(data))
 
-    def downsample(self, *, fs_out, aafilter=True, inplace=False):
-        out = utils.downsample_analogsignalarray(self, fs_out=fs_out, aafilter=aafilter, inplace=inplace)
+    def downsample(self, *, fs_out, aafilter=True, inplace=False, method='filtfilt'):
+        """Downsample the AnalogSignalArray to fs_out (in Hz).
+
+        See nelpy.utils.downsample_analogsignalarray for details.
+        """
+        out = utils.downsample_analogsignalarray(self, fs_out=fs_out, aafilter=aafilter, inplace=inplace, method=method)
         out.__renew__()
         return out
 
+    def psd(self, **kwargs):
+        """Power spectral density (Welch or multitaper), averaged over all
+        segments of all epochs, for every signal.
+
+        See nelpy.spectral.psd for the available parameters.
+        """
+        from .. import spectral
+        return spectral.psd(self, **kwargs)
+
+    def spectrogram(self, **kwargs):
+        """Spectrogram (Welch or multitaper) of every signal, computed
+        within each epoch.
+
+        See nelpy.spectral.spectrogram for the available parameters.
+        """
+        from .. import spectral
+        return spectral.spectrogram(self, **kwargs)
+
     def add_signal(self, signal, label=None):
         """Docstring goes here.
         Basically we add a signal, and we add a label. THIS HAPPENS IN PLACE?
@@ -620,28 +1039,36 @@ class AnalogSignalArray:
         except AttributeError:
             raise AttributeError("EpochArray expected")
 
-        indices = []
-        for eptime in epocharray.time:
-            t_start = eptime[0]
-            t_stop = eptime[1]
-            frm, to = np.searchsorted(self._time, (t_start, t_stop))
-            indices.append((frm, to))
-        indices = np.array(indices, ndmin=2)
-        if np.diff(indices).sum() < len(self._time):
+        # (start, stop) sample indices of all epochs, in a single pass:
+        indices = np.searchsorted(self._time, np.atleast_2d(epocharray.time))
+        lengths = np.maximum(indices[:,1] - indices[:,0], 0)
+        if lengths.sum() < len(self._time):
             warnings.warn(
                 'ignoring signal outside of support')
-        try:
-            ydata_list = []
-            for start, stop in indices:
-                ydata_list.append(self._ydata[:,start:stop])
-            self._ydata = np.hstack(ydata_list)
-        except IndexError:
-            self._ydata = np.zeros([0,self._ydata.shape[0]])
-            self._ydata[:] = np.nan
-        time_list = []
-        for start, stop in indices:
-            time_list.extend(self._time[start:stop])
-        self._time = np.array(time_list)
+
+        if np.all(indices[1:,0] == indices[:-1,1]):
+            # epochs map onto one contiguous range of samples, so that we
+            # can simply take views into the existing data (callers that
+            # must not share buffers with another object copy them):
+            start, stop = indices[0,0], indices[-1,1]
+            self._ydata = self._ydata[:,start:stop]
+            if isinstance(self._time, RegularlySampledTime):
+                self._time = self._time[start:stop]
+            else:
+                self._time = np.asanyarray(self._time)[start:stop]
+        else:
+            # gather all samples with a single fancy indexing operation:
+            cum_lengths = np.insert(np.cumsum(lengths), 0, 0)
+            idx = np.arange(cum_lengths[-1]) + np.repeat(indices[:,0] - cum_lengths[:-1], lengths)
+            try:
+                self._ydata = np.take(self._ydata, idx, axis=1)
+            except IndexError:
+                self._ydata = np.zeros([0,self._ydata.shape[0]])
+                self._ydata[:] = np.nan
+            if isinstance(self._time, RegularlySampledTime):
+                self._time = self._time.take_ranges(indices[:,0], indices[:,0] + lengths)
+            else:
+                self._time = np.take(self._time, idx)
         if update:
             self._support = epocharray
 
@@ -684,13 +1111,14 @@ class AnalogSignalArray:
         except AttributeError:
             raise AttributeError("EpochArray expected")
 
+        time = np.asarray(self._time)
         indices = []
         for eptime in epocharray.time:
             t_start = eptime[0]
             t_stop = eptime[1]
-            indices.append((self._time >= t_start) & (self._time < t_stop))
+            indices.append((time >= t_start) & (time < t_stop))
         indices = np.any(np.column_stack(indices), axis=1)
-        if np.count_nonzero(indices) < len(self._time):
+        if np.count_nonzero(indices) < len(time):
             warnings.warn(
                 'ignoring signal outside of support')
         try:
@@ -698,7 +1126,7 @@ class AnalogSignalArray:
         except IndexError:
             self._ydata = np.zeros([0,self._ydata.shape[0]])
             self._ydata[:] = np.nan
-        self._time = self._time[indices]
+        self._time = time[indices]
         if update:
             self._support = epocharray
 
@@ -740,13 +1168,7 @@ class AnalogSignalArray:
     @property
     def lengths(self):
         """(list) The number of samples in each epoch."""
-        indices = []
-        for eptime in self.support.time:
-            t_start = eptime[0]
-            t_stop = eptime[1]
-            frm, to = np.searchsorted(self._time, (t_start, t_stop))
-            indices.append((frm, to))
-        indices = np.array(indices, ndmin=2)
+        indices = np.searchsorted(self._time, np.atleast_2d(self.support.time))
         lengths = np.atleast_1d(np.diff(indices).squeeze())
         return lengths
 
@@ -834,8 +1256,12 @@ class AnalogSignalArray:
 
     @property
     def time(self):
-        """(np.array 1D) Time in seconds."""
-        return self._time
+        """(np.array 1D) Time in seconds.
+
+        Regularly sampled timestamps are materialized on every access; index
+        self._time instead to look up individual samples.
+        """
+        return np.asarray(self._time)
 
     @property
     def fs(self):
@@ -855,7 +1281,7 @@ class AnalogSignalArray:
     @property
     def n_bytes(self):
         """Approximate number of bytes taken up by object."""
-        return utils.PrettyBytes(self.ydata.nbytes + self.time.nbytes)
+        return utils.PrettyBytes(self._ydata.nbytes + self._time.nbytes)
 
     @property
     def n_epochs(self):
@@ -867,7 +1293,7 @@ class AnalogSignalArray:
         """(int) number of time samples where signal is defined."""
         if self.isempty:
             return 0
-        return utils.PrettyInt(len(self.time))
+        return utils.PrettyInt(len(self._time))
 
     def __iter__(self):
         """AnalogSignal iterator initialization"""
@@ -905,6 +1331,7 @@ class AnalogSignalArray:
             for attr in attrs:
                 exec("asa." + attr + " = self." + attr)
         asa._restrict_to_epoch_array_fast(epocharray=epoch)
+        asa._detach_from(self)
         if(asa.support.isempty):
             warnings.warn("Support is empty. Empty AnalogSignalArray returned")
             asa = AnalogSignalArray([],empty=True)
@@ -944,6 +1371,7 @@ class AnalogSignalArray:
 
         if isinstance(epochslice, slice):
             if epochslice.start == None and epochslice.stop == None and epochslice.step == None:
+                asa._detach_from(self)
                 asa.__renew__()
                 return asa
 
@@ -956,27 +1384,42 @@ class AnalogSignalArray:
         ################################################################
 
         asa._restrict_to_epoch_array_fast(epocharray=newepochs)
+        asa._detach_from(self)
         asa.__renew__()
         return asa
 
+    def _detach_from(self, parent):
+        """Copy ydata and time if they (may) be views into the buffers of
+        parent, e.g., after restricting to a contiguous range of samples, so
+        that writing to self never changes parent. In-place."""
+        if np.may_share_memory(self._ydata, parent._ydata):
+            self._ydata = self._ydata.copy()
+        if isinstance(self._time, np.ndarray) and isinstance(parent._time, np.ndarray) \
+                and np.may_share_memory(self._time, parent._time):
+            self._time = self._time.copy()
+
     def _subset(self, idx):
-        asa = self.copy()
+        """Shallow copy of self with the signals idx; the caller is expected
+        to call __renew__() on the result once it is done with it."""
+        asa = copy.copy(self) # shallow copy; ydata is replaced below
         try:
             asa._ydata = np.atleast_2d(self._ydata[idx,:])
         except IndexError:
             raise IndexError("index {} is out of bounds for n_signals with size {}".format(idx, self.n_signals))
-        asa.__renew__()
         return asa
 
     def _copy_without_data(self):
         """Return a copy of self, without data."""
-        out = copy.copy(self) # shallow copy
-        out._time = None
+        out = copying.copy_without(self, '_ydata', '_time')
         out._ydata = np.zeros((self.n_signals,0))
-        out = copy.deepcopy(out) # just to be on the safe side, but at least now we are not copying the data!
         out.__renew__()
         return out
 
+    def __deepcopy__(self, memo):
+        """Deep copy, in which data buffers are copied directly, and cached
+        interpolants are shared with the copy."""
+        return copying.deepcopy(self, memo, by_reference=('_interp', '_minmax_pyramid'))
+
     def copy(self):
         """Return a copy of the current object."""
         out = copy.deepcopy(self)
@@ -1142,51 +1585,66 @@ class AnalogSignalArray:
         """returns skinny-format ydata s.t. each column is a signal."""
         return self._ydata.T
 
+    def _get_boundary_augmented_data(self):
+        """returns (time, yvals), extended to have values at all epoch
+        boundaries, so that interpolation is well defined everywhere on the
+        support. Values at the boundaries are those of the first / last
+        sample within each epoch.
+        """
+        time = self._time
+        yvals = self._ydata_rowsig
+
+        lengths = np.atleast_1d(self.lengths)
+        nonempty = lengths > 0
+        last_idx = np.cumsum(lengths) - 1
+        first_idx = last_idx - lengths + 1
+        bounds = np.atleast_2d(self.support.time)
+
+        # boundary candidates in (epoch, [start, stop]) order:
+        candidate_idx = np.vstack((first_idx, last_idx)).T[nonempty]
+        candidate_times = bounds[nonempty]
+        add = np.vstack((time[candidate_idx[:,0]] > candidate_times[:,0],
+                         time[candidate_idx[:,1]] < candidate_times[:,1])).T
+
+        boundary_times = candidate_times[add]
+        if boundary_times.size:
+            boundary_vals = yvals[:, candidate_idx[add]]
+            insert_locs = np.searchsorted(time, boundary_times)
+            if isinstance(time, RegularlySampledTime):
+                if np.all(np.diff(boundary_times) > 0) and \
+                        np.all(time[np.minimum(insert_locs, len(time)-1)] != boundary_times):
+                    # all boundaries are distinct, so that we can keep the
+                    # timestamps in their compact representation:
+                    time = time.insert(insert_locs, boundary_times)
+                    yvals = np.insert(yvals, insert_locs, boundary_vals, axis=1)
+                    return time, yvals
+                time = np.asarray(time)
+            time = np.insert(time, insert_locs, boundary_times)
+            yvals = np.insert(yvals, insert_locs, boundary_vals, axis=1)
+
+            time, unique_idx = np.unique(time, return_index=True)
+            yvals = yvals[:,unique_idx]
+
+        return time, yvals
+
     def _get_interp1d(self,* , kind='linear', copy=True, bounds_error=False,
                       fill_value=np.nan, assume_sorted=None):
         """returns a scipy interp1d object, extended to have values at all epoch
         boundaries!
         """
 
-        if assume_sorted is None:
-            assume_sorted = utils.is_sorted(self.time)
-
         if self.n_signals > 1:
             axis = 1
         else:
             axis = -1
 
-        time = self.time
-        yvals = self._ydata_rowsig
-        lengths = self.lengths
-        empty_epoch_ids = np.argwhere(lengths==0).squeeze().tolist()
-        first_timestamps_per_epoch_idx = np.insert(np.cumsum(lengths[:-1]),0,0)
-        first_timestamps_per_epoch_idx[empty_epoch_ids] = 0
-        last_timestamps_per_epoch_idx = np.cumsum(lengths)-1
-        last_timestamps_per_epoch_idx[empty_epoch_ids] = 0
-        first_timestamps_per_epoch = self.time[first_timestamps_per_epoch_idx]
-        last_timestamps_per_epoch = self.time[last_timestamps_per_epoch_idx]
-
-        boundary_times = []
-        boundary_vals = []
-        for ii, (start, stop) in enumerate(self.support.time):
-            if lengths[ii] == 0:
-                continue
-            if first_timestamps_per_epoch[ii] > start:
-                boundary_times.append(start)
-                boundary_vals.append(yvals[:,first_timestamps_per_epoch_idx[ii]])
-                # print('adding {} at time {}'.format(yvals[:,first_timestamps_per_epoch_idx[ii]], start))
-            if last_timestamps_per_epoch[ii] < stop:
-                boundary_times.append(stop)
-                boundary_vals.append(yvals[:,last_timestamps_per_epoch_idx[ii]])
-
-        if boundary_times:
-            insert_locs = np.searchsorted(time, boundary_times)
-            time = np.insert(time, insert_locs, boundary_times)
-            yvals = np.insert(yvals, insert_locs, np.array(boundary_vals).T, axis=1)
+        time, yvals = self._get_boundary_augmented_data()
 
-            time, unique_idx = np.unique(time, return_index=True)
-            yvals = yvals[:,unique_idx]
+        if assume_sorted is None:
+            # regularly sampled timestamps are sorted by construction, but
+            # explicit timestamps may have been replaced since:
+            assume_sorted = isinstance(time, RegularlySampledTime) or \
+                bool(np.all(np.diff(time) >= 0))
 
         f = interpolate.interp1d(x=time,
                                  y=yvals,
@@ -1198,6 +1656,21 @@ class AnalogSignalArray:
                                  assume_sorted=assume_sorted)
         return f
 
+    def _get_linear_interp(self, *, fill_value=np.nan):
+        """returns a LinearInterpolator, extended to have values at all epoch
+        boundaries!
+        """
+        time, yvals = self._get_boundary_augmented_data()
+        return LinearInterpolator(time, yvals, fill_value=fill_value)
+
+    def _get_interp(self, **kwargs):
+        """returns the fastest interpolation object that supports kwargs."""
+        fill_value = kwargs['fill_value']
+        if kwargs['kind'] == 'linear' and not kwargs['bounds_error'] \
+                and isinstance(fill_value, numbers.Number):
+            return self._get_linear_interp(fill_value=fill_value)
+        return self._get_interp1d(**kwargs)
+
     def asarray(self,*, where=None, at=None, kind='linear', copy=True,
                 bounds_error=False, fill_value=np.nan, assume_sorted=None,
                 recalculate=False, store_interp=True, n_points=None,
@@ -1245,8 +1718,8 @@ class AnalogSignalArray:
                 at = y[x]
             else:
                 x = np.asanyarray(where).squeeze()
-                assert len(x) == len(self.time), "'where' condition must have same number of elements as self.time"
-                at = self.time[x]
+                assert len(x) == len(self._time), "'where' condition must have same number of elements as self.time"
+                at = self._time[x]
         elif at is not None:
             assert n_points is None, "'at' and 'n_points' cannot be used at the same time"
         else:
@@ -1260,26 +1733,26 @@ class AnalogSignalArray:
                   'fill_value':fill_value,
                   'assume_sorted':assume_sorted}
 
+        # the stored interpolation object is only valid for the same data
+        # and the same interpolation parameters:
+        interp_key = (getattr(self, '_data_version', 0), kind, bounds_error, str(fill_value))
+
         # retrieve an existing, or construct a new interpolation object
-        if recalculate:
-            interpobj = self._get_interp1d(**kwargs)
-        else:
-            try:
-                interpobj = self._interp
-                if interpobj is None:
-                    interpobj = self._get_interp1d(**kwargs)
-            except AttributeError: # does not exist yet
-                interpobj = self._get_interp1d(**kwargs)
+        interpobj = getattr(self, '_interp', None)
+        if recalculate or interpobj is None or \
+                getattr(self, '_interp_key', None) != interp_key:
+            interpobj = self._get_interp(**kwargs)
 
         # store interpolation object, if desired
         if store_interp:
             self._interp = interpobj
+            self._interp_key = interp_key
 
         # do the actual interpolation
         try:
             out = interpobj(at)
         except SystemError:
-            interpobj = self._get_interp1d(**kwargs)
+            interpobj = self._get_interp(**kwargs)
             if store_interp:
                 self._interp = interpobj
             out = interpobj(at)
@@ -1358,8 +1831,8 @@ class AnalogSignalArray:
         first_timestamps_per_epoch_idx[empty_epoch_ids] = 0
         last_timestamps_per_epoch_idx = np.cumsum(lengths)-1
         last_timestamps_per_epoch_idx[empty_epoch_ids] = 0
-        first_timestamps_per_epoch = self.time[first_timestamps_per_epoch_idx]
-        last_timestamps_per_epoch = self.time[last_timestamps_per_epoch_idx]
+        first_timestamps_per_epoch = self._time[first_timestamps_per_epoch_idx]
+        last_timestamps_per_epoch = self._time[last_timestamps_per_epoch_idx]
 
         for ii, (start, stop) in enumerate(self.support.time):
             if lengths[ii] == 0:
@@ -1384,6 +1857,46 @@ class AnalogSignalArray:
         asa.__renew__()
         return asa
 
+    def _get_minmax_pyramid(self):
+        """returns the cached MinMaxPyramid, building it if necessary."""
+        key = getattr(self, '_data_version', 0)
+        pyramid = getattr(self, '_minmax_pyramid', None)
+        if pyramid is None or self._minmax_pyramid_key != key:
+            pyramid = MinMaxPyramid(self)
+            self._minmax_pyramid = pyramid
+            self._minmax_pyramid_key = key
+        return pyramid
+
+    def minmax_envelope(self, *, n_points, start=None, stop=None):
+        """Returns the min/max envelope of each signal at a resolution of
+        (at least) n_points within [start, stop].
+
+        Unlike simplify, which interpolates at regularly spaced points, the
+        envelope retains the extreme values of all the underlying samples,
+        so that transients are preserved at any zoom level. The envelope is
+        obtained from a multi-resolution min/max pyramid which is built
+        once per object (on first use) and cached thereafter.
+
+        Parameters
+        ----------
+        n_points : int
+            Desired number of points in [start, stop], e.g. the pixel width
+            of the axis on which the signal is to be drawn.
+        start : float, optional
+            Left boundary of interval in time (seconds).
+        stop : float, optional
+            Right boundary of interval in time (seconds).
+
+        Returns
+        -------
+        envelopes : list of (xvals, ymin, ymax)
+            One namedtuple per non-empty epoch overlapping [start, stop],
+            with ymin and ymax of shape (n_signals, len(xvals)).
+        """
+        if self.isempty:
+            return []
+        return self._get_minmax_pyramid().envelope(n_points, start=start, stop=stop)
+
     def join(self, other, *, mode=None, inplace=False):
         """Join another AnalogSignalArray to this one.
 
@@ -1419,9 +1932,9 @@ class AnalogSignalArray:
         if self.support[other.support].isempty:
             # do a simple-as-butter join (concat) and sort
             times = np.append(times, self.time)
-            ydata = np.hstack((ydata, self.ydata))
+            ydata = np.hstack((ydata, self._ydata))
             times = np.append(times, other.time)
-            ydata = np.hstack((ydata, other.ydata))
+            ydata = np.hstack((ydata, other._ydata))
         else: # not disjoint
             both_eps = self.support[other.support]
             self_eps = self.support - both_eps - other.support
@@ -1433,23 +1946,23 @@ class AnalogSignalArray:
 
                 tmp = self[self_eps]
                 times = np.append(times, tmp.time)
-                ydata = np.hstack((ydata, tmp.ydata))
+                ydata = np.hstack((ydata, tmp._ydata))
 
                 if not other_eps.isempty:
                     tmp = other[other_eps]
                     times = np.append(times, tmp.time)
-                    ydata = np.hstack((ydata, tmp.ydata))
+                    ydata = np.hstack((ydata, tmp._ydata))
             elif mode=='right':
                 other_eps += both_eps
 
                 tmp = other[other_eps]
                 times = np.append(times, tmp.time)
-                ydata = np.hstack((ydata, tmp.ydata))
+                ydata = np.hstack((ydata, tmp._ydata))
 
                 if not self_eps.isempty:
                     tmp = self[self_eps]
                     times = np.append(times, tmp.time)
-                    ydata = np.hstack((ydata, tmp.ydata))
+                    ydata = np.hstack((ydata, tmp._ydata))
             else:
                 raise NotImplementedError("asa.join() has not yet been implemented for mode '{}'!".format(mode))
 
@@ -9,6 +9,8 @@ from sys import float_info
 
 from .. import utils
 from .. import version
+from ..utils_ import copying
+from ..utils_ import cache
 
 # Force warnings.warn() to omit the source code line in the message
 formatwarning_orig = warnings.formatwarning
@@ -558,6 +560,16 @@ class EpochArray:
         except TypeError:
             return True  # this happens when self.time is None
 
+    @property
+    def fingerprint(self):
+        """(str) Content fingerprint, i.e., a hash of the data buffers plus
+        metadata, used to key cached results (see nelpy.utils_.cache)."""
+        return cache._content_fingerprint(self)
+
+    def __deepcopy__(self, memo):
+        """Deep copy, in which the epoch times are copied directly."""
+        return copying.deepcopy(self, memo)
+
     def copy(self):
         """(EpochArray) Returns a copy of the current epoch array."""
         newcopy = EpochArray(empty=True)
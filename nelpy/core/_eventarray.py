@@ -1,9 +1,9 @@
-__all__ = ['EventArray']
+__all__ = ['EventArray', 'ValueEventArray']
 
 """EventArray
 
 EventArray (supports binning)
-  |_ ValueEventArray (does not support binning, nor queries)
+  |_ ValueEventArray (supports binning with value reduction, but no queries)
     |_ StatefulEventArray (supports queries, casting to-and-from AnalogSignalArrays)
 
 eva, veva, seva
@@ -19,11 +19,14 @@ from abc import ABC, abstractmethod
 # from functools import wraps
 # from scipy import interpolate
 # from sys import float_info
-# from collections import namedtuple
+from collections import namedtuple
 
 from .. import core
 from .. import utils
 from .. import version
+from ..utils_ import cache
+
+EventColumns = namedtuple('EventColumns', ['time', 'values', 'source_idx'])
 
 # TODO: EpochArray from EventArray
 # TODO: casting any nelpy obj to EpochArray returns its support with
@@ -123,10 +126,13 @@ class ItemGetter_loc(object):
         if not isinstance(source_idx_list, list):
             source_idx_list = list(source_idx_list)
         out = copy.copy(self.obj)
-        out._time = out._time[source_idx_list]
-        singlesource = len(out._time)==1
-        if singlesource:
-            out._time = np.array(out._time[0], ndmin=2)
+        if isinstance(out, ValueEventArray):
+            out._select_sources(source_idx_list)
+        else:
+            out._time = out._time[source_idx_list]
+            singlesource = len(out._time)==1
+            if singlesource:
+                out._time = np.array(out._time[0], ndmin=2)
         out._source_ids = list(np.atleast_1d(np.atleast_1d(out._source_ids)[source_idx_list]))
         out._source_labels = list(np.atleast_1d(np.atleast_1d(out._source_labels)[source_idx_list]))
         # TODO: update tags
@@ -162,10 +168,13 @@ class ItemGetter_iloc(object):
         out = copy.copy(self.obj)
         if isinstance(sourceslice, int):
             sourceslice = [sourceslice]
-        out._time = out._time[sourceslice]
-        singlesource = len(out._time)==1
-        if singlesource:
-            out._time = np.array(out._time[0], ndmin=2)
+        if isinstance(out, ValueEventArray):
+            out._select_sources(np.arange(out.n_sources)[sourceslice])
+        else:
+            out._time = out._time[sourceslice]
+            singlesource = len(out._time)==1
+            if singlesource:
+                out._time = np.array(out._time[0], ndmin=2)
         out._source_ids = list(np.atleast_1d(np.atleast_1d(out._source_ids)[sourceslice]))
         out._source_labels = list(np.atleast_1d(np.atleast_1d(out._source_labels)[sourceslice]))
         # TODO: update tags
@@ -300,6 +309,12 @@ class EventBase(ABC):
         """
         return
 
+    @property
+    def fingerprint(self):
+        """(str) Content fingerprint, i.e., a hash of the data buffers plus
+        metadata, used to key cached results (see nelpy.utils_.cache)."""
+        return cache._content_fingerprint(self)
+
     @abstractmethod
     def isempty(self):
         """(bool) Empty EventArray."""
@@ -1134,12 +1149,21 @@ class EventArray(EventBase):
 class ValueEventArray(EventBase):
     """A multisource event train array with a value associated with each event.
 
+    Events are stored in a columnar (struct-of-arrays) layout: the times,
+    values and source indices of the events of all sources are kept in three
+    flat arrays, sorted by time, so that restriction to an EpochArray and
+    binning are vectorized over all sources and epochs.
+
     Parameters
     ----------
     timestamps : array of np.array(dtype=np.float64) event times in seconds.
-        Array of length n_sources, each entry with shape (n_times,)
+        Array of length n_sources, each entry with shape (n_times,). If
+        source_idx is given, a flat array with the times of all events.
     eventvalues : array of event values.
-        Array of length n_sources, each entry with shape (n_times,)
+        Same layout as timestamps. Default is 0 for every event.
+    source_idx : array of int, optional
+        Source index (from 0 to n_sources-1) of every event, if timestamps
+        and eventvalues are flat arrays of all events.
     fs : float, optional
         Sampling rate in Hz. Default is 30,000
     support : EpochArray, optional
@@ -1159,6 +1183,8 @@ class ValueEventArray(EventBase):
         Array of length n_sources, each entry with shape (n_time,)
     values : array of event values.
         Array of length n_sources, each entry with shape (n_time,)
+    columns : EventColumns
+        Flat, time-sorted arrays (time, values, source_idx) of all events.
     support : EpochArray on which EventArray is defined.
     n_events: np.array(dtype=np.int) of shape (n_sources,)
         Number of events in each source.
@@ -1170,11 +1196,11 @@ class ValueEventArray(EventBase):
         Metadata associated with eventtrain.
     """
 
-    __attributes__ = ["_time", "_values", "_support"]
+    __attributes__ = ["_time", "_values", "_source_idx", "_n_sources", "_support"]
     __attributes__.extend(EventBase.__attributes__)
-    def __init__(self, timestamps=None, *, eventvalues=None, fs=None, support=None,
-                 source_ids=None, source_labels=None, source_tags=None,
-                 label=None, empty=False):
+    def __init__(self, timestamps=None, *, eventvalues=None, source_idx=None,
+                 fs=None, support=None, source_ids=None, source_labels=None,
+                 source_tags=None, label=None, empty=False):
 
         default_val = 0; # default event value (not yet exposed by API)
 
@@ -1257,19 +1283,54 @@ class ValueEventArray(EventBase):
                     data = np.array(data, ndmin=2)
             return data
 
-        time = standardize_to_2d(timestamps)
-
-        if eventvalues is not None:
-            values = standardize_to_2d(eventvalues)
-            if values.shape != time.shape:
-                raise ValueError('timestamps and eventvalues must have the same size!')
+        def flatten(data):
+            """Concatenate per-source data, and return it with the number of
+            events in each source."""
+            lengths = np.array([np.size(source) for source in data], dtype=int)
+            if lengths.sum() == 0:
+                return np.array([]), lengths
+            return np.concatenate([np.ravel(source) for source in data]), lengths
+
+        if source_idx is None:
+            # per-source (jagged) input:
+            time, lengths = flatten(standardize_to_2d(timestamps))
+            if eventvalues is not None:
+                values, value_lengths = flatten(standardize_to_2d(eventvalues))
+                if not np.array_equal(lengths, value_lengths):
+                    raise ValueError('timestamps and eventvalues must have the same size!')
+            else:
+                values = None
+            n_sources = len(lengths)
+            source_idx = np.repeat(np.arange(n_sources), lengths)
         else:
+            # columnar input:
+            time = np.ravel(timestamps)
+            source_idx = np.ravel(source_idx).astype(int)
+            if source_idx.shape != time.shape:
+                raise ValueError('timestamps and source_idx must have the same size!')
+            values = None if eventvalues is None else np.ravel(eventvalues)
+            if source_ids is not None:
+                n_sources = len(source_ids)
+            elif source_labels is not None:
+                n_sources = len(source_labels)
+            else:
+                n_sources = source_idx.max() + 1 if source_idx.size else 0
+            if source_idx.size and (source_idx.min() < 0 or source_idx.max() >= n_sources):
+                raise ValueError('source_idx must be between 0 and n_sources-1!')
+
+        time = np.asarray(time, dtype=float)
+        if values is None:
             values = np.ones(time.shape)*default_val
+        elif values.shape != time.shape:
+            raise ValueError('timestamps and eventvalues must have the same size!')
 
-        #sort event trains, but only if necessary:
-        for ii, train in enumerate(time):
-            if not utils.is_sorted(train):
-                time[ii] = np.sort(train)
+        # sort all events by time (stable, so that simultaneous events stay
+        # in source order), but only if necessary:
+        if not utils.is_sorted(time):
+            order = np.argsort(time, kind='mergesort')
+            time = time[order]
+            values = values[order]
+            source_idx = source_idx[order]
 
         kwargs = {"fs": fs,
                   "source_ids": source_ids,
@@ -1277,41 +1338,35 @@ class ValueEventArray(EventBase):
                   "source_tags": source_tags,
                   "label": label}
 
-        self._time = time  # this is necessary so that
-        # super() can determine self.n_sources when initializing.
+        self._time = time
         self._values = values
+        self._source_idx = source_idx
+        self._n_sources = int(n_sources)  # this is necessary so that
+        # super() can determine self.n_sources when initializing.
 
         # initialize super so that self.fs is set:
         super().__init__(**kwargs)
 
         # if only empty time were received AND no support, attach an
         # empty support:
-        if np.sum([st.size for st in time]) == 0 and support is None:
+        if time.size == 0 and support is None:
             warnings.warn("no events; cannot automatically determine support")
             support = core.EpochArray(empty=True)
 
         # determine eventtrain array support:
         if support is None:
-            first_event = np.nanmin(np.array([source[0] for source in time if len(source) !=0]))
-            # BUG: if eventtrain is empty np.array([]) then source[-1]
-            # raises an error in the following:
-            # FIX: list[-1] raises an IndexError for an empty list,
-            # whereas list[-1:] returns an empty list.
-            last_event = np.nanmax(np.array([source[-1:] for source in time if len(source) !=0]))
-            self._support = core.EpochArray(np.array([first_event, last_event + 1/fs]))
-            # in the above, there's no reason to restrict to support
+            self._support = core.EpochArray(np.array([time[0], time[-1] + 1/fs]))
         else:
             # restrict events to only those within the eventtrain
             # array's support:
             self._support = support
 
-        # TODO: if sorted, we may as well use the fast restrict here as well?
-        time, values = self._restrict_to_epoch_array(
-            epocharray=self._support,
-            time=time, values=values)
-
-        self._time = time
-        self._values = values
+        self._time, self._values, self._source_idx = \
+            self._restrict_to_epoch_array_fast(
+                epocharray=self._support,
+                time=time,
+                values=values,
+                source_idx=source_idx)
 
     def partition(self, ds=None, n_epochs=None):
         """Returns an EventArray whose support has been partitioned.
@@ -1352,21 +1407,7 @@ class ValueEventArray(EventBase):
 
     def __add__(self, other):
         """Overloaded + operator"""
-
         raise NotImplementedError
-        #TODO: additional checks need to be done, e.g., same source ids...
-        #TODO: it's better to copy into self, so that metadata are preserved
-        assert self.n_sources == other.n_sources
-        support = self.support + other.support
-
-        newdata = []
-        for source in range(self.n_sources):
-            newdata.append(np.append(self.time[source], other.time[source]))
-
-        fs = self.fs
-        if self.fs != other.fs:
-            fs = None
-        return EventArray(newdata, support=support, fs=fs)
 
     def __iter__(self):
         """EventArray iterator initialization."""
@@ -1376,112 +1417,60 @@ class ValueEventArray(EventBase):
 
     def __next__(self):
         """EventArray iterator advancer."""
-        raise NotImplementedError
         index = self._index
         if index > self.support.n_epochs - 1:
             raise StopIteration
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            support = self.support[index]
-            time = self._restrict_to_epoch_array_fast(
-                epocharray=support,
-                time=self.time,
-                copyover=True
-                )
-            eventtrain = EventArray(empty=True)
-            exclude = ["_time", "_support"]
-            attrs = (x for x in self.__attributes__ if x not in exclude)
-            for attr in attrs:
-                exec("eventtrain." + attr + " = self." + attr)
-            eventtrain._time = time
-            eventtrain._support = support
-            eventtrain.loc = ItemGetter_loc(eventtrain)
-            eventtrain.iloc = ItemGetter_iloc(eventtrain)
+        eventtrain = self._epochslicer(index)
         self._index += 1
         return eventtrain
 
     def _epochslicer(self, idx):
         """Helper function to restrict object to EpochArray."""
-        # if self.isempty:
-        #     return self
-        raise NotImplementedError
-
-        if isinstance(idx, core.EpochArray):
-            if idx.isempty:
-                return EventArray(empty=True)
-            support = self.support.intersect(
-                    epoch=idx,
-                    boundaries=True
-                    ) # what if fs of slicing epoch is different?
-            if support.isempty:
-                return EventArray(empty=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if isinstance(idx, core.EpochArray):
+                if idx.isempty:
+                    return ValueEventArray(empty=True)
+                support = self.support.intersect(
+                        epoch=idx,
+                        boundaries=True
+                        ) # what if fs of slicing epoch is different?
+                if support.isempty:
+                    return ValueEventArray(empty=True)
+            elif isinstance(idx, int) and ((idx >= self.support.n_epochs)
+                                           or idx < (-self.support.n_epochs)):
+                support = core.EpochArray(empty=True)
+            else:  # most likely slice indexing
+                try:
+                    support = self.support[idx]
+                except Exception:
+                    raise TypeError(
+                        'unsupported subsctipting type {}'.format(type(idx)))
 
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                time = self._restrict_to_epoch_array_fast(
+            eventtrain = self._copy_without_data()
+            eventtrain._time, eventtrain._values, eventtrain._source_idx = \
+                self._restrict_to_epoch_array_fast(
                     epocharray=support,
-                    time=self.time,
-                    copyover=True
-                    )
-                eventtrain = EventArray(empty=True)
-                exclude = ["_time", "_support"]
-                attrs = (x for x in self.__attributes__ if x not in exclude)
-                for attr in attrs:
-                    exec("eventtrain." + attr + " = self." + attr)
-                eventtrain._time = time
-                eventtrain._support = support
-                eventtrain.loc = ItemGetter_loc(eventtrain)
-                eventtrain.iloc = ItemGetter_iloc(eventtrain)
-            return eventtrain
-        elif isinstance(idx, int):
-            eventtrain = EventArray(empty=True)
-            exclude = ["_time", "_support"]
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                attrs = (x for x in self.__attributes__ if x not in exclude)
-                for attr in attrs:
-                    exec("eventtrain." + attr + " = self." + attr)
-                support = self.support[idx]
-                eventtrain._support = support
-            if (idx >= self.support.n_epochs) or idx < (-self.support.n_epochs):
-                eventtrain.loc = ItemGetter_loc(eventtrain)
-                eventtrain.iloc = ItemGetter_iloc(eventtrain)
-                return eventtrain
-            else:
-                time = self._restrict_to_epoch_array_fast(
-                        epocharray=support,
-                        time=self.time,
-                        copyover=True
-                        )
-                eventtrain._time = time
-                eventtrain._support = support
-                eventtrain.loc = ItemGetter_loc(eventtrain)
-                eventtrain.iloc = ItemGetter_iloc(eventtrain)
-                return eventtrain
-        else:  # most likely slice indexing
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    support = self.support[idx]
-                    time = self._restrict_to_epoch_array_fast(
-                        epocharray=support,
-                        time=self.time,
-                        copyover=True
-                        )
-                    eventtrain = EventArray(empty=True)
-                    exclude = ["_time", "_support"]
-                    attrs = (x for x in self.__attributes__ if x not in exclude)
-                    for attr in attrs:
-                        exec("eventtrain." + attr + " = self." + attr)
-                    eventtrain._time = time
-                    eventtrain._support = support
-                    eventtrain.loc = ItemGetter_loc(eventtrain)
-                    eventtrain.iloc = ItemGetter_iloc(eventtrain)
-                return eventtrain
-            except Exception:
-                raise TypeError(
-                    'unsupported subsctipting type {}'.format(type(idx)))
+                    time=self._time,
+                    values=self._values,
+                    source_idx=self._source_idx)
+            eventtrain._support = support
+            eventtrain.loc = ItemGetter_loc(eventtrain)
+            eventtrain.iloc = ItemGetter_iloc(eventtrain)
+        return eventtrain
 
+    def _select_sources(self, source_idx_list):
+        """Keep only the events of the sources in source_idx_list, which
+        become sources 0, 1, ... (in that order). In-place."""
+        source_idx_list = np.atleast_1d(np.asarray(source_idx_list, dtype=int))
+        new_idx = np.full(self.n_sources, -1, dtype=int)
+        new_idx[source_idx_list] = np.arange(len(source_idx_list))
+        new_idx = new_idx[self._source_idx]
+        keep = new_idx >= 0
+        self._time = self._time[keep]
+        self._values = self._values[keep]
+        self._source_idx = new_idx[keep]
+        self._n_sources = len(source_idx_list)
 
     def __getitem__(self, idx):
         """EventArray index access.
@@ -1494,17 +1483,16 @@ class ValueEventArray(EventBase):
     def isempty(self):
         """(bool) Empty EventArray."""
         try:
-            return np.sum([len(evt) for evt in self.time]) == 0
+            return len(self._time) == 0
         except TypeError:
-            return True  # this happens when self.time == None
+            return True  # this happens when self._time == None
 
     @property
     def n_sources(self):
         """(int) The number of sources."""
-        try:
-            return utils.PrettyInt(len(self.time))
-        except TypeError:
+        if self._n_sources is None:
             return 0
+        return utils.PrettyInt(self._n_sources)
 
     @property
     def n_active(self):
@@ -1517,126 +1505,122 @@ class ValueEventArray(EventBase):
         return utils.PrettyInt(np.count_nonzero(self.n_events))
 
     def _copy_without_data(self):
-        """Return a copy of self, without event times."""
-        raise NotImplementedError
+        """Return a copy of self, without event times, values and sources."""
         out = copy.copy(self) # shallow copy
         out._time = None
-        out = copy.deepcopy(self) # just to be on the safe side, but at least now we are not copying the data!
-
+        out._values = None
+        out._source_idx = None
+        out = copy.deepcopy(out) # just to be on the safe side, but at least now we are not copying the data!
         return out
 
     @staticmethod
-    def _restrict_to_epoch_array_fast(epocharray, time, value, copyover=True):
-        """Return time and values restricted to an EpochArray.
+    def _restrict_to_epoch_array_fast(epocharray, time, values, source_idx):
+        """Return time, values and source_idx restricted to an EpochArray.
 
-        This function assumes sorted event times, so that binary search can
-        be used to quickly identify slices that should be kept in the
-        restriction. It does not check every event time.
+        Event times are sorted, so that a single binary search of all epoch
+        boundaries identifies the events to keep, which are then gathered
+        with one fancy indexing operation.
 
         Parameters
         ----------
         epocharray : EpochArray
-        time : array-like
-        values : array-like
+        time : np.array of shape (n_events,)
+            Sorted event times.
+        values : np.array of shape (n_events,)
+        source_idx : np.array of shape (n_events,)
         """
-        raise NotImplementedError
         if epocharray.isempty:
-            n_sources = len(time)
-            time = np.zeros((n_sources,0))
-            return time
+            return time[:0], values[:0], source_idx[:0]
 
-        singlesource = len(time)==1  # bool
+        # (start, stop) event indices of all epochs, in a single pass:
+        indices = np.searchsorted(time, np.atleast_2d(epocharray.time))
+        lengths = np.maximum(indices[:,1] - indices[:,0], 0)
+        if lengths.sum() < len(time):
+            warnings.warn(
+                'ignoring events outside of eventtrain support')
 
-        # TODO: is this copy even necessary?
-        if copyover:
-            time = copy.copy(time)
+        cum_lengths = np.insert(np.cumsum(lengths), 0, 0)
+        idx = np.arange(cum_lengths[-1]) + np.repeat(indices[:,0] - cum_lengths[:-1], lengths)
+        return time[idx], values[idx], source_idx[idx]
 
-        # NOTE: this used to assume multiple sources for the enumeration to work
-        for source, st_time in enumerate(time):
-            indices = []
-            for eptime in epocharray.time:
-                t_start = eptime[0]
-                t_stop = eptime[1]
-                frm, to = np.searchsorted(st_time, (t_start, t_stop))
-                indices.append((frm, to))
-            indices = np.array(indices, ndmin=2)
-            if np.diff(indices).sum() < len(st_time):
-                warnings.warn(
-                    'ignoring events outside of eventtrain support')
-            if singlesource:
-                time_list = []
-                for start, stop in indices:
-                    time_list.extend(st_time[start:stop])
-                time = np.array(time_list, ndmin=2)
-            else:
-                # here we have to do some annoying conversion between
-                # arrays and lists to fully support jagged array
-                # mutation
-                time_list = []
-                for start, stop in indices:
-                    time_list.extend(st_time[start:stop])
-                time_ = time.tolist()
-                time_[source] = np.array(time_list)
-                time = np.array(time_)
-        return time
+    def bin(self, *, ds=None, reduce='sum'):
+        """Aggregate the event values of each source in time bins.
 
-    @staticmethod
-    def _restrict_to_epoch_array(epocharray, time, copyover=True):
-        """Return time restricted to an EpochArray.
-
-        This function is quite slow, as it checks each event time for inclusion.
-        It does this in a vectorized form, which is fast for small or moderately
-        sized objects, but the memory penalty can be large, and it becomes very
-        slow for large objects. Consequently, _restrict_to_epoch_array_fast
-        should be used when possible.
+        Bins are defined within each epoch of the support, starting at the
+        start of the epoch, for as many bins as fit entirely inside the
+        epoch (as for BinnedSpikeTrainArray).
 
         Parameters
         ----------
-        epocharray : EpochArray
-        time : array-like
-        """
-        raise NotImplementedError
-        if epocharray.isempty:
-            n_sources = len(time)
-            time = np.zeros((n_sources,0))
-            return time
-
-        singlesource = len(time)==1  # bool
+        ds : float, optional
+            Bin width, in seconds. Default is 1/fs.
+        reduce : string, optional
+            One of ['sum', 'mean', 'max']. Empty bins are 0 for 'sum', and
+            np.nan otherwise. Default is 'sum'.
 
-        # TODO: is this copy even necessary?
-        if copyover:
-            time = copy.copy(time)
+        Returns
+        -------
+        out : AnalogSignalArray
+            Binned values with shape (n_sources, n_bins), sampled at the bin
+            centers (with fs = 1/ds), and supported on the binned epochs.
+        """
+        if ds is None:
+            ds = 1/self.fs
+        if ds <= 0:
+            raise ValueError("bin width ds must be positive!")
+        if reduce not in ['sum', 'mean', 'max']:
+            raise ValueError("reduce '{}' not understood!".format(reduce))
+
+        starts = np.atleast_1d(self.support.starts)
+        stops = np.atleast_1d(self.support.stops)
+        n_bins = np.floor((stops - starts) / ds).astype(int)
+        if np.any(n_bins < 1):
+            warnings.warn(
+                "epoch duration is less than bin size: ignoring...")
+            n_bins = np.maximum(n_bins, 0)
+        bin_offsets = np.insert(np.cumsum(n_bins), 0, 0)
+        n_total = bin_offsets[-1]
+        if n_total == 0:
+            return core.AnalogSignalArray(empty=True)
+
+        # left bin edges of all epochs, and the bin of every event:
+        left = np.repeat(starts, n_bins) + (np.arange(n_total) - np.repeat(bin_offsets[:-1], n_bins))*ds
+        bin_idx = np.searchsorted(left, self._time, side='right') - 1
+        valid = (bin_idx >= 0) & (self._time < left[np.maximum(bin_idx, 0)] + ds)
+        flat_idx = self._source_idx[valid]*n_total + bin_idx[valid]
+        values = self._values[valid]
+        size = self.n_sources*n_total
+
+        if reduce == 'max':
+            data = np.full(size, np.nan)
+            if flat_idx.size:
+                order = np.argsort(flat_idx, kind='mergesort')
+                flat_idx = flat_idx[order]
+                group_starts = np.flatnonzero(np.insert(np.diff(flat_idx) != 0, 0, True))
+                data[flat_idx[group_starts]] = np.maximum.reduceat(values[order], group_starts)
+        else:
+            data = np.bincount(flat_idx, weights=values, minlength=size)
+            if reduce == 'mean':
+                counts = np.bincount(flat_idx, minlength=size)
+                with np.errstate(invalid='ignore'):
+                    data = data / counts
 
-        # NOTE: this used to assume multiple sources for the enumeration to work
-        for source, st_time in enumerate(time):
-            indices = []
-            for eptime in epocharray.time:
-                t_start = eptime[0]
-                t_stop = eptime[1]
-                indices.append((st_time >= t_start) & (st_time < t_stop))
-            indices = np.any(np.column_stack(indices), axis=1)
-            if np.count_nonzero(indices) < len(st_time):
-                warnings.warn(
-                    'ignoring events outside of eventtrain support')
-            if singlesource:
-                time = np.array([time[0][indices]], ndmin=2)
-            else:
-                # here we have to do some annoying conversion between
-                # arrays and lists to fully support jagged array
-                # mutation
-                time_ = time.tolist()
-                time_[source] = np.array(time_[source])
-                time_[source] = time_[source][indices]
-                time = np.array(time_)
-        return time
+        support = core.EpochArray(np.column_stack((starts, starts + n_bins*ds))[n_bins > 0])
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            out = core.AnalogSignalArray(data.reshape(self.n_sources, n_total),
+                                         timestamps=left + ds/2,
+                                         fs=1/ds,
+                                         support=support,
+                                         labels=self.source_labels)
+        return out
 
     def __repr__(self):
-        raise NotImplementedError
         address_str = " at " + str(hex(id(self)))
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             if self.isempty:
-                return "<empty EventArray" + address_str + ">"
+                return "<empty ValueEventArray" + address_str + ">"
             if self.support.n_epochs > 1:
                 epstr = " ({} segments)".format(self.support.n_epochs)
             else:
@@ -1650,28 +1634,52 @@ class ValueEventArray(EventBase):
             else:
                 labelstr = ""
             numstr = " %s sources" % self.n_sources
-        return "<EventArray%s:%s%s>%s%s" % (address_str, numstr, epstr, fsstr, labelstr)
+        return "<ValueEventArray%s:%s%s>%s%s" % (address_str, numstr, epstr, fsstr, labelstr)
+
+    def _per_source(self, data):
+        """Split flat (time-sorted) event data into per-source arrays."""
+        order = np.argsort(self._source_idx, kind='mergesort')
+        splits = np.cumsum(np.bincount(self._source_idx, minlength=self.n_sources))[:-1]
+        out = np.empty(self.n_sources, dtype=object)
+        for source, source_data in enumerate(np.split(data[order], splits)):
+            out[source] = source_data
+        return out
+
+    @property
+    def columns(self):
+        """(EventColumns) Flat, time-sorted event times, values and source
+        indices of all events."""
+        return EventColumns(time=self._time,
+                            values=self._values,
+                            source_idx=self._source_idx)
 
     @property
     def time(self):
-        """Event times in seconds."""
-        return self._time
+        """Event times in seconds, per source."""
+        if self._time is None:
+            return None
+        return self._per_source(self._time)
+
+    @property
+    def values(self):
+        """Event values, per source."""
+        if self._values is None:
+            return None
+        return self._per_source(self._values)
 
     @property
     def n_events(self):
         """(np.array) The number of events in each source."""
         if self.isempty:
             return 0
-        return np.array([len(source) for source in self.time])
+        return np.bincount(self._source_idx, minlength=self.n_sources)
 
     @property
     def issorted(self):
         """(bool) Sorted EventArray."""
         if self.isempty:
             return True
-        return np.array(
-            [utils.is_sorted(eventtrain) for eventtrain in self.time]
-            ).all()
+        return utils.is_sorted(self._time)
 
     def _reorder_sources_by_idx(self, neworder, inplace=False):
         """Reorder sources according to a specified order.
@@ -1682,22 +1690,19 @@ class ValueEventArray(EventBase):
         ------
         out : reordered EventArray
         """
-        raise NotImplementedError
-
         if inplace:
             out = self
         else:
             out = copy.deepcopy(self)
 
-        oldorder = list(range(len(neworder)))
-        for oi, ni in enumerate(neworder):
-            frm = oldorder.index(ni)
-            to = oi
-            utils.swap_rows(out._time, frm, to)
-            out._source_ids[frm], out._source_ids[to] = out._source_ids[to], out._source_ids[frm]
-            out._source_labels[frm], out._source_labels[to] = out._source_labels[to], out._source_labels[frm]
-            # TODO: re-build source tags (tag system not yet implemented)
-            oldorder[frm], oldorder[to] = oldorder[to], oldorder[frm]
+        neworder = np.asarray(neworder, dtype=int)
+        new_idx = np.empty(len(neworder), dtype=int)
+        new_idx[neworder] = np.arange(len(neworder))
+        out._source_idx = new_idx[out._source_idx]
+        # index the lists directly; np.asarray would coerce mixed-type ids:
+        out._source_ids = [out._source_ids[ii] for ii in neworder]
+        out._source_labels = [out._source_labels[ii] for ii in neworder]
+        # TODO: re-build source tags (tag system not yet implemented)
         out.loc = ItemGetter_loc(out)
         out.iloc = ItemGetter_iloc(out)
         return out
@@ -1712,27 +1717,8 @@ class ValueEventArray(EventBase):
         ------
         out : reordered EventArray
         """
-        raise NotImplementedError
-        if inplace:
-            out = self
-        else:
-            out = copy.deepcopy(self)
-
         neworder = [self.source_ids.index(x) for x in neworder]
-
-        oldorder = list(range(len(neworder)))
-        for oi, ni in enumerate(neworder):
-            frm = oldorder.index(ni)
-            to = oi
-            utils.swap_rows(out._time, frm, to)
-            out._source_ids[frm], out._source_ids[to] = out._source_ids[to], out._source_ids[frm]
-            out._source_labels[frm], out._source_labels[to] = out._source_labels[to], out._source_labels[frm]
-            # TODO: re-build source tags (tag system not yet implemented)
-            oldorder[frm], oldorder[to] = oldorder[to], oldorder[frm]
-
-        out.loc = ItemGetter_loc(out)
-        out.iloc = ItemGetter_iloc(out)
-        return out
+        return self._reorder_sources_by_idx(neworder, inplace=inplace)
 
 #----------------------------------------------------------------------#
 #======================================================================#
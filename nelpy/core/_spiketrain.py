@@ -10,6 +10,8 @@ from abc import ABC, abstractmethod
 from .. import core
 from .. import utils
 from .. import version
+from ..utils_ import copying
+from ..utils_ import cache
 
 # Force warnings.warn() to omit the source code line in the message
 formatwarning_orig = warnings.formatwarning
@@ -282,6 +284,12 @@ class SpikeTrain(ABC):
         """
         return
 
+    @property
+    def fingerprint(self):
+        """(str) Content fingerprint, i.e., a hash of the data buffers plus
+        metadata, used to key cached results (see nelpy.utils_.cache)."""
+        return cache._content_fingerprint(self)
+
     @abstractmethod
     def isempty(self):
         """(bool) Empty SpikeTrain."""
@@ -663,10 +671,14 @@ class SpikeTrainArray(SpikeTrain):
         """Return a copy of self, without event times."""
         out = copy.copy(self) # shallow copy
         out._time = None
-        out = copy.deepcopy(self) # just to be on the safe side, but at least now we are not copying the data!
+        out = copy.deepcopy(out) # just to be on the safe side, but at least now we are not copying the data!
 
         return out
 
+    def __deepcopy__(self, memo):
+        """Deep copy (see nelpy.utils_.copying)."""
+        return copying.deepcopy(self, memo)
+
     def copy(self):
         """Returns a copy of the SpikeTrainArray."""
         newcopy = copy.deepcopy(self)
@@ -995,6 +1007,7 @@ class SpikeTrainArray(SpikeTrain):
             numstr = " %s units" % self.n_units
         return "<SpikeTrainArray%s:%s%s>%s%s" % (address_str, numstr, epstr, fsstr, labelstr)
 
+    @cache.memoize
     def bin(self, *, ds=None):
         """Return a binned spiketrain array."""
         return BinnedSpikeTrainArray(self, ds=ds)
@@ -1247,12 +1260,9 @@ class BinnedSpikeTrainArray(SpikeTrain):
 
     def _copy_without_data(self):
         """Returns a copy of the BinnedSpikeTrainArray, without data."""
-        out = copy.copy(self) # shallow copy
-        out._bin_centers = None
-        out._binnedSupport = None
-        out._bins = None
+        out = copying.copy_without(self, '_bin_centers', '_binnedSupport',
+                                   '_bins', '_data')
         out._data = np.zeros((self.n_units,0))
-        out = copy.deepcopy(out) # just to be on the safe side, but at least now we are not copying the data!
         out.__renew__()
         return out
 
@@ -1261,6 +1271,11 @@ class BinnedSpikeTrainArray(SpikeTrain):
         self.loc = ItemGetter_loc(self)
         self.iloc = ItemGetter_iloc(self)
 
+    def __deepcopy__(self, memo):
+        """Deep copy, in which binned data, bins and bin centers are copied
+        directly."""
+        return copying.deepcopy(self, memo)
+
     def copy(self):
         """Returns a copy of the BinnedSpikeTrainArray."""
         newcopy = copy.deepcopy(self)
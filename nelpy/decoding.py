@@ -1,15 +1,21 @@
 """Bayesian encoding and decoding"""
 
-__all__ = ['decode1D',
+__all__ = ['BayesianDecoder',
+           'StreamingDecoder',
+           'decode1D',
            'decode2D',
            'k_fold_cross_validation',
+           'cross_validated_tuningcurves',
            'cumulative_dist_decoding_error_using_xval',
            'cumulative_dist_decoding_error',
            'get_mode_pth_from_array',
            'get_mean_pth_from_array']
 
+import numbers
 import numpy as np
+from collections import OrderedDict
 from . import auxiliary
+from .utils_ import cache
 
 def get_mode_pth_from_array(posterior, tuningcurve=None):
     """If tuningcurve is provided, then we map it back to the external coordinates / units.
@@ -58,6 +64,575 @@ def get_mean_pth_from_array(posterior, tuningcurve=None):
 
     return mean_pth
 
+def _decoding_windows(lengths, w):
+    """Return the (left, right) bin index bounds of the decoding window of
+    every posterior bin, and the cumulative posterior lengths.
+
+    Every epoch of length L yields max(1, L - w + 1) windows of w bins; an
+    epoch shorter than w yields one window that spans the whole epoch.
+    """
+    lengths = np.atleast_1d(lengths).astype(int)
+    epoch_starts = np.insert(np.cumsum(lengths), 0, 0)
+    posterior_lengths = np.maximum(1, lengths - w + 1)
+    cum_posterior_lengths = np.insert(np.cumsum(posterior_lengths), 0, 0)
+
+    epoch_idx = np.repeat(np.arange(len(lengths)), posterior_lengths)
+    offsets = np.arange(cum_posterior_lengths[-1]) - cum_posterior_lengths[epoch_idx]
+    left = epoch_starts[epoch_idx] + offsets
+    right = np.minimum(left + w, epoch_starts[epoch_idx + 1])
+
+    return left, right, cum_posterior_lengths
+
+def _normalize_log_posterior(log_posterior):
+    """Normalize (unnormalized) log posteriors with shape (..., n_ext, n)
+    in place, using the log-sum-exp trick, and return them."""
+    # see http://timvieira.github.io/blog/post/2014/02/11/exp-normalize-trick/
+    with np.errstate(invalid='ignore'):
+        log_posterior -= log_posterior.max(axis=-2, keepdims=True)
+    np.exp(log_posterior, out=log_posterior)
+    log_posterior /= log_posterior.sum(axis=-2, keepdims=True)
+    return log_posterior
+
+def _log_likelihood_chunks(data, lengths, lfx, eterm, *, w, chunk_size=None):
+    """Generates (start, stop, obs, log_likelihood) for consecutive chunks
+    of posterior bins, where obs are the windowed spike counts with shape
+    (..., n_units, stop - start), and log_likelihood the Poisson
+    log-likelihoods (up to a constant) with shape (..., n_ext, stop - start).
+
+    The spike counts of all windows in a chunk are formed at once by
+    cumulative-sum differencing, and the log-likelihoods by a single
+    (batched) matrix product with the log ratemap.
+
+    Parameters
+    ----------
+    data : array of shape (..., n_units, n_tbins)
+        Spike counts, or a batch of spike count matrices.
+    lengths : array
+        Number of time bins of every epoch.
+    lfx : array of shape (n_units, n_ext)
+        Log ratemap (in log Hz).
+    eterm : array of shape (n_ext,)
+        Expected spike count term, -ratemap.sum(axis=0)*ds*w.
+    w : int
+        Number of time bins per decoding window.
+    chunk_size : int, optional
+        Number of posterior bins per chunk. Default is chosen such that the
+        windowed spike counts of a chunk hold about 4 million values.
+    """
+    left, right, _ = _decoding_windows(lengths, w)
+    n_units, n_ext = lfx.shape
+    if chunk_size is None:
+        n_batch = int(np.prod(data.shape[:-2]))
+        chunk_size = max(1, 2**22 // (n_batch*max(n_units, n_ext)))
+
+    for start in range(0, len(left), chunk_size):
+        stop = min(start + chunk_size, len(left))
+        lo, hi = left[start], right[stop-1]
+        if w == 1:
+            obs = np.asarray(data[..., lo:hi], dtype=float)
+        else:
+            # cumulative counts, with a column of zeros prepended:
+            datacum = np.zeros(data.shape[:-1] + (hi - lo + 1,))
+            np.cumsum(data[..., lo:hi], axis=-1, out=datacum[..., 1:])
+            obs = datacum[..., right[start:stop] - lo] - datacum[..., left[start:stop] - lo]
+
+        log_likelihood = lfx.T @ obs
+        log_likelihood += eterm[:, np.newaxis]
+
+        yield start, stop, obs, log_likelihood
+
+def _decode_chunks(data, lengths, lfx, eterm, *, w, nospk_prior,
+                   skip_empty_bins, chunk_size=None):
+    """Generates (start, stop, posterior) for consecutive chunks of
+    posterior bins, where posterior has shape (..., n_ext, stop - start).
+
+    See _log_likelihood_chunks for the parameters; nospk_prior, with shape
+    (n_ext,), is the log posterior used for windows without spikes, if
+    skip_empty_bins.
+    """
+    for start, stop, obs, log_posterior in _log_likelihood_chunks(
+            data, lengths, lfx, eterm, w=w, chunk_size=chunk_size):
+        if skip_empty_bins:
+            # no spikes to decode in window!
+            empty = obs.sum(axis=-2, keepdims=True) == 0
+            np.copyto(log_posterior, nospk_prior[:, np.newaxis], where=empty)
+
+        yield start, stop, _normalize_log_posterior(log_posterior)
+
+class BayesianDecoder(object):
+    """Memoryless Bayesian decoder with a Poisson likelihood, for decoding
+    many (batches of) spike count matrices with the same tuning curve.
+
+    The log ratemap, the expected spike count term, and the unit order of
+    every set of unit_ids decoded are computed once, and reused by every
+    call, e.g., when scoring thousands of replay events and their shuffles.
+
+    Parameters
+    ----------
+    tuningcurve : TuningCurve1D or array_like
+        Tuning curve, or firing rate map with shape (n_units, n_ext), where
+        n_ext is the number of external correlates, e.g., position bins.
+        The rate map is in spks/second.
+    ds : float
+        Bin size (in seconds) of the spike counts to be decoded.
+    w : int, optional
+        Number of bins per decoding window. Default is 1.
+    nospk_prior : array_like, optional
+        Prior distribution over external correlates with shape (n_ext,)
+        that will be used if no spikes are observed in a decoding window
+        Default is np.nan.
+        If nospk_prior is any scalar, then a uniform prior is assumed.
+
+    Attributes
+    ----------
+    ratemap : np.array
+        Firing rate map with shape (n_units, n_ext).
+    unit_ids : list
+        Unit ids of the rows of ratemap, or None if an array was passed.
+    bin_centers : np.array
+        Centers of the external bins (bin indices if an array was passed).
+    """
+
+    # number of (most recently used) unit orders whose model terms are kept
+    _max_unit_orders = 16
+
+    def __init__(self, tuningcurve, ds, w=1, *, nospk_prior=None):
+
+        if w is None:
+            w=1
+        assert float(w).is_integer(), "w must be a positive integer!"
+        assert w > 0, "w must be a positive integer!"
+
+        if isinstance(tuningcurve, auxiliary.TuningCurve1D):
+            ratemap = tuningcurve.ratemap
+            self._unit_ids = list(tuningcurve.unit_ids)
+            self._xmax = tuningcurve.bins[-1]
+            self._bin_centers = tuningcurve.bin_centers
+        else:
+            ratemap = np.asarray(tuningcurve)
+            self._unit_ids = None
+            self._xmax = ratemap.shape[1]
+            self._bin_centers = np.arange(ratemap.shape[1])
+
+        n_units, n_xbins = ratemap.shape
+
+        if nospk_prior is None:
+            nospk_prior = np.full(n_xbins, np.nan)
+        elif isinstance(nospk_prior, numbers.Number):
+            nospk_prior = np.full(n_xbins, 1.0)
+
+        assert nospk_prior.shape[0] == n_xbins, "prior must have length {}".format(n_xbins)
+        assert nospk_prior.size == n_xbins, "prior must be a 1D array with length {}".format(n_xbins)
+
+        self._ratemap = ratemap
+        self._ds = ds
+        self._w = int(w)
+        self._nospk_prior = nospk_prior
+        self._lfx = np.log(ratemap)
+        self._eterm = -ratemap.sum(axis=0)*ds*self._w
+        self._unit_terms = OrderedDict() # (lfx, eterm) of other unit orders
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        return "<BayesianDecoder%s: %s units, %s bins, ds=%s, w=%s>" % (
+            address_str, self.n_units, self.n_xbins, self._ds, self._w)
+
+    @property
+    def ratemap(self):
+        """(np.array) Firing rate map with shape (n_units, n_ext)."""
+        return self._ratemap
+
+    @property
+    def unit_ids(self):
+        """(list) Unit ids of the rows of ratemap."""
+        return self._unit_ids
+
+    @property
+    def bin_centers(self):
+        """(np.array) Centers of the external bins."""
+        return self._bin_centers
+
+    @property
+    def n_units(self):
+        """(int) Number of units."""
+        return self._ratemap.shape[0]
+
+    @property
+    def n_xbins(self):
+        """(int) Number of external bins."""
+        return self._ratemap.shape[1]
+
+    @property
+    def ds(self):
+        """(float) Bin size (in seconds) of the decoded spike counts."""
+        return self._ds
+
+    @property
+    def w(self):
+        """(int) Number of bins per decoding window."""
+        return self._w
+
+    def _model_terms(self, unit_ids=None):
+        """Return the log ratemap and the expected spike count term of the
+        units unit_ids, in that order."""
+        if unit_ids is None or self._unit_ids is None:
+            return self._lfx, self._eterm
+        unit_ids = tuple(unit_ids)
+        if unit_ids == tuple(self._unit_ids):
+            return self._lfx, self._eterm
+        if unit_ids in self._unit_terms:
+            self._unit_terms.move_to_end(unit_ids)
+            return self._unit_terms[unit_ids]
+        try:
+            order = [self._unit_ids.index(unit_id) for unit_id in unit_ids]
+        except ValueError:
+            raise ValueError("all unit_ids must be in the tuning curve!")
+        ratemap = self._ratemap[order]
+        self._unit_terms[unit_ids] = (self._lfx[order],
+                                      -ratemap.sum(axis=0)*self._ds*self._w)
+        while len(self._unit_terms) > self._max_unit_orders:
+            self._unit_terms.popitem(last=False)
+        return self._unit_terms[unit_ids]
+
+    def _check_ds(self, ds):
+        """Raise a ValueError if counts with bin size ds cannot be decoded."""
+        if ds is not None and not np.isclose(ds, self._ds):
+            raise ValueError("counts have bin size ds={}, but the decoder "
+                             "expects ds={}!".format(ds, self._ds))
+
+    def _check_counts(self, counts, lengths, lfx):
+        """Return counts as an array with shape (..., n_units, n_bins), and
+        the epoch lengths."""
+        counts = np.asarray(counts)
+        if counts.ndim < 2:
+            raise ValueError("counts must have shape (..., n_units, n_bins)!")
+        if counts.shape[-2] != lfx.shape[0]:
+            raise ValueError("counts must have {} units, but has {}!".format(
+                lfx.shape[0], counts.shape[-2]))
+        if lengths is None:
+            lengths = [counts.shape[-1]]
+        lengths = np.atleast_1d(lengths).astype(int)
+        if lengths.sum() != counts.shape[-1]:
+            raise ValueError("lengths must sum to the number of bins!")
+        return counts, lengths
+
+    def log_likelihood(self, counts, lengths=None, *, unit_ids=None, chunk_size=None):
+        """Poisson log-likelihood (up to an additive constant) of every
+        external bin, for every decoding window of counts.
+
+        Parameters
+        ----------
+        counts : array_like
+            Spike counts with shape (n_units, n_bins), or a batch of count
+            matrices (e.g., surrogates) with shape (..., n_units, n_bins).
+        lengths : array_like, optional
+            Number of bins of every epoch in counts. Decoding windows never
+            straddle epochs. Default is a single epoch.
+        unit_ids : list, optional
+            Unit ids of the rows of counts. Default is the unit order of the
+            tuning curve.
+        chunk_size : int, optional
+            Number of posterior bins computed at a time.
+
+        Returns
+        -------
+        log_likelihood : array
+            Log-likelihoods with shape (..., n_ext, n_posterior_bins).
+        """
+        lfx, eterm = self._model_terms(unit_ids)
+        counts, lengths = self._check_counts(counts, lengths, lfx)
+        _, _, cum_posterior_lengths = _decoding_windows(lengths, self._w)
+        out = np.zeros(counts.shape[:-2] + (self.n_xbins, cum_posterior_lengths[-1]))
+        for start, stop, _, chunk in _log_likelihood_chunks(
+                counts, lengths, lfx, eterm, w=self._w, chunk_size=chunk_size):
+            out[..., start:stop] = chunk
+        return out
+
+    def decode_counts(self, counts, lengths=None, *, unit_ids=None,
+                      skip_empty_bins=True, chunk_size=None, ds=None):
+        """Posterior distributions of every decoding window of counts.
+
+        Takes the same parameters as log_likelihood. If skip_empty_bins,
+        windows without spikes get the nospk_prior. If the bin size ds (in
+        seconds) of counts is passed, a ValueError is raised unless it
+        matches the ds of the decoder.
+
+        Returns
+        -------
+        posterior : array
+            Posterior distributions with shape (..., n_ext, n_posterior_bins).
+        """
+        self._check_ds(ds)
+        lfx, eterm = self._model_terms(unit_ids)
+        counts, lengths = self._check_counts(counts, lengths, lfx)
+        _, _, cum_posterior_lengths = _decoding_windows(lengths, self._w)
+        out = np.zeros(counts.shape[:-2] + (self.n_xbins, cum_posterior_lengths[-1]))
+        for start, stop, chunk in _decode_chunks(
+                counts, lengths, lfx, eterm, w=self._w,
+                nospk_prior=self._nospk_prior, skip_empty_bins=skip_empty_bins,
+                chunk_size=chunk_size):
+            out[..., start:stop] = chunk
+        return out
+
+    def decode_surrogates(self, counts, lengths=None, *, unit_ids=None,
+                          skip_empty_bins=True, max_bytes=2**28):
+        """Posterior distributions of a stack of surrogate (e.g., shuffled)
+        count matrices.
+
+        Consecutive blocks of surrogates are decoded by a single batched
+        matrix product each, with as many surrogates per block as fit into
+        the memory budget max_bytes.
+
+        Parameters
+        ----------
+        counts : array_like
+            Spike counts with shape (n_shuffles, n_units, n_bins).
+        lengths, unit_ids, skip_empty_bins :
+            See decode_counts.
+        max_bytes : int, optional
+            Approximate memory budget (in bytes) of the intermediate arrays
+            of each block. Default is 256 MiB.
+
+        Returns
+        -------
+        posterior : array
+            Posterior distributions with shape (n_shuffles, n_ext,
+            n_posterior_bins).
+        """
+        lfx, eterm = self._model_terms(unit_ids)
+        counts, lengths = self._check_counts(counts, lengths, lfx)
+        if counts.ndim != 3:
+            raise ValueError("counts must have shape (n_shuffles, n_units, n_bins)!")
+        n_shuffles, n_units, n_bins = counts.shape
+        _, _, cum_posterior_lengths = _decoding_windows(lengths, self._w)
+        n_posterior_bins = cum_posterior_lengths[-1]
+
+        # bytes per surrogate of the windowed and cumulative counts, and of
+        # the log posterior:
+        bytes_per_bin = 8*(2*n_units + self.n_xbins)
+        bytes_per_shuffle = bytes_per_bin*max(n_bins + 1, n_posterior_bins)
+        if bytes_per_shuffle <= max_bytes:
+            block_size = max_bytes // bytes_per_shuffle
+            chunk_size = n_posterior_bins
+        else:
+            # a single surrogate does not fit, so we chunk in time instead
+            block_size = 1
+            chunk_size = max(1, max_bytes // bytes_per_bin)
+
+        out = np.zeros((n_shuffles, self.n_xbins, n_posterior_bins))
+        for block in range(0, n_shuffles, block_size):
+            block_counts = counts[block:block+block_size]
+            for start, stop, chunk in _decode_chunks(
+                    block_counts, lengths, lfx, eterm, w=self._w,
+                    nospk_prior=self._nospk_prior,
+                    skip_empty_bins=skip_empty_bins, chunk_size=chunk_size):
+                out[block:block+block_size, :, start:stop] = chunk
+        return out
+
+    def decode(self, bst, *, skip_empty_bins=True):
+        """Decode a BinnedSpikeTrainArray, which must have the same bin size
+        ds as the decoder (otherwise a ValueError is raised).
+
+        Returns
+        -------
+        posteriors : array
+            Posterior distribution with shape (n_ext, n_posterior_bins),
+            where n_posterior bins <= bst.n_bins, but depends on w and the
+            event lengths.
+        cum_posterior_lengths : array
+        mode_pth : array
+        mean_pth : array
+        """
+        # if we decode using multiple bins at a time (w>1) then windows may
+        # not straddle epoch boundaries; an epoch shorter than w is decoded
+        # as a single window, ignoring the scaling problem where the window
+        # size is now possibly less than bst.ds*w
+        unit_ids = bst.unit_ids if self._unit_ids is not None else None
+        posterior = self.decode_counts(bst.data, bst.lengths, unit_ids=unit_ids,
+                                       skip_empty_bins=skip_empty_bins,
+                                       ds=bst.ds)
+        _, _, cum_posterior_lengths = _decoding_windows(bst.lengths, self._w)
+
+        # TODO: what was my rationale behid the following? Why not use bin centers?
+        # _, bins = np.histogram([], bins=n_xbins, range=(xmin,xmax))
+        # xbins = (bins + xmax/n_xbins)[:-1]
+
+        mode_pth = np.argmax(posterior, axis=0)*self._xmax/self.n_xbins
+        mode_pth = np.where(np.isnan(posterior.sum(axis=0)), np.nan, mode_pth)
+        mean_pth = (self._bin_centers * posterior.T).sum(axis=1)
+        return posterior, cum_posterior_lengths, mode_pth, mean_pth
+
+class StreamingDecoder(BayesianDecoder):
+    """Online Bayesian decoder, which decodes spike counts (or spike times)
+    as they arrive, e.g., for closed-loop experiments.
+
+    The counts of the last w bins are tracked by a ring buffer of w + 1
+    cumulative count vectors, so that every new bin is decoded with a
+    single (sparse) vector-matrix product of O(n_units * n_ext), and
+    without ever building a BinnedSpikeTrainArray.
+
+    While fewer than w bins have been seen, the window only spans the bins
+    seen so far, and the expected spike count term is scaled accordingly.
+
+    Parameters
+    ----------
+    tuningcurve : TuningCurve1D or array_like
+        Tuning curve, or firing rate map with shape (n_units, n_ext).
+    ds : float
+        Bin size (in seconds).
+    w : int, optional
+        Number of bins per decoding window. Default is 1.
+    nospk_prior : array_like, optional
+        See BayesianDecoder.
+    unit_ids : list, optional
+        Unit ids of the rows of the streamed counts. Default is the unit
+        order of the tuning curve.
+    t0 : float, optional
+        Start time (in seconds) of the first bin, used by update_spikes.
+        Default is 0.
+    """
+
+    def __init__(self, tuningcurve, ds, w=1, *, nospk_prior=None,
+                 unit_ids=None, t0=0):
+        super().__init__(tuningcurve, ds, w, nospk_prior=nospk_prior)
+        lfx, eterm = self._model_terms(unit_ids)
+        if unit_ids is None:
+            unit_ids = self._unit_ids if self._unit_ids is not None else range(self.n_units)
+        self._stream_lfx = lfx
+        self._stream_eterm = eterm / self._w # per bin
+        self._unit_index = {unit_id: ii for ii, unit_id in enumerate(unit_ids)}
+        self._t0 = t0
+        self.reset()
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        return "<StreamingDecoder%s: %s units, %s bins, ds=%s, w=%s, t=%s>" % (
+            address_str, len(self._unit_index), self.n_xbins, self._ds,
+            self._w, self.time)
+
+    def reset(self):
+        """Forget all streamed spikes, and restart at t0."""
+        self._cumcounts = np.zeros((self._w + 1, len(self._unit_index)))
+        self._head = 0
+        self._n_window = 0
+        self._n_bins = 0
+        self._pending_times = np.array([])
+        self._pending_units = np.array([], dtype=int)
+
+    @property
+    def time(self):
+        """(float) Start time of the next bin."""
+        return self._t0 + self._n_bins*self._ds
+
+    def _decode_next(self, counts, out):
+        """Push the counts of one bin into the ring buffer, and write the
+        posterior of the resulting window into out."""
+        previous = self._cumcounts[self._head]
+        self._head = (self._head + 1) % (self._w + 1)
+        np.add(previous, counts, out=self._cumcounts[self._head])
+        self._n_window = min(self._n_window + 1, self._w)
+        obs = (self._cumcounts[self._head]
+               - self._cumcounts[(self._head - self._n_window) % (self._w + 1)])
+
+        active = np.flatnonzero(obs)
+        if len(active) == 0:
+            # no spikes to decode in window!
+            out[:] = self._nospk_prior
+        else:
+            np.dot(obs[active], self._stream_lfx[active], out=out)
+            out += self._stream_eterm*self._n_window
+        _normalize_log_posterior(out[:, np.newaxis])
+
+    def update(self, counts):
+        """Decode the next bin(s).
+
+        Parameters
+        ----------
+        counts : array_like
+            Spike counts of the next bin, with shape (n_units,), or of the
+            next n_new bins, with shape (n_units, n_new).
+
+        Returns
+        -------
+        posterior : array
+            Posterior distribution of the window ending in every new bin,
+            with shape (n_ext,) or (n_ext, n_new).
+        mode_pth : float or array
+        mean_pth : float or array
+        """
+        counts = np.asarray(counts, dtype=float)
+        single = counts.ndim == 1
+        counts = counts.reshape(counts.shape[0], -1)
+        if counts.shape[0] != len(self._unit_index):
+            raise ValueError("counts must have {} units, but has {}!".format(
+                len(self._unit_index), counts.shape[0]))
+
+        n_new = counts.shape[1]
+        posterior = np.zeros((n_new, self.n_xbins))
+        for ii in range(n_new):
+            self._decode_next(counts[:, ii], posterior[ii])
+        posterior = posterior.T
+        self._n_bins += n_new
+
+        mode_pth = np.argmax(posterior, axis=0)*self._xmax/self.n_xbins
+        mode_pth = np.where(np.isnan(posterior.sum(axis=0)), np.nan, mode_pth)
+        mean_pth = self._bin_centers @ posterior
+        if single:
+            return posterior[:, 0], mode_pth[0], mean_pth[0]
+        return posterior, mode_pth, mean_pth
+
+    def _bin_index(self, t):
+        """Index of the bin (counted from t0) that contains time t."""
+        return np.floor(np.round((np.asarray(t) - self._t0)/self._ds, 9)).astype(int)
+
+    def update_spikes(self, times, unit_ids, t):
+        """Decode all bins that are complete at time t.
+
+        Spikes in the incomplete bin at time t are kept until a later call
+        completes it; spikes before the start of the next bin (time) arrived
+        too late and are ignored.
+
+        Parameters
+        ----------
+        times : array_like
+            Times (in seconds) of the new spikes.
+        unit_ids : array_like
+            Unit id of every new spike.
+        t : float
+            Current time (in seconds).
+
+        Returns
+        -------
+        posterior : array with shape (n_ext, n_new)
+        mode_pth : array with shape (n_new,)
+        mean_pth : array with shape (n_new,)
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        try:
+            units = np.array([self._unit_index[unit_id]
+                              for unit_id in np.atleast_1d(unit_ids)], dtype=int)
+        except KeyError as e:
+            raise ValueError("unknown unit_id {}!".format(e))
+        if len(times) != len(units):
+            raise ValueError("times and unit_ids must have the same length!")
+
+        times = np.concatenate((self._pending_times, times))
+        units = np.concatenate((self._pending_units, units))
+
+        # bin indices relative to the next bin, robust to round-off errors:
+        n_new = max(0, self._bin_index(t) - self._n_bins)
+        bin_idx = self._bin_index(times) - self._n_bins
+        late = bin_idx < 0
+        times, units, bin_idx = times[~late], units[~late], bin_idx[~late]
+        complete = bin_idx < n_new
+        self._pending_times = times[~complete]
+        self._pending_units = units[~complete]
+
+        counts = np.zeros((len(self._unit_index), n_new))
+        np.add.at(counts, (units[complete], bin_idx[complete]), 1)
+        return self.update(counts)
+
+@cache.memoize
 def decode1D(bst, ratemap, xmin=0, xmax=100, w=1, nospk_prior=None, _skip_empty_bins=True):
     """Decodes binned spike trains using a ratemap with shape (n_units, n_ext)
 
@@ -67,6 +642,9 @@ def decode1D(bst, ratemap, xmin=0, xmax=100, w=1, nospk_prior=None, _skip_empty_
     environment, for example, then mean_pth decoding no longer works as
     expected, so this function should probably be refactored.
 
+    Use a BayesianDecoder to decode many spike trains with the same
+    ratemap, without recomputing the model terms on every call.
+
     Parameters
     ----------
     bst :
@@ -104,98 +682,11 @@ def decode1D(bst, ratemap, xmin=0, xmax=100, w=1, nospk_prior=None, _skip_empty_
 
     """
 
-    if w is None:
-        w=1
-    assert float(w).is_integer(), "w must be a positive integer!"
-    assert w > 0, "w must be a positive integer!"
-
-    n_units, t_bins = bst.data.shape
-    _, n_xbins = ratemap.shape
-
-    # if we pass a TuningCurve1D object, extract the ratemap and re-order
-    # units if necessary
-    if isinstance(ratemap, auxiliary.TuningCurve1D):
-        xmin = ratemap.bins[0]
-        xmax = ratemap.bins[-1]
-        bin_centers = ratemap.bin_centers
-        # re-order units if necessary
-        ratemap = ratemap.reorder_units_by_ids(bst.unit_ids)
-        ratemap = ratemap.ratemap
-    else:
-        xmin = 0
-        xmax = n_xbins
-        bin_centers = np.arange(n_xbins)
-
-    if nospk_prior is None:
-        nospk_prior = np.full(n_xbins, np.nan)
-    elif isinstance(nospk_priors, numbers.Number):
-        nospk_prior = np.full(n_xbins, 1.0)
-
-    assert nospk_prior.shape[0] == n_xbins, "prior must have length {}".format(n_xbins)
-    assert nospk_prior.size == n_xbins, "prior must be a 1D array with length {}".format(n_xbins)
-
-    lfx = np.log(ratemap)
-
-    eterm = -ratemap.sum(axis=0)*bst.ds*w
+    decoder = BayesianDecoder(ratemap, ds=bst.ds, w=w, nospk_prior=nospk_prior)
+    return decoder.decode(bst, skip_empty_bins=_skip_empty_bins)
 
-    # if we decode using multiple bins at a time (w>1) then we have to decode each epoch separately:
-
-    # first, we determine the number of bins we will decode. This requires us to scan over the epochs
-    n_bins = 0
-    cumlengths = np.cumsum(bst.lengths)
-    posterior_lengths = np.zeros(bst.n_epochs, dtype=np.int)
-    prev_idx = 0
-    for ii, to_idx in enumerate(cumlengths):
-        datalen = to_idx - prev_idx
-        prev_idx = to_idx
-        posterior_lengths[ii] = np.max((1,datalen - w + 1))
-
-    n_bins = posterior_lengths.sum()
-    posterior = np.zeros((n_xbins, n_bins))
-
-    # next, we decode each epoch separately, one bin at a time
-    cum_posterior_lengths = np.insert(np.cumsum(posterior_lengths),0,0)
-    prev_idx = 0
-    for ii, to_idx in enumerate(cumlengths):
-        data = bst.data[:,prev_idx:to_idx]
-        prev_idx = to_idx
-        datacum = np.cumsum(data, axis=1) # ii'th data segment, with column of zeros prepended
-        datacum = np.hstack((np.zeros((n_units,1)), datacum))
-        re = w # right edge ptr
-        # TODO: check if datalen < w and act appropriately
-        if posterior_lengths[ii] > 1: # more than one full window fits into data length
-            for tt in range(posterior_lengths[ii]):
-                obs = datacum[:, re] - datacum[:, re-w] # spikes in window of size w
-                re+=1
-                post_idx = cum_posterior_lengths[ii] + tt
-                if obs.sum() == 0 and _skip_empty_bins:
-                    # no spikes to decode in window!
-                    posterior[:,post_idx] = nospk_prior
-                else:
-                    posterior[:,post_idx] = (np.tile(np.array(obs, ndmin=2).T, n_xbins) * lfx).sum(axis=0) + eterm
-        else: # only one window can fit in, and perhaps only partially. We just take all the data we can get,
-              # and ignore the scaling problem where the window size is now possibly less than bst.ds*w
-            post_idx = cum_posterior_lengths[ii]
-            obs = datacum[:, -1] # spikes in window of size at most w
-            if obs.sum() == 0 and _skip_empty_bins:
-                # no spikes to decode in window!
-                posterior[:,post_idx] = nospk_prior
-            else:
-                posterior[:,post_idx] = (np.tile(np.array(obs, ndmin=2).T, n_xbins) * lfx).sum(axis=0) + eterm
-
-    # normalize posterior:
-    posterior = np.exp(posterior) / np.tile(np.exp(posterior).sum(axis=0),(n_xbins,1))
-
-    # TODO: what was my rationale behid the following? Why not use bin centers?
-    # _, bins = np.histogram([], bins=n_xbins, range=(xmin,xmax))
-    # xbins = (bins + xmax/n_xbins)[:-1]
-
-    mode_pth = np.argmax(posterior, axis=0)*xmax/n_xbins
-    mode_pth = np.where(np.isnan(posterior.sum(axis=0)), np.nan, mode_pth)
-    mean_pth = (bin_centers * posterior.T).sum(axis=1)
-    return posterior, cum_posterior_lengths, mode_pth, mean_pth
-
-def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=None, _skip_empty_bins=True):
+def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=None, _skip_empty_bins=True,
+             chunk_size=None, filename=None):
     """Decodes binned spike trains using a ratemap with shape (n_units, ext_nx, ext_ny)
 
     TODO: complete docstring
@@ -204,6 +695,10 @@ def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=
     environment, for example, then mean_pth decoding no longer works as
     expected, so this function should probably be refactored.
 
+    The (ext_nx, ext_ny) grid is flattened into a single axis, so that the
+    decoding is the same as in decode1D, and the posterior is only reshaped
+    at the end.
+
     Parameters
     ----------
     bst :
@@ -219,6 +714,13 @@ def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=
         that will be used if no spikes are observed in a decoding window
         Default is np.nan.
         If nospk_prior is any scalar, then a uniform prior is assumed.
+    chunk_size : int, optional
+        Number of posterior bins decoded at a time. Default is chosen such
+        that the windowed spike counts of a chunk hold about 4 million
+        values.
+    filename : str, optional
+        If given, the posterior is written, chunk by chunk, to a memory
+        mapped array in this file, so that it need not fit into memory.
 
     _skip_empty_bins is only used to return the posterior regardless of
     whether any spikes were observed, so that we can understand the spatial
@@ -227,9 +729,9 @@ def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=
     Returns
     -------
     posteriors : array
-        Posterior distribution with shape (ext_nx, ext_ny, n_posterior_bins),
+        Posterior distribution with shape (ext_ny, ext_nx, n_posterior_bins),
         where n_posterior bins <= bst.n_tbins, but depends on w and the
-        event lengths.
+        event lengths. A np.memmap if filename is given.
     cum_posterior_lengths : array
 
     mode_pth :
@@ -241,23 +743,14 @@ def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=
 
     """
 
-    def tile_obs(obs, nx, ny):
-        n_units = len(obs)
-        out = np.zeros((n_units, nx, ny))
-        for unit in range(n_units):
-            out[unit,:,:] = obs[unit]
-        return out
-
     if w is None:
         w=1
     assert float(w).is_integer(), "w must be a positive integer!"
     assert w > 0, "w must be a positive integer!"
+    w = int(w)
 
     n_units, t_bins = bst.data.shape
 
-    xbins = None
-    ybins = None
-
     # if we pass a TuningCurve2D object, extract the ratemap and re-order
     # units if necessary
     if isinstance(ratemap, auxiliary.TuningCurve2D):
@@ -268,96 +761,56 @@ def decode2D(bst, ratemap, xmin=0, xmax=100, ymin=0, ymax=100, w=1, nospk_prior=
         # re-order units if necessary
         ratemap = ratemap.reorder_units_by_ids(bst.unit_ids)
         ratemap = ratemap.ratemap
-
-    _, n_xbins, n_ybins = ratemap.shape
+        _, n_xbins, n_ybins = ratemap.shape
+    else:
+        _, n_xbins, n_ybins = ratemap.shape
+        xbins = np.linspace(xmin, xmax, n_xbins+1)
+        ybins = np.linspace(ymin, ymax, n_ybins+1)
+        xbin_centers = (xbins[1:] + xbins[:-1])/2
+        ybin_centers = (ybins[1:] + ybins[:-1])/2
 
     if nospk_prior is None:
         nospk_prior = np.full((n_xbins, n_ybins), np.nan)
-    elif isinstance(nospk_priors, numbers.Number):
+    elif isinstance(nospk_prior, numbers.Number):
         nospk_prior = np.full((n_xbins, n_ybins), 1.0)
 
     assert nospk_prior.shape == (n_xbins, n_ybins), "prior must have shape ({}, {})".format(n_xbins, n_ybins)
 
+    # flatten the (x, y) grid into a single axis of external correlates:
+    ratemap = ratemap.reshape(n_units, n_xbins*n_ybins)
     lfx = np.log(ratemap)
 
     eterm = -ratemap.sum(axis=0)*bst.ds*w
 
-    # if we decode using multiple bins at a time (w>1) then we have to decode each epoch separately:
-
-    # first, we determine the number of bins we will decode. This requires us to scan over the epochs
-    n_tbins = 0
-    cumlengths = np.cumsum(bst.lengths)
-    posterior_lengths = np.zeros(bst.n_epochs, dtype=np.int)
-    prev_idx = 0
-    for ii, to_idx in enumerate(cumlengths):
-        datalen = to_idx - prev_idx
-        prev_idx = to_idx
-        posterior_lengths[ii] = np.max((1,datalen - w + 1))
-
-    n_tbins = posterior_lengths.sum()
-
-    ########################################################################
-    posterior = np.zeros((n_xbins, n_ybins, n_tbins))
-
-    # next, we decode each epoch separately, one bin at a time
-    cum_posterior_lengths = np.insert(np.cumsum(posterior_lengths),0,0)
-    prev_idx = 0
-    for ii, to_idx in enumerate(cumlengths):
-        data = bst.data[:,prev_idx:to_idx]
-        prev_idx = to_idx
-        datacum = np.cumsum(data, axis=1) # ii'th data segment, with column of zeros prepended
-        datacum = np.hstack((np.zeros((n_units,1)), datacum))
-        re = w # right edge ptr
-        # TODO: check if datalen < w and act appropriately
-        if posterior_lengths[ii] > 1: # more than one full window fits into data length
-            for tt in range(posterior_lengths[ii]):
-                obs = datacum[:, re] - datacum[:, re-w] # spikes in window of size w
-                re+=1
-                post_idx = cum_posterior_lengths[ii] + tt
-                if obs.sum() == 0 and _skip_empty_bins:
-                    # no spikes to decode in window!
-                    posterior[:,:,post_idx] = nospk_prior
-                else:
-                    posterior[:,:,post_idx] = (tile_obs(obs, n_xbins, n_ybins) * lfx).sum(axis=0) + eterm
-        else: # only one window can fit in, and perhaps only partially. We just take all the data we can get,
-              # and ignore the scaling problem where the window size is now possibly less than bst.ds*w
-            post_idx = cum_posterior_lengths[ii]
-            obs = datacum[:, -1] # spikes in window of size at most w
-            if obs.sum() == 0 and _skip_empty_bins:
-                # no spikes to decode in window!
-                posterior[:,:,post_idx] = nospk_prior
-            else:
-                posterior[:,:,post_idx] = (tile_obs(obs, n_xbins, n_ybins) * lfx).sum(axis=0) + eterm
-
-    # normalize posterior:
-    # see http://timvieira.github.io/blog/post/2014/02/11/exp-normalize-trick/
-    for tt in range(n_tbins):
-        posterior[:,:,tt] = posterior[:,:,tt] - posterior[:,:,tt].max()
-        posterior[:,:,tt] = np.exp(posterior[:,:,tt])
-        posterior[:,:,tt] = posterior[:,:,tt] / posterior[:,:,tt].sum()
-
-    # if xbins is None:
-    #     _, bins = np.histogram([], bins=n_xbins, range=(xmin,xmax))
-    #     xbins = (bins + xmax/n_xbins)[:-1]
-    # if ybins is None:
-    #     _, bins = np.histogram([], bins=n_ybins, range=(ymin,ymax))
-    #     ybins = (bins + ymax/n_ybins)[:-1]
+    _, _, cum_posterior_lengths = _decoding_windows(bst.lengths, w)
+    n_tbins = cum_posterior_lengths[-1]
 
+    shape = (n_ybins, n_xbins, n_tbins)
+    if filename is None:
+        posterior = np.zeros(shape)
+    else:
+        posterior = np.memmap(filename, dtype=float, mode='w+', shape=shape)
     mode_pth = np.zeros((2, n_tbins))
-    for tt in range(n_tbins):
-        if np.any(np.isnan(posterior[:,:,tt])):
-            mode_pth[0,tt] = np.nan
-            mode_pth[0,tt] = np.nan
-        else:
-            x_, y_ = np.unravel_index(np.argmax(posterior[:,:,tt]), (n_xbins, n_ybins))
-            mode_pth[0,tt] = xbins[x_]
-            mode_pth[1,tt] = ybins[y_]
+    mean_pth = np.zeros((2, n_tbins))
+
+    for start, stop, chunk in _decode_chunks(bst.data, bst.lengths, lfx, eterm,
+                                             w=w, nospk_prior=nospk_prior.ravel(),
+                                             skip_empty_bins=_skip_empty_bins,
+                                             chunk_size=chunk_size):
+        chunk = chunk.reshape(n_xbins, n_ybins, -1)
+        posterior[:, :, start:stop] = np.transpose(chunk, axes=[1,0,2])
 
-    expected_x = (xbin_centers * posterior.sum(axis=1).T).sum(axis=1)
-    expected_y = (ybin_centers * posterior.sum(axis=0).T).sum(axis=1)
-    mean_pth = np.vstack((expected_x, expected_y))
+        x_, y_ = np.unravel_index(np.argmax(chunk.reshape(n_xbins*n_ybins, -1), axis=0),
+                                  (n_xbins, n_ybins))
+        undefined = np.isnan(chunk.sum(axis=(0,1)))
+        mode_pth[0, start:stop] = np.where(undefined, np.nan, xbins[x_])
+        mode_pth[1, start:stop] = np.where(undefined, np.nan, ybins[y_])
 
-    posterior = np.transpose(posterior, axes=[1,0,2])
+        mean_pth[0, start:stop] = xbin_centers @ chunk.sum(axis=1)
+        mean_pth[1, start:stop] = ybin_centers @ chunk.sum(axis=0)
+
+    if filename is not None:
+        posterior.flush()
 
     return posterior, cum_posterior_lengths, mode_pth, mean_pth
 
@@ -411,6 +864,55 @@ def k_fold_cross_validation(X, k=None, randomize=False):
         validation = [x for i, x in enumerate(X) if i % k == _k_]
         yield training, validation
 
+def cross_validated_tuningcurves(bst, extern, *, k=5, n_extern=100, extmin=0,
+                                 extmax=100, sigma=3, bw=None, minbgrate=None,
+                                 min_duration=None, transfunc=None,
+                                 randomize=False):
+    """Generates (training, validation, tuningcurve) for every fold of a
+    k-fold cross-validation over the epochs of a BinnedSpikeTrainArray.
+
+    The occupancy and spike counts of every epoch are computed only once,
+    and the tuning curve of each fold is derived from the total minus the
+    held-out statistics, rather than rebuilt from bst[training]. The tuning
+    curves are the same as TuningCurve1D(bst=bst[training], ...).
+
+    Parameters
+    ----------
+    bst : BinnedSpikeTrainArray
+    extern : query-able object of external correlates (e.g. pos AnalogSignalArray)
+    k : int, or str, optional
+        Number of folds, or 'loo' for leave-one-epoch-out. Default is 5.
+    n_extern, extmin, extmax, sigma, bw, minbgrate, min_duration : optional
+        As in TuningCurve1D.
+    transfunc : callable, optional
+        transfunc(extern, at) maps extern into the values to be binned.
+    randomize : bool, optional
+        See k_fold_cross_validation.
+
+    Returns
+    -------
+    (training, validation, tuningcurve)
+        Epoch indices of the training and validation sets, and the
+        TuningCurve1D estimated from the training epochs.
+    """
+    acc = auxiliary.TuningCurve1DAccumulator(n_extern=n_extern, extmin=extmin,
+                                             extmax=extmax,
+                                             transform_func=transfunc)
+    occupancy, counts = acc._epoch_statistics(bst, extern)
+    total_occupancy = occupancy.sum(axis=0)
+    total_counts = counts.sum(axis=0)
+
+    for training, validation in k_fold_cross_validation(bst.n_epochs, k=k,
+                                                        randomize=randomize):
+        fold = acc._from_statistics(
+            total_occupancy - occupancy[validation].sum(axis=0),
+            total_counts - counts[validation].sum(axis=0),
+            ds=bst.ds, unit_ids=bst.unit_ids, unit_labels=bst.unit_labels,
+            unit_tags=bst.unit_tags)
+        tc = fold.finalize(sigma=sigma, bw=bw, minbgrate=minbgrate,
+                           min_duration=min_duration)
+        yield training, validation, tc
+
 def cumulative_dist_decoding_error_using_xval(bst, extern,*, decodefunc=decode1D, tuningcurve=None, k=5, transfunc=None, n_extern=100, extmin=0, extmax=100, sigma=3, n_bins=None):
     """Cumulative distribution of decoding errors during epochs in
     BinnedSpikeTrainArray, evaluated using a k-fold cross-validation
@@ -459,19 +961,30 @@ def cumulative_dist_decoding_error_using_xval(bst, extern,*, decodefunc=decode1D
 
     max_error = extmax - extmin
 
-    # indices of training and validation epochs / events
+    # target positions of all bins, from which those of every validation
+    # fold are selected:
+    target = np.asarray(transfunc(extern, at=bst.bin_centers))
+    bin_starts = np.insert(np.cumsum(bst.lengths), 0, 0)
 
     hist = np.zeros(n_bins)
-    for training, validation in k_fold_cross_validation(bst.n_epochs, k=k):
-        # estimate place fields using bst[training]
-        tc = auxiliary.TuningCurve1D(bst=bst[training], extern=extern, n_extern=n_extern, extmin=extmin, extmax=extmax, sigma=sigma)
-        # decode position using bst[validation]
-        posterior, _, mode_pth, mean_pth = decodefunc(bst[validation], tc)
+    for training, validation, tc in cross_validated_tuningcurves(
+            bst, extern, k=k, n_extern=n_extern, extmin=extmin,
+            extmax=extmax, sigma=sigma, transfunc=transfunc):
+        validation_bins = np.concatenate([np.arange(bin_starts[ii], bin_starts[ii+1])
+                                          for ii in validation])
+        # decode position during the validation epochs
+        if decodefunc is decode1D:
+            # decode the counts directly, without building bst[validation]
+            decoder = BayesianDecoder(tc, ds=bst.ds)
+            posterior = decoder.decode_counts(bst.data[:, validation_bins],
+                                              bst.lengths[validation],
+                                              unit_ids=bst.unit_ids)
+            mean_pth = (decoder.bin_centers * posterior.T).sum(axis=1)
+        else:
+            posterior, _, mode_pth, mean_pth = decodefunc(bst[validation], tc)
         # calculate validation error (for current fold) by comapring
         # decoded pos v target pos
-        target = transfunc(extern, at=bst[validation].bin_centers)
-
-        histnew, bins = np.histogram(np.abs(target - mean_pth), bins=n_bins, range=(0, max_error))
+        histnew, bins = np.histogram(np.abs(target[..., validation_bins] - mean_pth), bins=n_bins, range=(0, max_error))
         hist = hist + histnew
 
     # build cumulative error distribution
@@ -2,17 +2,25 @@
 """This module implements filtering functionailty for core nelpy objects. 
 """
 
-__all__ = ['sosfiltfilt']
+__all__ = ['sosfiltfilt',
+           'FilterBank']
 
 import copy
+import os
 import numpy as np
 import warnings
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from .core import AnalogSignalArray
+from .utils_ import cache, copying
 
+@cache.memoize(ignore=('n_jobs',), bypass=('inplace',))
 def sosfiltfilt(asa, *, fl=None, fh=None, fs=None, inplace=False, bandstop=False,
                 gpass=None, gstop=None, ftype='cheby2', buffer_len=4194304,
-                overlap_len=None, max_len=None, **kwargs):
+                overlap_len=None, max_len=None, n_jobs=1, **kwargs):
     """Zero-phase forward backward second-order-segment Chebyshev II filter.
 
     # spike  600--6000
@@ -67,6 +75,10 @@ def sosfiltfilt(asa, *, fl=None, fh=None, fs=None, inplace=False, bandstop=False
         When max_len == -1 or max_len == None, then argument is effectively
         ignored. If max_len is a positive integer, thenmax_len specifies how
         many samples to process.
+    n_jobs : int, optional
+        Number of threads used to filter (signal, chunk) pairs in parallel.
+        The underlying scipy filter releases the GIL, so that threads run
+        concurrently. If -1, all CPUs are used. Default is 1 (no threads).
 
     Returns
     -------
@@ -93,18 +105,245 @@ def sosfiltfilt(asa, *, fl=None, fh=None, fs=None, inplace=False, bandstop=False
     except TypeError:
         pass
 
-    from scipy.signal import sosfiltfilt, iirdesign
-
-    if inplace:
-        out = asa
-    else:
-        from copy import deepcopy
-        out = deepcopy(asa)
-
     if overlap_len is None:
         overlap_len = int(fs*2)
 
-    buffer_len = 4194304
+    sos = _design_sos(fs, fl, fh, bandstop=bandstop, gpass=gpass,
+                      gstop=gstop, ftype=ftype)
+
+    if isinstance(asa, (np.ndarray, list)):
+        if len(np.array(asa).squeeze().shape) > 1:
+            raise NotImplementedError('filtering for multidimensional ndarrays and lists not yet implemented; use an AnalogSignalArray, or a single dimensional list or ndarray')
+        # ignore epochs (information not contained in list or array) so filter directly
+        dims = np.array(asa).shape
+        ydata = np.atleast_2d(np.array(asa, dtype=float).squeeze())
+        filtered = np.zeros_like(ydata)
+        _filtfilt_chunks([sos], ydata, [filtered], bounds=[(0, ydata.shape[1])],
+                         buffer_len=buffer_len, overlap_len=overlap_len,
+                         n_jobs=n_jobs)
+        filtered = np.reshape(filtered, dims)
+        if inplace and isinstance(asa, np.ndarray):
+            asa[...] = filtered
+            out = asa
+        elif isinstance(asa, list):
+            out = filtered.tolist()
+        else:
+            out = filtered
+    elif isinstance(asa, AnalogSignalArray):
+        if inplace:
+            out = asa
+        else:
+            out = copying.copy_without(asa, '_ydata') # ydata is replaced below
+        # filter within epochs; filtered data is written to a new buffer, so
+        # that the input buffer is left untouched
+        ydata = np.zeros_like(asa._ydata, dtype=np.result_type(asa._ydata, float))
+        fei = np.insert(np.cumsum(asa.lengths), 0, 0) # filter epoch indices, fei
+        _filtfilt_chunks([sos], asa._ydata_rowsig, [ydata], bounds=zip(fei[:-1], fei[1:]),
+                         buffer_len=buffer_len, overlap_len=overlap_len,
+                         n_jobs=n_jobs)
+        out._ydata = ydata
+        out.__renew__()
+    return out
+
+
+class FilterBank(object):
+    """Bank of zero-phase filters that are applied in a single pass.
+
+    Each chunk of data is read once, and every band is filtered from it,
+    so that the signal I/O and the overlap handling are shared between all
+    bands. Filter coefficients are designed once per (fs, band, ftype), and
+    are cached.
+
+    Parameters
+    ----------
+    bands : dict or list
+        Frequency bands to extract. Either a dict mapping band names to
+        (fl, fh) tuples, or a list of (fl, fh) tuples, in which case bands
+        are named 'fl-fh'. Use fl=None (fh=None) for a lowpass (highpass)
+        filter.
+    fs : float, optional
+        The sampling frequency (Hz). Obtained from asa if not specified.
+    gpass : float, optional
+        The maximum loss in the passband (dB). Default is 0.1 dB.
+    gstop : float, optional
+        The minimum attenuation in the stopband (dB). Default is 30 dB.
+    ftype : str, optional
+        The type of IIR filter to design. Default is 'cheby2'. See
+        sosfiltfilt for all options.
+    buffer_len : int, optional
+        How much data to process at a time. Default is 2**22 = 4194304 samples.
+    overlap_len : int, optional
+        How much data do we add to either side of each chunk to smooth out
+        filter transients. Default is 2 seconds' worth of samples.
+
+    Examples
+    --------
+    >>> fb = FilterBank({'theta': (6, 12), 'ripple': (150, 250)})
+    >>> filtered = fb.filter(lfp)
+    >>> filtered['ripple']
+    """
+
+    def __init__(self, bands, *, fs=None, gpass=None, gstop=None,
+                 ftype='cheby2', buffer_len=4194304, overlap_len=None):
+
+        if isinstance(bands, dict):
+            items = bands.items()
+        else:
+            items = (('{}-{}'.format(fl, fh), (fl, fh)) for fl, fh in bands)
+
+        self._bands = OrderedDict()
+        for name, (fl, fh) in items:
+            try:
+                assert fl < fh, "fl must be less than fh!"
+            except TypeError:
+                pass
+            self._bands[name] = (fl, fh)
+
+        if not self._bands:
+            raise ValueError("at least one band must be specified!")
+
+        self._fs = fs
+        self._gpass = gpass
+        self._gstop = gstop
+        self._ftype = ftype
+        self._buffer_len = buffer_len
+        self._overlap_len = overlap_len
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        bstr = ", ".join("{}: {}--{}".format(name, fl, fh)
+                         for name, (fl, fh) in self._bands.items())
+        return "<FilterBank%s: %d bands (%s)>" % (address_str, self.n_bands, bstr)
+
+    @property
+    def bands(self):
+        """(OrderedDict) Band names mapped to (fl, fh) tuples."""
+        return OrderedDict(self._bands)
+
+    @property
+    def band_names(self):
+        """(list) Names of the bands, in order."""
+        return list(self._bands.keys())
+
+    @property
+    def n_bands(self):
+        """(int) Number of bands."""
+        return len(self._bands)
+
+    @property
+    def fs(self):
+        """(float) Sampling frequency (Hz), or None if obtained from data."""
+        return self._fs
+
+    def sos(self, fs=None):
+        """Return the second-order sections of every band.
+
+        Parameters
+        ----------
+        fs : float, optional
+            The sampling frequency (Hz). Default is self.fs.
+
+        Returns
+        -------
+        sos : OrderedDict
+            Band names mapped to second-order sections.
+        """
+        if fs is None:
+            fs = self._fs
+        if fs is None:
+            raise ValueError("sampling frequency, fs, must be specified!")
+        sos = OrderedDict()
+        for name, (fl, fh) in self._bands.items():
+            try:
+                assert fh < fs, "fh must be less than sampling rate!"
+            except TypeError:
+                pass
+            sos[name] = _design_sos(fs, fl, fh, gpass=self._gpass,
+                                    gstop=self._gstop, ftype=self._ftype)
+        return sos
+
+    def filter(self, asa, *, stacked=False, n_jobs=1):
+        """Filter an AnalogSignalArray with every band of the filter bank.
+
+        Parameters
+        ----------
+        asa : nelpy.core.AnalogSignalArray
+            Object to filter. Epochs are filtered independently.
+        stacked : bool, optional
+            If True, a single AnalogSignalArray is returned, with the
+            filtered signals of all bands stacked (band by band), and
+            labeled by band name. Default is False.
+        n_jobs : int, optional
+            Number of threads used to filter (signal, chunk) pairs in
+            parallel. If -1, all CPUs are used. Default is 1.
+
+        Returns
+        -------
+        out : OrderedDict or nelpy.core.AnalogSignalArray
+            Band names mapped to filtered AnalogSignalArrays, or a single
+            stacked AnalogSignalArray if stacked is True.
+        """
+        if not isinstance(asa, AnalogSignalArray):
+            raise TypeError('asa must be a nelpy.core.AnalogSignalArray!')
+
+        fs = self._fs
+        if fs is None:
+            fs = asa.fs
+
+        overlap_len = self._overlap_len
+        if overlap_len is None:
+            overlap_len = int(fs*2)
+
+        soss = self.sos(fs=fs)
+        dtype = np.result_type(asa._ydata, float)
+        if stacked:
+            ydata = np.zeros((self.n_bands*asa.n_signals, asa.n_samples), dtype=dtype)
+            outs = np.split(ydata, self.n_bands, axis=0)
+        else:
+            outs = [np.zeros_like(asa._ydata, dtype=dtype) for _ in range(self.n_bands)]
+
+        fei = np.insert(np.cumsum(asa.lengths), 0, 0) # filter epoch indices, fei
+        _filtfilt_chunks(list(soss.values()), asa._ydata_rowsig, outs,
+                         bounds=zip(fei[:-1], fei[1:]),
+                         buffer_len=self._buffer_len, overlap_len=overlap_len,
+                         n_jobs=n_jobs)
+
+        if stacked:
+            out = copying.copy_without(asa, '_ydata')
+            out._ydata = ydata
+            out._labels = np.repeat(np.array(self.band_names, dtype=str), asa.n_signals)
+            out.__renew__()
+            return out
+
+        out = OrderedDict()
+        for name, ydata in zip(self.band_names, outs):
+            out[name] = copying.copy_without(asa, '_ydata')
+            out[name]._ydata = ydata
+            out[name].__renew__()
+        return out
+
+def _design_sos(fs, fl, fh, *, bandstop=False, gpass=None, gstop=None, ftype='cheby2'):
+    """Design (and cache) second-order sections for a lowpass, highpass,
+    bandpass or bandstop filter.
+
+    Filters are cached per (fs, band, ftype, ...), so that repeated calls
+    with the same arguments do not re-run iirdesign.
+
+    Returns
+    -------
+    sos : np.ndarray
+        Second-order sections, with shape (n_sections, 6). Every call
+        returns a new copy of the cached array.
+    """
+    return _cached_sos(fs, fl, fh, bandstop=bandstop, gpass=gpass,
+                       gstop=gstop, ftype=ftype).copy()
+
+@lru_cache(maxsize=128)
+def _cached_sos(fs, fl, fh, *, bandstop=False, gpass=None, gstop=None, ftype='cheby2'):
+    """Second-order sections cached by _design_sos, which must not be
+    modified, since they are shared by all calls with the same arguments."""
+    from scipy.signal import iirdesign
+
     if gpass is None:
         gpass = 0.1 # max loss in passband, dB
 
@@ -135,37 +374,75 @@ def sosfiltfilt(asa, *, fl=None, fh=None, fs=None, inplace=False, bandstop=False
     if bandstop: # notch / bandstop filter
         wp, ws = ws, wp
 
-    sos = iirdesign(wp, ws, gpass=gpass, gstop=gstop, ftype='cheby2', output='sos')
+    sos = iirdesign(wp, ws, gpass=gpass, gstop=gstop, ftype=ftype, output='sos')
+    sos.flags.writeable = False
+    return sos
 
-    if isinstance(asa, (np.ndarray, list)):
-        if len(np.array(out).squeeze().shape) > 1:
-            raise NotImplementedError('filtering for multidimensional ndarrays and lists not yet implemented; use an AnalogSignalArray, or a single dimensional list or ndarray')
-        # ignore epochs (information not contained in list or array) so filter directly
-        dims = np.array(out).shape
-        out = np.squeeze(out)
-        start, stop = 0, np.array(out).shape[-1]
+def _get_n_jobs(n_jobs):
+    """Return the number of workers to use, following the sklearn convention
+    that negative values count back from the number of CPUs."""
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() + 1 + n_jobs, 1)
+    if n_jobs == 0:
+        raise ValueError("n_jobs == 0 has no meaning!")
+    return n_jobs
+
+def _filtfilt_chunks(soss, ydata, outs, *, bounds, buffer_len, overlap_len, n_jobs=1):
+    """Apply zero-phase SOS filters to ydata, and write the results into outs.
+
+    Each (start, stop) sample range in bounds is filtered independently, in
+    chunks of buffer_len samples, with overlap_len samples on either side to
+    smooth out filter transients. Every chunk is read once, and all filters
+    are applied to it before moving on. When n_jobs > 1, all (signal, chunk)
+    pairs are distributed over a thread pool.
+
+    Parameters
+    ----------
+    soss : list of array_like
+        Second-order filter sections, as returned by scipy.signal.iirdesign.
+    ydata : np.ndarray
+        Input data, with shape (n_signals, n_samples).
+    outs : list of np.ndarray
+        Preallocated outputs (one per filter), with the same shape as ydata.
+    bounds : iterable of (start, stop) pairs
+        Sample ranges (epochs) to filter independently.
+    buffer_len : int
+        Number of samples to filter at a time.
+    overlap_len : int
+        Number of additional samples on either side of each chunk.
+    n_jobs : int, optional
+        Number of threads. Default is 1.
+    """
+    from scipy.signal import sosfiltfilt as _sosfiltfilt
+
+    chunks = []
+    for start, stop in bounds:
         for buff_st_idx in range(start, stop, buffer_len):
-                chk_st_idx = int(max(start, buff_st_idx - overlap_len))
-                buff_nd_idx = int(min(stop, buff_st_idx + buffer_len))
-                chk_nd_idx = int(min(stop, buff_nd_idx + overlap_len))
-                rel_st_idx = int(buff_st_idx - chk_st_idx)
-                rel_nd_idx = int(buff_nd_idx - chk_st_idx)
-                this_y_chk = sosfiltfilt(sos, out[chk_st_idx:chk_nd_idx])
-                out[buff_st_idx:buff_nd_idx] = this_y_chk[rel_st_idx:rel_nd_idx]
-        out = np.reshape(out, dims)
-        if isinstance(asa, list):
-            out = out.tolist()
-    elif isinstance(asa, AnalogSignalArray):
-        # filter within epochs
-        fei = np.insert(np.cumsum(out.lengths), 0, 0) # filter epoch indices, fei
-        for ii in range(len(fei)-1):
-            start, stop = fei[ii], fei[ii+1]
-            for buff_st_idx in range(start, stop, buffer_len):
-                chk_st_idx = int(max(start, buff_st_idx - overlap_len))
-                buff_nd_idx = int(min(stop, buff_st_idx + buffer_len))
-                chk_nd_idx = int(min(stop, buff_nd_idx + overlap_len))
-                rel_st_idx = int(buff_st_idx - chk_st_idx)
-                rel_nd_idx = int(buff_nd_idx - chk_st_idx)
-                this_y_chk = sosfiltfilt(sos, out._ydata_rowsig[:,chk_st_idx:chk_nd_idx])
-                out._ydata[:,buff_st_idx:buff_nd_idx] = this_y_chk[:,rel_st_idx:rel_nd_idx]
-    return out
+            chk_st_idx = int(max(start, buff_st_idx - overlap_len))
+            buff_nd_idx = int(min(stop, buff_st_idx + buffer_len))
+            chk_nd_idx = int(min(stop, buff_nd_idx + overlap_len))
+            chunks.append((chk_st_idx, int(buff_st_idx), buff_nd_idx, chk_nd_idx))
+
+    def filter_chunk(rows, chk_st_idx, buff_st_idx, buff_nd_idx, chk_nd_idx):
+        rel_st_idx = buff_st_idx - chk_st_idx
+        rel_nd_idx = buff_nd_idx - chk_st_idx
+        y_chk = ydata[rows, chk_st_idx:chk_nd_idx]
+        for sos, out in zip(soss, outs):
+            this_y_chk = _sosfiltfilt(sos, y_chk)
+            out[rows, buff_st_idx:buff_nd_idx] = this_y_chk[:, rel_st_idx:rel_nd_idx]
+
+    n_jobs = _get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        # all signals are filtered together, one chunk at a time
+        for chunk in chunks:
+            filter_chunk(slice(None), *chunk)
+    else:
+        # chunks write to disjoint regions of out, so no locking is needed
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(filter_chunk, slice(row, row+1), *chunk)
+                       for row in range(ydata.shape[0])
+                       for chunk in chunks]
+            for future in futures:
+                future.result()
@@ -18,7 +18,7 @@ import copy
 from . core import BinnedSpikeTrainArray # may have to be from . import core, and then core.BinnedSpikeTrainArray
 from . utils import swap_cols, swap_rows
 from . import plotting
-from . decoding import decode1D
+from . decoding import BayesianDecoder
 from . analysis import replay
 
 __all__ = ['PoissonHMM',
@@ -580,10 +580,11 @@ class PoissonHMM(PHMM):
                 swap_rows(ratemap, frm, to)
                 oldorder[frm], oldorder[to] = oldorder[to], oldorder[frm]
 
+            decoder = BayesianDecoder(ratemap, ds=X.ds)
             posteriors = []
             state_sequences = []
             for seq in X:
-                posteriors_, cumlengths, mode_pth, mean_pth = decode1D(bst=seq, ratemap=ratemap)
+                posteriors_, cumlengths, mode_pth, mean_pth = decoder.decode(seq)
                 # nanlocs = np.argwhere(np.isnan(mode_pth))
                 # state_sequences_ = mode_pth.astype(int)
                 state_sequences_ = mode_pth
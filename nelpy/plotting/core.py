@@ -353,14 +353,75 @@ def imagesc(x=None, y=None, data=None, *, ax=None, large=False, **kwargs):
 
     return ax, image
 
+def _minmax_envelope_line_data(obj, n_points, start=None, stop=None):
+    """Returns (x, y) line data for each signal in obj, such that drawing the
+    line traces out the min/max envelope of the signal. Epochs are separated
+    by NaNs so that a single line can be used per signal."""
+    envelopes = obj.minmax_envelope(n_points=n_points, start=start, stop=stop)
+    xdata = []
+    ydata = [[] for _ in range(obj.n_signals)]
+    for env in envelopes:
+        xdata.extend((np.repeat(env.xvals, 2), [np.nan]))
+        for ii in range(obj.n_signals):
+            ydata[ii].extend((np.vstack((env.ymin[ii], env.ymax[ii])).T.ravel(), [np.nan]))
+    if not xdata:
+        return np.array([]), [np.array([]) for _ in range(obj.n_signals)]
+    return np.concatenate(xdata), [np.concatenate(yy) for yy in ydata]
+
+def _plot_minmax_envelope(obj, ax, *args, **kwargs):
+    """Plot the min/max envelope of an AnalogSignalArray at the resolution of
+    the axis, and refresh the envelope whenever the x-limits change."""
+
+    def axis_width_in_pixels(ax):
+        return max(int(np.ceil(ax.get_window_extent().width)), 1)
+
+    color = kwargs.pop('color', None)
+    carg = kwargs.pop('c', None)
+    if color is not None and carg is not None:
+        raise ValueError("saw kwargs ['c', 'color']")
+    if carg:
+        color = carg
+    if color is not None:
+        kwargs['color'] = color
+
+    xdata, ydata = _minmax_envelope_line_data(obj, axis_width_in_pixels(ax))
+    lines = []
+    for yy in ydata:
+        line, = ax.plot(xdata, yy, *args, **kwargs)
+        lines.append(line)
+
+    def on_xlim_changed(ax):
+        start, stop = ax.get_xlim()
+        xdata, ydata = _minmax_envelope_line_data(obj, axis_width_in_pixels(ax),
+                                                  start=start, stop=stop)
+        for line, yy in zip(lines, ydata):
+            line.set_data(xdata, yy)
+
+    ax.callbacks.connect('xlim_changed', on_xlim_changed)
+
+    return ax
+
 def plot(obj, *args, **kwargs):
-    """Docstring goes here."""
+    """Plot a nelpy object, or pass the arguments through to matplotlib.
+
+    With decimate=True, AnalogSignalArrays with many more samples than
+    there are pixels on the axis are drawn as min/max envelopes (see
+    AnalogSignalArray.minmax_envelope), one line per signal, which are
+    recomputed at the matching resolution whenever the x-limits change.
+    This keeps zooming through long, densely sampled signals interactive,
+    while preserving transients. By default, every sample is drawn.
+    """
 
     ax = kwargs.pop('ax', None)
     if ax is None:
         ax = plt.gca()
 
+    decimate = kwargs.pop('decimate', False)
+
     if(isinstance(obj, AnalogSignalArray)):
+        if decimate and not np.iscomplexobj(obj._ydata) and \
+                obj.n_samples > 4*ax.get_window_extent().width:
+            return _plot_minmax_envelope(obj, ax, *args, **kwargs)
         if obj.n_signals == 1:
             label = kwargs.pop('label', None)
             for ii, (timestamps, data) in enumerate(zip(obj._epochtime.plot_generator(), obj._epochdata.plot_generator())):
@@ -480,7 +541,7 @@ def plot_old(npl_obj, data=None, *, ax=None, mew=None, color=None,
             if not npl_obj.labels:
                 for segment in npl_obj:
                     if color is not None:
-                        ax.plot(segment._time,
+                        ax.plot(segment.time,
                                 segment._ydata_colsig,
                                 color=color,
                                 mec=mec,
@@ -488,7 +549,7 @@ def plot_old(npl_obj, data=None, *, ax=None, mew=None, color=None,
                                 **kwargs
                                 )
                     else:
-                        ax.plot(segment._time,
+                        ax.plot(segment.time,
                                 segment._ydata_colsig,
                                 # color=colors[ii],
                                 mec=mec,
@@ -500,7 +561,7 @@ def plot_old(npl_obj, data=None, *, ax=None, mew=None, color=None,
                     for ii, segment in enumerate(npl_obj):
                         for signal, label in zip(segment._ydata_rowsig, npl_obj.labels):
                             if color is not None:
-                                ax.plot(segment._time,
+                                ax.plot(segment.time,
                                         signal,
                                         color=color,
                                         mec=mec,
@@ -509,7 +570,7 @@ def plot_old(npl_obj, data=None, *, ax=None, mew=None, color=None,
                                         **kwargs
                                         )
                             else: # color(s) have not been specified, use color cycler
-                                ax.plot(segment._time,
+                                ax.plot(segment.time,
                                         signal,
                                         # color=colors[ii],
                                         mec=mec,
@@ -524,7 +585,7 @@ def plot_old(npl_obj, data=None, *, ax=None, mew=None, color=None,
                         else:
                             label = npl_obj.labels
                         if color is not None:
-                            ax.plot(segment._time,
+                            ax.plot(segment.time,
                                     segment._ydata_colsig,
                                     color=color,
                                     mec=mec,
@@ -533,7 +594,7 @@ def plot_old(npl_obj, data=None, *, ax=None, mew=None, color=None,
                                     **kwargs
                                     )
                         else:
-                            ax.plot(segment._time,
+                            ax.plot(segment.time,
                                     segment._ydata_colsig,
                                     # color=color,
                                     mec=mec,
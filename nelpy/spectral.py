@@ -0,0 +1,216 @@
+#encoding : utf-8
+"""This module implements epoch-aware spectral estimation for core nelpy
+objects.
+
+Segments are drawn from within each epoch (never across epoch boundaries),
+and the segments of all epochs and signals are transformed together, in
+batched FFT calls.
+"""
+
+__all__ = ['psd',
+           'spectrogram']
+
+import numpy as np
+import warnings
+
+from collections import namedtuple
+from scipy.signal import get_window, detrend as _detrend
+from scipy.signal.windows import dpss
+
+PSD = namedtuple('PSD', ['freqs', 'power', 'n_segments'])
+Spectrogram = namedtuple('Spectrogram', ['freqs', 'time', 'power'])
+
+def psd(asa, *, method='welch', nperseg=256, noverlap=None, nfft=None,
+        window='hann', NW=3, n_tapers=None, detrend='constant',
+        scaling='density', batch_size=1024):
+    """Power spectral density of an AnalogSignalArray, averaged over all
+    segments of all epochs.
+
+    Parameters
+    ----------
+    asa : nelpy.core.AnalogSignalArray
+        Regularly sampled signal(s). Only data within the support is used.
+    method : string, optional
+        One of ['welch', 'multitaper']. Default is 'welch'.
+    nperseg : int, optional
+        Length of each segment (in samples). Epochs shorter than nperseg
+        are ignored. Default is 256.
+    noverlap : int, optional
+        Number of samples by which consecutive segments overlap. Default is
+        nperseg // 2.
+    nfft : int, optional
+        Length of the FFT used, if a zero padded FFT is desired. Default is
+        nperseg.
+    window : str or tuple or array_like, optional
+        Window used by the 'welch' method. Default is 'hann'.
+    NW : float, optional
+        Time-half-bandwidth product of the DPSS tapers used by the
+        'multitaper' method. Default is 3.
+    n_tapers : int, optional
+        Number of DPSS tapers. Default is 2*NW - 1.
+    detrend : str or False, optional
+        One of ['constant', 'linear', False]. Default is 'constant'.
+    scaling : { 'density', 'spectrum' }, optional
+        Power spectral density (units**2/Hz) or power spectrum (units**2).
+        'spectrum' is only supported by the 'welch' method. Default is
+        'density'.
+    batch_size : int, optional
+        Number of segments transformed at a time. Default is 1024.
+
+    Returns
+    -------
+    out : PSD
+        Named tuple with fields freqs (n_freqs,), power (n_signals,
+        n_freqs), and n_segments (the number of averaged segments).
+    """
+    fs, starts, _ = _get_segments(asa, nperseg=nperseg, noverlap=noverlap)
+    tapers = _get_tapers(method, nperseg, window=window, NW=NW,
+                         n_tapers=n_tapers, scaling=scaling)
+    freqs = _get_freqs(asa, nperseg=nperseg, nfft=nfft, fs=fs)
+
+    power = np.zeros((asa.n_signals, len(freqs)))
+    for batch_power in _segment_power(asa._ydata, starts, tapers, nfft=nfft,
+                                      detrend=detrend, fs=fs, scaling=scaling,
+                                      batch_size=batch_size):
+        power += batch_power.sum(axis=0)
+    if len(starts) > 0:
+        power /= len(starts)
+    else:
+        power[:] = np.nan
+
+    return PSD(freqs=freqs, power=power, n_segments=len(starts))
+
+def spectrogram(asa, *, method='welch', nperseg=256, noverlap=None, nfft=None,
+                window='hann', NW=3, n_tapers=None, detrend='constant',
+                scaling='density', batch_size=1024):
+    """Spectrogram of an AnalogSignalArray, computed within each epoch.
+
+    Takes the same parameters as psd, except that the default noverlap is
+    nperseg // 8.
+
+    Returns
+    -------
+    out : Spectrogram
+        Named tuple with fields freqs (n_freqs,), time (n_segments,), and
+        power (n_signals, n_freqs, n_segments). time holds the center time
+        of each segment; segments of all epochs are concatenated in time.
+    """
+    if noverlap is None:
+        noverlap = nperseg // 8
+    fs, starts, _ = _get_segments(asa, nperseg=nperseg, noverlap=noverlap)
+    tapers = _get_tapers(method, nperseg, window=window, NW=NW,
+                         n_tapers=n_tapers, scaling=scaling)
+    freqs = _get_freqs(asa, nperseg=nperseg, nfft=nfft, fs=fs)
+
+    power = np.zeros((asa.n_signals, len(freqs), len(starts)))
+    ii = 0
+    for batch_power in _segment_power(asa._ydata, starts, tapers, nfft=nfft,
+                                      detrend=detrend, fs=fs, scaling=scaling,
+                                      batch_size=batch_size):
+        n_batch = batch_power.shape[0]
+        power[:,:,ii:ii+n_batch] = np.transpose(batch_power, (1, 2, 0))
+        ii += n_batch
+
+    time = (asa._time[starts] + asa._time[starts + nperseg - 1]) / 2
+
+    return Spectrogram(freqs=freqs, time=time, power=power)
+
+def _get_segments(asa, *, nperseg, noverlap):
+    """Return fs, and the first sample index and epoch index of every segment
+    that lies entirely within an epoch."""
+    fs = asa.fs
+    if fs is None:
+        raise ValueError("the AnalogSignalArray must have a sampling rate, fs!")
+    if noverlap is None:
+        noverlap = nperseg // 2
+    if not 0 <= noverlap < nperseg:
+        raise ValueError("noverlap must be less than nperseg!")
+    step = nperseg - noverlap
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        lengths = np.atleast_1d(asa.lengths)
+    cum_lengths = np.insert(np.cumsum(lengths), 0, 0)
+
+    starts = []
+    epoch_ids = []
+    for ii, (start, length) in enumerate(zip(cum_lengths[:-1], lengths)):
+        if length < nperseg:
+            continue
+        epoch_starts = start + np.arange(0, length - nperseg + 1, step)
+        starts.append(epoch_starts)
+        epoch_ids.append(np.full(len(epoch_starts), ii))
+
+    if not starts:
+        warnings.warn("no epoch is at least nperseg samples long")
+        return fs, np.array([], dtype=int), np.array([], dtype=int)
+
+    return fs, np.concatenate(starts), np.concatenate(epoch_ids)
+
+def _get_tapers(method, nperseg, *, window, NW, n_tapers, scaling):
+    """Return the tapers (windows) with shape (n_tapers, nperseg)."""
+    if method == 'welch':
+        return np.atleast_2d(get_window(window, nperseg))
+    elif method == 'multitaper':
+        if scaling == 'spectrum':
+            # the power spectrum is scaled by the sum of each taper, which
+            # is zero for the DPSS tapers of odd order
+            raise ValueError("scaling 'spectrum' is not supported by the "
+                             "'multitaper' method; use scaling 'density'")
+        if n_tapers is None:
+            n_tapers = max(int(2*NW) - 1, 1)
+        return np.atleast_2d(dpss(nperseg, NW, Kmax=n_tapers))
+    raise ValueError("method '{}' not understood!".format(method))
+
+def _get_freqs(asa, *, nperseg, nfft, fs):
+    """Return the frequencies of the (one- or two-sided) spectrum."""
+    if nfft is None:
+        nfft = nperseg
+    if np.iscomplexobj(asa._ydata):
+        return np.fft.fftfreq(nfft, 1/fs)
+    return np.fft.rfftfreq(nfft, 1/fs)
+
+def _segment_power(ydata, starts, tapers, *, nfft, detrend, fs, scaling,
+                   batch_size):
+    """Yield the taper-averaged power of each segment, batch by batch, with
+    shape (n_batch, n_signals, n_freqs)."""
+    n_tapers, nperseg = tapers.shape
+    if nfft is None:
+        nfft = nperseg
+    onesided = not np.iscomplexobj(ydata)
+
+    if scaling == 'density':
+        scales = 1.0 / (fs * (tapers**2).sum(axis=1))
+    elif scaling == 'spectrum':
+        scales = 1.0 / tapers.sum(axis=1)**2
+    else:
+        raise ValueError("scaling '{}' not understood!".format(scaling))
+
+    offsets = np.arange(nperseg)
+    for batch_start in range(0, len(starts), batch_size):
+        idx = starts[batch_start:batch_start+batch_size, np.newaxis] + offsets
+        segments = np.transpose(ydata[:, idx], (1, 0, 2)) # (n_batch, n_signals, nperseg)
+        if detrend == 'constant':
+            segments = segments - segments.mean(axis=-1, keepdims=True)
+        elif detrend == 'linear':
+            segments = _detrend(segments, type='linear', axis=-1)
+        elif detrend:
+            raise ValueError("detrend '{}' not understood!".format(detrend))
+
+        # (n_batch, n_signals, n_tapers, nperseg)
+        tapered = segments[:, :, np.newaxis, :] * tapers
+        if onesided:
+            spectra = np.fft.rfft(tapered, n=nfft, axis=-1)
+        else:
+            spectra = np.fft.fft(tapered, n=nfft, axis=-1)
+        power = np.abs(spectra)**2
+        power = np.tensordot(power, scales / n_tapers, axes=([2], [0]))
+
+        if onesided:
+            # account for the negative frequencies (not DC or Nyquist)
+            if nfft % 2:
+                power[..., 1:] *= 2
+            else:
+                power[..., 1:-1] *= 2
+
+        yield power
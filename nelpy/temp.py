@@ -48,7 +48,7 @@ def detect_ripples(eeg):
             )
 
     # convert bounds to time in seconds
-    timebounds = ripple_envelope.time[bounds]
+    timebounds = ripple_envelope._time[bounds]
 
     # add 1/fs to stops for open interval
     timebounds[:,1] += 1/eeg.fs
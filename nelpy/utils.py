@@ -18,12 +18,14 @@ from itertools import tee
 from collections import namedtuple
 from math import floor
 from scipy.signal import hilbert
+from scipy.fftpack import next_fast_len
 import scipy.ndimage.filters #import gaussian_filter1d, gaussian_filter
 from numpy import log, ceil
 import copy
 
 from . import core # so that core.AnalogSignalArray is exposed
 from . import auxiliary # so that auxiliary.TuningCurve1D is epxosed
+from .utils_ import cache, copying
 
 # def sub2ind(array_shape, rows, cols):
 #     ind = rows*array_shape[1] + cols
@@ -184,8 +186,37 @@ def spatial_sparsity(ratemap):
 
         return sparsity/number_of_spatial_bins
 
-def downsample_analogsignalarray(obj, *, fs_out, aafilter=True, inplace=False):
-    # TODO add'l kwargs
+def downsample_analogsignalarray(obj, *, fs_out, aafilter=True, inplace=False,
+                                 method='filtfilt', buffer_len=4194304):
+    """Downsample a regularly sampled AnalogSignalArray to fs_out.
+
+    Parameters
+    ----------
+    obj : AnalogSignalArray
+    fs_out : float
+        Desired sampling rate (in Hz). Must be less than obj.fs.
+    aafilter : bool, optional
+        If True (default), an anti-aliasing filter is applied. If False,
+        the data are simply interpolated at the new sample times.
+    inplace : bool, optional
+        If True, obj is modified in place. Default is False.
+    method : string, optional
+        One of ['filtfilt', 'polyphase']. 'filtfilt' (default) applies a
+        zero-phase IIR filter, and then interpolates the filtered data at
+        the new sample times. 'polyphase' uses rational-rate polyphase FIR
+        filtering (as in scipy.signal.resample_poly) within each epoch, and
+        yields exact decimated timestamps. If fs_out/fs is not a ratio of
+        integers up/down with down <= 1000, the closest such ratio is used,
+        the output sampling rate is adjusted accordingly, and a warning is
+        issued.
+    buffer_len : int, optional
+        Epochs are processed in chunks of (approximately) this many samples.
+        Default is 2**22 = 4194304 samples.
+
+    Returns
+    -------
+    out : AnalogSignalArray
+    """
 
     if not isinstance(obj, core.AnalogSignalArray):
         raise TypeError('obj is expected to be a nelpy.core.AnalogSignalArray!')
@@ -195,8 +226,13 @@ def downsample_analogsignalarray(obj, *, fs_out, aafilter=True, inplace=False):
     if inplace:
         out = obj
     else:
-        from copy import deepcopy
-        out = deepcopy(obj)
+        # ydata and time are replaced below
+        out = copying.copy_without(obj, '_ydata', '_time')
+
+    if aafilter and method == 'polyphase':
+        return _downsample_polyphase(obj, out, fs_out=fs_out, buffer_len=buffer_len)
+    elif method not in ('polyphase', 'filtfilt'):
+        raise ValueError("method '{}' not understood!".format(method))
 
     if aafilter:
         from scipy.signal import sosfiltfilt, iirdesign
@@ -214,6 +250,7 @@ def downsample_analogsignalarray(obj, *, fs_out, aafilter=True, inplace=False):
         sos = iirdesign(wp, ws, gpass=gpass, gstop=gstop, ftype='cheby2', output='sos')
 
         fei = np.insert(np.cumsum(obj.lengths), 0, 0) # filter epoch indices, fei
+        ydata = np.zeros_like(obj._ydata, dtype=np.result_type(obj._ydata, float))
 
         for ii in range(len(fei)-1):
             start, stop = fei[ii], fei[ii+1]
@@ -224,12 +261,83 @@ def downsample_analogsignalarray(obj, *, fs_out, aafilter=True, inplace=False):
                 rel_st_idx = int(buff_st_idx - chk_st_idx)
                 rel_nd_idx = int(buff_nd_idx - chk_st_idx)
                 this_y_chk = sosfiltfilt(sos, obj._ydata_rowsig[:,chk_st_idx:chk_nd_idx])
-                out._ydata[:,buff_st_idx:buff_nd_idx] = this_y_chk[:,rel_st_idx:rel_nd_idx]
+                ydata[:,buff_st_idx:buff_nd_idx] = this_y_chk[:,rel_st_idx:rel_nd_idx]
+    else:
+        ydata = obj._ydata
 
+    # the (filtered) data are interpolated at the new sample times; out
+    # only refers to the data of obj until it is renewed below
+    out._ydata = ydata
+    out._time = obj._time
     downsampled = out.simplify(ds=1/fs_out)
     out._ydata = downsampled._ydata
     out._time = downsampled.time
     out._fs = fs_out
+    out.__renew__()
+    return out
+
+def _downsample_polyphase(obj, out, *, fs_out, buffer_len):
+    """Polyphase downsampling of obj into out; see downsample_analogsignalarray.
+
+    Each epoch is resampled by a rational factor up/down, in chunks whose
+    boundaries are multiples of down input samples, with enough context on
+    either side of every chunk for the FIR filter to be unaffected by the
+    chunk boundaries. Output samples of an epoch lie exactly at
+    t0 + k*down/(up*fs), where t0 is the first sample time in that epoch.
+    """
+    from fractions import Fraction
+    from scipy.signal import resample_poly
+    from .core._analogsignalarray import RegularlySampledTime
+
+    fs = obj.fs
+    ratio = Fraction(fs_out/fs).limit_denominator(1000)
+    up, down = ratio.numerator, ratio.denominator
+    if up == 0:
+        raise ValueError("fs_out is too small compared to fs!")
+    if not np.isclose(fs * up / down, fs_out, rtol=1e-9, atol=0):
+        warnings.warn("fs_out/fs is not a ratio of small integers; the output "
+                      "will be sampled at {} Hz instead of {} Hz".format(
+                          fs * up / down, fs_out))
+
+    # resample_poly uses a Kaiser-windowed FIR filter with 10*max(up, down)
+    # taps on either side of the center (in the upsampled domain):
+    half_len = 10 * max(up, down)
+    pad = int(np.ceil((half_len / up + 1) / down)) * down
+    buffer_len = max(int(buffer_len // down), 1) * down
+
+    ydata = []
+    t0 = []
+    n_outs = []
+    fei = np.insert(np.cumsum(obj.lengths), 0, 0) # epoch indices, fei
+    for ii in range(len(fei)-1):
+        start, stop = fei[ii], fei[ii+1]
+        n_samples = stop - start
+        if n_samples == 0:
+            continue
+        n_out = -(-n_samples*up // down) # ceil
+        epoch_ydata = np.zeros((obj.n_signals, n_out))
+        for buff_st_idx in range(0, n_samples, buffer_len):
+            buff_nd_idx = min(n_samples, buff_st_idx + buffer_len)
+            chk_st_idx = max(0, buff_st_idx - pad)
+            chk_nd_idx = min(n_samples, buff_nd_idx + pad)
+            this_y_chk = resample_poly(obj._ydata[:,start+chk_st_idx:start+chk_nd_idx],
+                                       up, down, axis=1)
+            out_st_idx = buff_st_idx * up // down
+            out_nd_idx = min(n_out, -(-buff_nd_idx*up // down))
+            rel_st_idx = out_st_idx - chk_st_idx * up // down
+            epoch_ydata[:,out_st_idx:out_nd_idx] = this_y_chk[:,rel_st_idx:rel_st_idx+out_nd_idx-out_st_idx]
+        ydata.append(epoch_ydata)
+        t0.append(obj._time[start])
+        n_outs.append(n_out)
+
+    if ydata:
+        out._ydata = np.hstack(ydata)
+    else:
+        out._ydata = np.zeros((obj.n_signals, 0))
+    # the output is regularly sampled within each epoch:
+    out._time = RegularlySampledTime(t0, n_outs, fs * up / down)
+    out._fs = fs * up / down
+    out.__renew__()
     return out
 
 def get_mua(st, ds=None, sigma=None, bw=None, _fast=True):
@@ -631,11 +739,11 @@ def get_direction(asa, *, sigma=None):
 
     l2r = get_contiguous_segments(np.argwhere(direction>0).squeeze(), step=1)
     l2r[:,1] -= 1 # change bounds from [inclusive, exclusive] to [inclusive, inclusive]
-    l2r = core.EpochArray(asa.time[l2r])
+    l2r = core.EpochArray(asa._time[l2r])
 
     r2l = get_contiguous_segments(np.argwhere(direction<0).squeeze(), step=1)
     r2l[:,1] -= 1 # change bounds from [inclusive, exclusive] to [inclusive, inclusive]
-    r2l = core.EpochArray(asa.time[r2l])
+    r2l = core.EpochArray(asa._time[r2l])
 
     return l2r, r2l
 
@@ -935,6 +1043,59 @@ def signal_envelope1D(data, *, sigma=None, fs=None):
     UPDATE: this is actually epoch-aware by now!
 
     sigma = 0 means no smoothing (default 4 ms)
+
+    See signal_envelope, which this function wraps, for multiple signals,
+    long epochs, and instantaneous phase and frequency.
+    """
+    return signal_envelope(data, sigma=sigma, fs=fs)
+
+def signal_envelope(data, *, sigma=None, fs=None, return_phase=False,
+                    return_frequency=False, block_len=1048576,
+                    overlap_len=None):
+    """Hilbert envelope of one or more signals, computed within each epoch.
+
+    Epochs longer than block_len samples are processed block by block
+    (overlap-save), with overlap_len samples on either side of each block,
+    so that no giant FFTs are required. Shorter epochs are batched together
+    (sorted by length) into a few FFT calls.
+
+    Parameters
+    ----------
+    data : AnalogSignalArray, ndarray or list
+        Signal(s) for which to compute the envelope. An ndarray or list can
+        be one dimensional, or have shape (n_signals, n_samples).
+    sigma : float, optional
+        Standard deviation (in seconds) of the Gaussian kernel with which
+        the envelope is smoothed. sigma = 0 means no smoothing. Default is
+        0.004 (4 ms).
+    fs : float, optional
+        Sampling rate (in Hz). Obtained from data if it is an
+        AnalogSignalArray.
+    return_phase : bool, optional
+        If True, also return the instantaneous phase (in radians). Default
+        is False.
+    return_frequency : bool, optional
+        If True, also return the instantaneous frequency (in Hz). Default
+        is False.
+    block_len : int, optional
+        Epochs longer than this (in samples) are processed in blocks of this
+        size. Default is 2**20 = 1048576 samples.
+    overlap_len : int, optional
+        Number of additional samples on either side of each block, to
+        suppress edge effects. Default is block_len // 4. Blocks differ
+        from the transform of the whole epoch by the tail of the Hilbert
+        kernel beyond the overlap, which, for a component with amplitude A
+        and frequency f, is at most about A*fs / (2*pi**2*f*overlap_len);
+        low frequencies thus require longer overlaps.
+
+    Returns
+    -------
+    envelope : AnalogSignalArray or ndarray
+        Same type (and shape) as data.
+    phase : AnalogSignalArray or ndarray
+        Only returned if return_phase is True. Not smoothed.
+    frequency : AnalogSignalArray or ndarray
+        Only returned if return_frequency is True. Not smoothed.
     """
 
     if sigma is None:
@@ -944,51 +1105,117 @@ def signal_envelope1D(data, *, sigma=None, fs=None):
             raise ValueError("sampling frequency must be specified!")
         elif isinstance(data, core.AnalogSignalArray):
             fs = data.fs
+    if overlap_len is None:
+        overlap_len = block_len // 4
 
     if isinstance(data, (np.ndarray, list)):
-        # Compute number of samples to compute fast FFTs
-        padlen = nextfastpower(len(data)) - len(data)
-        # Pad data
-        paddeddata = np.pad(data, (0, padlen), 'constant')
-        # Use hilbert transform to get an envelope
-        envelope = np.absolute(hilbert(paddeddata))
-        # Truncate results back to original length
-        envelope = envelope[:len(data)]
-        if sigma:
-            # Smooth envelope with a gaussian (sigma = 4 ms default)
-            EnvelopeSmoothingSD = sigma*fs
-            smoothed_envelope = scipy.ndimage.filters.gaussian_filter1d(envelope, EnvelopeSmoothingSD, mode='constant')
-            envelope = smoothed_envelope
+        dims = np.array(data).shape
+        ydata = np.atleast_2d(np.asarray(data, dtype=float))
+        bounds = [(0, ydata.shape[1])]
     elif isinstance(data, core.AnalogSignalArray):
-        newasa = copy.deepcopy(data)
+        ydata = data._ydata
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             cum_lengths = np.insert(np.cumsum(data.lengths), 0, 0)
+        bounds = list(zip(cum_lengths[:-1], cum_lengths[1:]))
+    else:
+        raise TypeError("unsupported input type!")
+
+    # the analytic signal is never stored as a whole; the envelope (and
+    # phase) of every block are written to the outputs directly
+    envelope = np.zeros(ydata.shape)
+    phase = None
+    if return_phase or return_frequency:
+        phase = np.zeros(ydata.shape)
+
+    def store(start, stop, analytic):
+        np.absolute(analytic, out=envelope[:,start:stop])
+        if phase is not None:
+            np.arctan2(analytic.imag, analytic.real, out=phase[:,start:stop])
+
+    _analytic_signal(ydata, bounds, store, block_len=block_len,
+                     overlap_len=overlap_len)
+
+    if sigma:
+        # Smooth envelope with a gaussian (sigma = 4 ms default)
+        EnvelopeSmoothingSD = sigma*fs
+        for start, stop in bounds:
+            scipy.ndimage.filters.gaussian_filter1d(envelope[:,start:stop], EnvelopeSmoothingSD, axis=1, mode='constant', output=envelope[:,start:stop])
+    outputs = [envelope]
+    if return_phase:
+        outputs.append(phase)
+    if return_frequency:
+        frequency = np.zeros_like(phase)
+        for start, stop in bounds:
+            if stop - start > 1:
+                unwrapped = np.unwrap(phase[:,start:stop], axis=1)
+                frequency[:,start:stop] = np.gradient(unwrapped, axis=1) * fs / (2*np.pi)
+        outputs.append(frequency)
+
+    if isinstance(data, core.AnalogSignalArray):
+        for ii, ydata in enumerate(outputs):
+            out = copying.copy_without(data, '_ydata')
+            out._ydata = ydata
+            out.__renew__()
+            outputs[ii] = out
+    else:
+        outputs = [np.reshape(ydata, dims) for ydata in outputs]
+
+    if len(outputs) == 1:
+        return outputs[0]
+    return tuple(outputs)
 
-        # for segment in data:
-        for idx in range(data.n_epochs):
-            # print('hilberting epoch {}/{}'.format(idx+1, data.n_epochs))
-            segment_data = data._ydata[:,cum_lengths[idx]:cum_lengths[idx+1]]
-            n_signals, n_samples = segment_data.shape
-            assert n_signals == 1, 'only 1D signals supported!'
-            # Compute number of samples to compute fast FFTs:
-            padlen = nextfastpower(n_samples) - n_samples
-            # Pad data
-            paddeddata = np.pad(segment_data.squeeze(), (0, padlen), 'constant')
-            # Use hilbert transform to get an envelope
-            envelope = np.absolute(hilbert(paddeddata))
-            # free up memory
-            del paddeddata
-            # Truncate results back to original length
-            envelope = envelope[:n_samples]
-            if sigma:
-                # Smooth envelope with a gaussian (sigma = 4 ms default)
-                EnvelopeSmoothingSD = sigma*fs
-                smoothed_envelope = scipy.ndimage.filters.gaussian_filter1d(envelope, EnvelopeSmoothingSD, mode='constant')
-                envelope = smoothed_envelope
-            newasa._ydata[:,cum_lengths[idx]:cum_lengths[idx+1]] = np.atleast_2d(envelope)
-        return newasa
-    return envelope
+def _analytic_signal(ydata, bounds, store, *, block_len, overlap_len):
+    """Analytic signal of ydata (n_signals, n_samples), computed separately
+    within each (start, stop) sample range in bounds.
+
+    Ranges longer than block_len are processed block by block, with
+    overlap_len samples on either side of each block, of which only the
+    central part is kept (overlap-save). Shorter ranges are sorted by length
+    and zero-padded into batches of at most block_len samples per signal,
+    which are transformed with a single FFT call each.
+
+    The analytic signal of samples start:stop is passed to
+    store(start, stop, analytic) as soon as it has been computed, so that
+    the (complex) analytic signal of all of ydata is never held in memory.
+    """
+    n_signals = ydata.shape[0]
+
+    def transform_batch(batch):
+        n_fft = nextfastpower(max(stop - start for start, stop in batch))
+        padded = np.zeros((len(batch), n_signals, n_fft))
+        for ii, (start, stop) in enumerate(batch):
+            padded[ii,:,:stop-start] = ydata[:,start:stop]
+        transformed = hilbert(padded, axis=-1)
+        for ii, (start, stop) in enumerate(batch):
+            store(start, stop, transformed[ii,:,:stop-start])
+
+    short = []
+    for start, stop in bounds:
+        n_samples = stop - start
+        if n_samples <= 0:
+            continue
+        if n_samples <= block_len:
+            short.append((start, stop))
+            continue
+        for buff_st_idx in range(start, stop, block_len):
+            chk_st_idx = max(start, buff_st_idx - overlap_len)
+            buff_nd_idx = min(stop, buff_st_idx + block_len)
+            chk_nd_idx = min(stop, buff_nd_idx + overlap_len)
+            n_fft = nextfastpower(chk_nd_idx - chk_st_idx)
+            this_chk = hilbert(ydata[:,chk_st_idx:chk_nd_idx], N=n_fft, axis=-1)
+            store(buff_st_idx, buff_nd_idx, this_chk[:,buff_st_idx-chk_st_idx:buff_nd_idx-chk_st_idx])
+
+    short.sort(key=lambda bound: bound[1] - bound[0])
+    batch = []
+    for start, stop in short:
+        # epochs are sorted by length, so that this one is the longest yet
+        if batch and (len(batch) + 1) * nextfastpower(stop - start) > block_len:
+            transform_batch(batch)
+            batch = []
+        batch.append((start, stop))
+    if batch:
+        transform_batch(batch)
 
 def nextpower(n, base=2.0):
     """Return the next integral power of two greater than the given number.
@@ -1014,24 +1241,13 @@ def nextfastpower(n):
     where x, y, and z are integers.
     This is useful for ensuring fast FFT sizes.
 
-    From https://gist.github.com/bhawkins/4479607 (Brian Hawkins)
-
     See also http://scipy.github.io/devdocs/generated/scipy.fftpack.next_fast_len.html
     """
     if n < 7:
         return max (n, 1)
-    # x, y, and z are all bounded from above by the formula of nextpower.
-    # Compute all possible combinations for powers of 3 and 5.
-    # (Not too many for reasonable FFT sizes.)
-    def power_series (x, base):
-        nmax = ceil (log (x) / log (base))
-        return np.logspace (0.0, nmax, num=nmax+1, base=base)
-    n35 = np.outer (power_series (n, 3.0), power_series (n, 5.0))
-    n35 = n35[n35<=n]
-    # Lump the powers of 3 and 5 together and solve for the powers of 2.
-    n2 = nextpower (n / n35)
-    return int (min (n2 * n35))
+    return next_fast_len(int(n))
 
+@cache.memoize(bypass=('inplace',))
 def gaussian_filter(obj, *, fs=None, sigma=None, bw=None, inplace=False):
     """Smooths with a Gaussian kernel.
 
@@ -1060,8 +1276,12 @@ def gaussian_filter(obj, *, fs=None, sigma=None, bw=None, inplace=False):
         An object with smoothed data is returned.
     """
 
-    if not inplace:
-        out = copy.deepcopy(obj)
+    if inplace:
+        out = obj
+    elif isinstance(obj, core.AnalogSignalArray):
+        out = copying.copy_without(obj, '_ydata') # ydata is replaced below
+    elif isinstance(obj, core.BinnedSpikeTrainArray):
+        out = copying.copy_without(obj, '_data') # data is replaced below
     else:
         out = obj
 
@@ -1089,16 +1309,24 @@ def gaussian_filter(obj, *, fs=None, sigma=None, bw=None, inplace=False):
 
     cum_lengths = np.insert(np.cumsum(out.lengths), 0, 0)
 
+    # now smooth each epoch separately, writing directly into the output
+    # buffer (gaussian_filter1d filters line by line, through an internal
+    # line buffer, so that input and output may be the same array)
     if isinstance(out, core.AnalogSignalArray):
-        # now smooth each epoch separately
-        for idx in range(asa.n_epochs):
-            out._ydata[:,cum_lengths[idx]:cum_lengths[idx+1]] = scipy.ndimage.filters.gaussian_filter(asa._ydata[:,cum_lengths[idx]:cum_lengths[idx+1]], sigma=(0,sigma), truncate=bw)
+        ydata = obj._ydata
+        if not inplace:
+            out._ydata = np.empty_like(ydata)
+        for idx in range(out.n_epochs):
+            epoch = slice(cum_lengths[idx], cum_lengths[idx+1])
+            scipy.ndimage.filters.gaussian_filter1d(ydata[:,epoch], sigma, axis=1, truncate=bw, output=out._ydata[:,epoch])
+        out.__renew__()
     elif isinstance(out, core.BinnedSpikeTrainArray):
-        out._data = out._data.astype(float)
-        # now smooth each epoch separately
+        out._data = obj._data.astype(float, copy=not inplace)
         for idx in range(out.n_epochs):
-            out._data[:,cum_lengths[idx]:cum_lengths[idx+1]] = scipy.ndimage.filters.gaussian_filter(out._data[:,cum_lengths[idx]:cum_lengths[idx+1]], sigma=(0,sigma), truncate=bw)
+            epoch = slice(cum_lengths[idx], cum_lengths[idx+1])
+            scipy.ndimage.filters.gaussian_filter1d(out._data[:,epoch], sigma, axis=1, truncate=bw, output=out._data[:,epoch])
             # out._data[:,cum_lengths[idx]:cum_lengths[idx+1]] = self._smooth_array(out._data[:,cum_lengths[idx]:cum_lengths[idx+1]], w=w)
+        out.__renew__()
 
     return out
 
@@ -1223,7 +1451,7 @@ def get_threshold_crossing_epochs(asa, t1=None, t2=None, mode='above'):
         mode=mode
     )
     # convert bounds to time in seconds
-    epoch_bounds = asa.time[epoch_bounds]
+    epoch_bounds = asa._time[epoch_bounds]
     if len(epoch_bounds) == 0:
         return core.EpochArray(empty=True)
     # add 1/fs to stops for open interval
@@ -1394,16 +1622,16 @@ def collapse_time(obj, gap=0):
         newsupport = core.EpochArray(np.vstack((starts, stops)).T)
         new_obj._support = newsupport
 
-        new_time = obj.time.astype(float) # fast copy
+        new_time = np.array(obj._time, dtype=float)
         time_idx = np.insert(np.cumsum(obj.lengths),0,0)
 
         new_offset = 0
         for epidx in range(obj.n_epochs):
             if epidx > 0:
-                new_time[time_idx[epidx]:time_idx[epidx+1]] = new_time[time_idx[epidx]:time_idx[epidx+1]] - obj.time[time_idx[epidx]] + new_offset + gap
+                new_time[time_idx[epidx]:time_idx[epidx+1]] = new_time[time_idx[epidx]:time_idx[epidx+1]] - obj._time[time_idx[epidx]] + new_offset + gap
                 new_offset += durations[epidx] + gap
             else:
-                new_time[time_idx[epidx]:time_idx[epidx+1]] = new_time[time_idx[epidx]:time_idx[epidx+1]] - obj.time[time_idx[epidx]] + new_offset
+                new_time[time_idx[epidx]:time_idx[epidx+1]] = new_time[time_idx[epidx]:time_idx[epidx+1]] - obj._time[time_idx[epidx]] + new_offset
                 new_offset += durations[epidx]
         new_obj._time = new_time
 
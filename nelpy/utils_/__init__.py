@@ -4,5 +4,7 @@ nelpy utils
 """
 
 from . import decorators
+from . import copying
+from . import cache
 
 __version__ = '0.0.2'  # should I maintain a separate version for this?
\ No newline at end of file
@@ -0,0 +1,406 @@
+"""
+:mod:`cache` --- content-addressed result cache for derived computations
+==========================================================================
+
+Expensive derived results (binned spike trains, smoothed or filtered
+signals, tuning curves, decoded posteriors, ...) are memoized on a content
+fingerprint of their inputs, i.e., a hash of all data buffers plus metadata,
+so that identical intermediates are not recomputed when re-running
+notebooks or parameter sweeps.
+
+The cache is disabled by default. Enable it with configure():
+
+>>> from nelpy.utils_ import cache
+>>> cache.configure(maxsize=256, cache_dir='~/.nelpy_cache', max_bytes=2**32)
+
+Results are kept in an in-memory LRU cache of maxsize entries and, if a
+cache_dir is given, also pickled to disk, where the least recently used
+files are evicted once the directory grows beyond max_bytes.
+
+Cached results are returned as copies, so that modifying a
+returned object never affects the cache.
+"""
+
+import copy
+import functools
+import hashlib
+import inspect
+import numbers
+import os
+import pickle
+import types
+import warnings
+import numpy as np
+
+from collections import OrderedDict
+
+__all__ = ['fingerprint',
+           'ResultCache',
+           'configure',
+           'get_cache',
+           'clear',
+           'make_key',
+           'get',
+           'put',
+           'memoize']
+
+# attributes that hold derived state (slicers, interpolation objects,
+# iterator state, ...) rather than content, and which are therefore not part
+# of a fingerprint:
+_NOT_CONTENT = {'__version__', '_stored_hash_', '_interp', '_interp_key',
+                '_minmax_pyramid', '_minmax_pyramid_key', '_data_version',
+                '_epochsignalslicer', '_epochdata',
+                '_epochtime', '_slicer', 'loc', 'iloc', '_index'}
+
+def fingerprint(obj):
+    """Return a content fingerprint (hex digest) of obj.
+
+    The fingerprint is a hash of all data buffers and metadata of obj, so
+    that two objects with identical content have identical fingerprints,
+    irrespective of their identity.
+
+    Parameters
+    ----------
+    obj : object
+        numpy arrays and scalars, numbers, strings, None, lists, tuples and
+        dicts thereof, functions (by their code, closures and referenced
+        globals), and objects (such as core nelpy objects) made up of these.
+
+    Returns
+    -------
+    fingerprint : str
+
+    Raises
+    ------
+    TypeError
+        If obj contains anything that cannot be fingerprinted.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    _update(h, obj, set())
+    return h.hexdigest()
+
+def _update(h, obj, seen):
+    """Feed obj into the hash object h."""
+    if obj is None or isinstance(obj, (bool, numbers.Number, str, bytes)) \
+            and not isinstance(obj, np.generic):
+        h.update(type(obj).__name__.encode())
+        h.update(repr(obj).encode())
+    elif isinstance(obj, (np.ndarray, np.generic)):
+        arr = np.asarray(obj)
+        h.update('ndarray{}{}'.format(arr.dtype, arr.shape).encode())
+        if arr.dtype == object:
+            for elem in arr.flat:
+                _update(h, elem, seen)
+        else:
+            h.update(np.ascontiguousarray(arr).ravel().view(np.uint8))
+    elif isinstance(obj, (list, tuple)):
+        h.update('{}{}'.format(type(obj).__name__, len(obj)).encode())
+        for elem in obj:
+            _update(h, elem, seen)
+    elif isinstance(obj, dict):
+        h.update('dict{}'.format(len(obj)).encode())
+        for key in sorted(obj, key=repr):
+            _update(h, key, seen)
+            _update(h, obj[key], seen)
+    elif isinstance(obj, functools.partial):
+        h.update(b'partial')
+        _update(h, (obj.func, obj.args, obj.keywords), seen)
+    elif isinstance(obj, types.MethodType):
+        h.update(b'method')
+        _update(h, (obj.__func__, obj.__self__), seen)
+    elif isinstance(obj, types.FunctionType):
+        _update_function(h, obj, seen)
+    elif isinstance(obj, types.BuiltinFunctionType):
+        h.update('{}.{}'.format(obj.__module__, obj.__qualname__).encode())
+    elif isinstance(obj, np.ufunc):
+        h.update('numpy.{}'.format(obj.__name__).encode())
+    elif isinstance(obj, types.ModuleType):
+        h.update('module {}'.format(obj.__name__).encode())
+    elif isinstance(obj, type):
+        h.update('type {}.{}'.format(obj.__module__, obj.__qualname__).encode())
+    elif id(obj) in seen:
+        h.update(b'<reference>') # e.g., a slicer referring back to its parent
+    elif isinstance(getattr(type(obj), 'fingerprint', None), property):
+        h.update(obj.fingerprint.encode())
+    elif hasattr(obj, '__dict__'):
+        seen.add(id(obj))
+        h.update('{}.{}'.format(type(obj).__module__, type(obj).__qualname__).encode())
+        for attr in sorted(obj.__dict__):
+            if attr in _NOT_CONTENT:
+                continue
+            h.update(attr.encode())
+            _update(h, obj.__dict__[attr], seen)
+    else:
+        raise TypeError("cannot fingerprint object of type {}".format(type(obj)))
+
+def _update_function(h, func, seen, follow_globals=True):
+    """Feed a Python function into h.
+
+    Lambdas and closures share their qualified names, so we also hash what
+    the function does: its code, defaults, closed-over values, and the
+    values of the globals that it refers to. Functions found among those
+    globals are hashed without following their own globals in turn.
+    """
+    h.update('{}.{}'.format(func.__module__, func.__qualname__).encode())
+    if id(func) in seen:
+        return
+    seen.add(id(func))
+    _update_code(h, func.__code__, seen)
+    _update(h, (func.__defaults__, func.__kwdefaults__), seen)
+    for cell in func.__closure__ or ():
+        _update(h, cell.cell_contents, seen)
+    if not follow_globals:
+        return
+    for name in _global_names(func.__code__):
+        if name not in func.__globals__:
+            continue
+        value = func.__globals__[name]
+        h.update(name.encode())
+        if isinstance(value, types.FunctionType):
+            _update_function(h, value, seen, follow_globals=False)
+        else:
+            _update(h, value, seen)
+
+def _update_code(h, code, seen):
+    """Feed a code object, including those of nested functions, into h."""
+    h.update(code.co_code)
+    _update(h, code.co_names, seen)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_code(h, const, seen)
+        else:
+            _update(h, const, seen)
+
+def _global_names(code):
+    """Names that code (or any code nested in it) may look up globally."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return sorted(names)
+
+def _content_fingerprint(obj):
+    """Fingerprint of the content of a (core) object, bypassing its own
+    fingerprint property; used to implement that property."""
+    h = hashlib.blake2b(digest_size=20)
+    seen = {id(obj)}
+    h.update('{}.{}'.format(type(obj).__module__, type(obj).__qualname__).encode())
+    for attr in sorted(obj.__dict__):
+        if attr in _NOT_CONTENT:
+            continue
+        h.update(attr.encode())
+        _update(h, obj.__dict__[attr], seen)
+    return h.hexdigest()
+
+class ResultCache(object):
+    """In-memory LRU cache with an optional on-disk cache directory.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of results kept in memory. Default is 128.
+    cache_dir : str, optional
+        Directory in which results are pickled. Default is None (results
+        are only kept in memory).
+    max_bytes : int, optional
+        Maximum total size of the cache directory, beyond which the least
+        recently used results are evicted. Default is 1 GiB.
+    """
+
+    def __init__(self, *, maxsize=128, cache_dir=None, max_bytes=2**30):
+        self._maxsize = maxsize
+        self._max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._cache_dir = None
+        if cache_dir is not None:
+            self._cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+            os.makedirs(self._cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        address_str = " at " + str(hex(id(self)))
+        return "<ResultCache%s: %d results in memory, cache_dir=%s>" % (
+            address_str, len(self._memory), self._cache_dir)
+
+    def __len__(self):
+        return len(self._memory)
+
+    def __contains__(self, key):
+        return key in self._memory or (self._cache_dir is not None
+                                       and os.path.exists(self._path(key)))
+
+    @property
+    def cache_dir(self):
+        """(str) Directory of the on-disk cache, or None."""
+        return self._cache_dir
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key + '.pkl')
+
+    def get(self, key):
+        """Return (True, result) if key is cached, and (False, None)
+        otherwise. The result itself is not copied."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return True, self._memory[key]
+        if self._cache_dir is not None:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path) # mark as recently used
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                self._remember(key, value)
+                self.hits += 1
+                return True, value
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        """Store a result (without copying it)."""
+        self._remember(key, value)
+        if self._cache_dir is not None:
+            path = self._path(key)
+            tmp_path = path + '.{}.tmp'.format(os.getpid())
+            try:
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                warnings.warn("result could not be cached to disk: {}".format(e))
+                os.remove(tmp_path)
+            else:
+                self._evict()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._maxsize:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Remove the least recently used files from the cache directory
+        until it is no larger than max_bytes."""
+        entries = []
+        for entry in os.scandir(self._cache_dir):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self, *, disk=False):
+        """Clear the in-memory cache, and optionally the cache directory."""
+        self._memory.clear()
+        if disk and self._cache_dir is not None:
+            for entry in os.scandir(self._cache_dir):
+                if entry.name.endswith('.pkl'):
+                    os.remove(entry.path)
+
+_cache = None # the cache is disabled by default
+
+def configure(*, enabled=True, maxsize=128, cache_dir=None, max_bytes=2**30):
+    """Enable (or disable) the result cache used by memoized functions.
+
+    Parameters
+    ----------
+    enabled : bool, optional
+        Whether to cache results. Default is True.
+    maxsize, cache_dir, max_bytes :
+        See ResultCache.
+
+    Returns
+    -------
+    cache : ResultCache or None
+    """
+    global _cache
+    if enabled:
+        _cache = ResultCache(maxsize=maxsize, cache_dir=cache_dir, max_bytes=max_bytes)
+    else:
+        _cache = None
+    return _cache
+
+def get_cache():
+    """Return the active ResultCache, or None if caching is disabled."""
+    return _cache
+
+def clear(*, disk=False):
+    """Clear the active ResultCache (if any)."""
+    if _cache is not None:
+        _cache.clear(disk=disk)
+
+def make_key(name, *args, **kwargs):
+    """Return the cache key of calling name with args and kwargs, or None
+    if caching is disabled or the arguments cannot be fingerprinted."""
+    if _cache is None:
+        return None
+    try:
+        return fingerprint((name, args, kwargs))
+    except TypeError:
+        return None
+
+def get(key):
+    """Return (True, copy of result) if key is cached, and (False, None)
+    otherwise."""
+    if key is None or _cache is None:
+        return False, None
+    hit, value = _cache.get(key)
+    if hit:
+        return True, copy.deepcopy(value)
+    return False, None
+
+def put(key, value):
+    """Cache (a copy of) value under key, if caching is enabled."""
+    if key is not None and _cache is not None:
+        _cache.put(key, copy.deepcopy(value))
+
+def memoize(func=None, *, ignore=(), bypass=()):
+    """Decorator that caches the results of func in the active ResultCache.
+
+    Parameters
+    ----------
+    ignore : tuple of str, optional
+        Names of keyword arguments that do not affect the result (e.g.,
+        n_jobs), and that are therefore not part of the cache key.
+    bypass : tuple of str, optional
+        Names of keyword arguments (e.g., inplace) for which a truthy value
+        means that the result must not be cached.
+    """
+    if func is None:
+        return functools.partial(memoize, ignore=ignore, bypass=bypass)
+
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _cache is None:
+            return func(*args, **kwargs)
+        # key on all arguments, including defaults, so that omitting an
+        # argument and passing its default value hit the same entry:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        if any(arguments.get(kw) for kw in bypass):
+            return func(*args, **kwargs)
+        key = make_key(name, **{kw: val for kw, val in arguments.items()
+                                if kw not in ignore})
+        hit, value = get(key)
+        if hit:
+            return value
+        value = func(*args, **kwargs)
+        put(key, value)
+        return value
+
+    return wrapper
@@ -0,0 +1,99 @@
+"""
+:mod:`copying` --- copy helpers for nelpy core objects
+========================================================
+
+Deep copies of core objects (AnalogSignalArray, SpikeTrainArray,
+BinnedSpikeTrainArray and EpochArray) copy each numpy buffer with a single
+ndarray.copy(), instead of going through the generic deepcopy protocol, and
+share derived caches (such as interpolants) by reference. The original
+object is never modified, so that both objects remain independently
+writeable.
+
+Functions that are about to replace the (large) data buffers of a copy can
+use copy_without() to avoid copying those buffers in the first place.
+"""
+
+import copy
+import numpy as np
+
+__all__ = ['deepcopy',
+           'copy_without']
+
+# attributes holding state derived from the data of an object, such as
+# slicers (which refer back to their parent) and cached interpolants
+_DERIVED = {'_epochsignalslicer', '_epochdata', '_epochtime', '_slicer',
+            'loc', 'iloc', '_interp', '_minmax_pyramid'}
+
+def deepcopy(obj, memo, *, by_reference=()):
+    """Implementation of obj.__deepcopy__(memo) for core objects.
+
+    Numeric ndarray attributes of obj are copied with ndarray.copy(),
+    attributes listed in by_reference are shared as is, and all remaining
+    attributes (including object arrays) are deep-copied as usual.
+
+    Parameters
+    ----------
+    obj : object
+        Object to copy.
+    memo : dict
+        Memo dictionary passed to __deepcopy__.
+    by_reference : tuple of str, optional
+        Names of (immutable) attributes, such as caches, that are shared
+        without being copied.
+
+    Returns
+    -------
+    out : object
+        Copy of obj.
+    """
+    cls = obj.__class__
+    out = cls.__new__(cls)
+    memo[id(obj)] = out
+    for attr, val in obj.__dict__.items():
+        if isinstance(val, np.ndarray) and val.dtype != object:
+            out.__dict__[attr] = val.copy()
+        elif attr in by_reference:
+            out.__dict__[attr] = val
+        else:
+            out.__dict__[attr] = copy.deepcopy(val, memo)
+    return out
+
+def copy_without(obj, *attrs):
+    """Deep copy of obj, except for the attributes attrs, which are set to
+    None in the copy, e.g., because the caller is about to replace them.
+
+    Derived state (slicers, interpolants and pyramids) is not copied either,
+    since it refers to the data of obj, and any remaining references back to
+    obj are mapped to the copy, so that the data of obj are never copied.
+    The caller rebuilds the derived state with out.__renew__() once the
+    replaced attributes have been set.
+
+    Parameters
+    ----------
+    obj : object
+        Object to copy.
+    attrs : str
+        Names of the attributes not to copy.
+
+    Returns
+    -------
+    out : object
+        Copy of obj.
+
+    Examples
+    --------
+    >>> out = copy_without(asa, '_ydata')
+    >>> out._ydata = filtered
+    >>> out.__renew__()
+    """
+    cls = obj.__class__
+    out = cls.__new__(cls)
+    memo = {id(obj): out}
+    for attr, val in obj.__dict__.items():
+        if attr in attrs or attr in _DERIVED:
+            out.__dict__[attr] = None
+        elif isinstance(val, np.ndarray) and val.dtype != object:
+            out.__dict__[attr] = val.copy()
+        else:
+            out.__dict__[attr] = copy.deepcopy(val, memo)
+    return out
@@ -1,4 +1,305 @@
 """Tests for AnalogSignalArray"""
 
 # sig = nel.AnalogSignalArray(ydata=[1,2,3,4,5,4,7,8,9,10], timestamps=np.array([1,2,3,5,6,7,11,12,13,14])/5)
-# sig2 = nel.AnalogSignalArray(ydata=[[1,2,4,8,15,6,7,4,3,10],[10,11,13,14,15,16,17,18,19,110]], timestamps=np.array([1,2,3,5,6,7,11,12,13,14])/5)
\ No newline at end of file
+# sig2 = nel.AnalogSignalArray(ydata=[[1,2,4,8,15,6,7,4,3,10],[10,11,13,14,15,16,17,18,19,110]], timestamps=np.array([1,2,3,5,6,7,11,12,13,14])/5)
+
+import tracemalloc
+import numpy as np
+import pytest
+from nelpy.core import AnalogSignalArray, EpochArray
+
+def peak_memory(func, *args, **kwargs):
+    """Peak memory (in bytes) allocated while calling func(*args, **kwargs)."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+class TestMinMaxEnvelope:
+
+    def test_envelope_preserves_extrema(self):
+        fs = 1000
+        time = np.arange(0, 100, 1/fs)
+        ydata = np.sin(time)
+        ydata[5000] = 10
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=fs,
+                                support=EpochArray([[0, 40], [50, 90]]))
+        envelopes = asa.minmax_envelope(n_points=100)
+        assert len(envelopes) == 2
+        assert np.max([env.ymax.max() for env in envelopes]) == 10
+        assert np.min([env.ymin.min() for env in envelopes]) == asa.ydata.min()
+        for env in envelopes:
+            assert 100/2 <= len(env.xvals) < 100*4
+
+    def test_envelope_window(self):
+        fs = 1000
+        time = np.arange(0, 100, 1/fs)
+        asa = AnalogSignalArray(np.sin(time), timestamps=time, fs=fs)
+        envelopes = asa.minmax_envelope(n_points=100, start=4, stop=6)
+        assert len(envelopes) == 1
+        assert envelopes[0].xvals[0] <= 4
+        assert envelopes[0].xvals[-1] >= 6 - 0.1
+
+    def test_envelope_follows_in_place_writes(self):
+        asa = AnalogSignalArray(np.zeros(10000), fs=1000)
+        assert asa.minmax_envelope(n_points=100)[0].ymax.max() == 0
+        asa.ydata[0, 5000] = 3
+        asa.__renew__()
+        assert asa.minmax_envelope(n_points=100)[0].ymax.max() == 3
+        asa._ydata = np.full((1, 10000), -1.0)
+        assert asa.minmax_envelope(n_points=100)[0].ymax.max() == -1
+
+class TestAsarray:
+
+    def test_linear_matches_interp1d(self):
+        time = np.arange(0, 10, 0.1)
+        ydata = np.vstack((np.sin(time), np.cos(time)))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=10,
+                                support=EpochArray([[0, 4.05], [5, 9.95]]))
+        at = np.linspace(-1, 11, 301)
+        expected = asa._get_interp1d()(at)
+        assert np.allclose(asa.asarray(at=at).yvals, expected, equal_nan=True)
+
+    def test_single_signal_matches_interp1d(self):
+        time = np.arange(0, 10, 0.1)
+        asa = AnalogSignalArray(np.sin(time), timestamps=time, fs=10,
+                                support=EpochArray([[0, 4.05], [5, 9.95]]))
+        at = np.linspace(-1, 11, 301)
+        expected = asa._get_interp1d()(at).squeeze()
+        assert np.allclose(asa.asarray(at=at).yvals, expected, equal_nan=True)
+
+    def test_interpolation_follows_in_place_writes(self):
+        asa = AnalogSignalArray(np.arange(100.0), fs=10)
+        assert np.isclose(asa.asarray(at=[2.05]).yvals, 20.5)
+        asa.ydata[0] *= 2
+        asa.__renew__()
+        assert np.isclose(asa.asarray(at=[2.05]).yvals, 41)
+        asa._ydata = asa._ydata[:, ::-1].copy()
+        assert np.isclose(asa.asarray(at=[2.05]).yvals, 157)
+
+    def test_repeated_calls_reuse_the_interpolant(self):
+        asa = AnalogSignalArray(np.arange(100.0), fs=10)
+        asa.asarray(at=[2.05])
+        interp = asa._interp
+        assert interp is not None
+        for at in ([3.05], [1, 2, 3]):
+            asa.asarray(at=at)
+            assert np.array_equal(asa.ydata, np.arange(100.0)[np.newaxis])
+            assert asa._interp is interp
+
+class TestRestrict:
+
+    def test_restrict_matches_boolean_indexing(self):
+        time = np.arange(0, 100, 0.01)
+        ydata = np.vstack((np.sin(time), np.cos(time)))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=100)
+        epochs = EpochArray([[1, 2.5], [7.25, 9], [40, 41], [80.5, 99]])
+        restricted = asa[epochs]
+        keep = np.zeros(time.size, dtype=bool)
+        for start, stop in epochs.time:
+            keep |= (time >= start) & (time < stop)
+        assert np.array_equal(restricted.time, time[keep])
+        assert np.array_equal(restricted.ydata, asa.ydata[:, keep])
+
+    def test_writing_to_restricted_leaves_parent_untouched(self):
+        time = np.arange(0, 100, 0.01)
+        ydata = np.vstack((np.sin(time), np.cos(time)))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=100)
+        restricted = asa[EpochArray([[10, 20], [20, 30]])]
+        assert restricted.n_samples == 2000
+        for subset in (restricted, asa[:, 0], asa[[0]]):
+            assert not np.shares_memory(subset._ydata, asa._ydata)
+            assert not np.shares_memory(subset._time, asa._time)
+            subset._ydata[0, 0] = 5
+            subset._time[0] = -1
+        assert np.array_equal(asa._ydata, ydata)
+        assert np.array_equal(asa._time, time)
+
+class TestCopy:
+
+    def test_copy_leaves_original_writeable(self):
+        time = np.arange(0, 10, 0.01)
+        asa = AnalogSignalArray(np.sin(time), timestamps=time, fs=100)
+        asa2 = asa.copy()
+        assert not np.shares_memory(asa._ydata, asa2._ydata)
+        asa._ydata[0, 0] = 5
+        asa2._ydata[0, 1] = 7
+        assert asa2._ydata[0, 0] == 0
+        assert asa._ydata[0, 1] == np.sin(0.01)
+
+    def test_smooth_leaves_original_untouched(self):
+        time = np.arange(0, 10, 0.01)
+        ydata = np.random.RandomState(0).randn(len(time))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=100,
+                                support=EpochArray([[0, 4], [5, 9.995]]))
+        original = asa._ydata.copy()
+        smoothed = asa.smooth(sigma=0.05)
+        assert np.array_equal(asa._ydata, original)
+        assert not np.shares_memory(asa._ydata, smoothed._ydata)
+        assert asa._ydata.flags.writeable
+        asa.smooth(sigma=0.05, inplace=True)
+        assert np.allclose(asa._ydata, smoothed._ydata)
+
+    def test_copy_without_does_not_copy_data(self):
+        from nelpy.utils_.copying import copy_without
+        time = np.arange(0, 1000, 0.001)
+        asa = AnalogSignalArray(np.random.RandomState(0).randn(4, len(time)),
+                                timestamps=time, fs=1000)
+        asa.asarray(at=[1.5]) # store an interpolant
+        # only the timestamps (a quarter of the size of ydata) are copied:
+        assert peak_memory(copy_without, asa, '_ydata') < 0.3*asa._ydata.nbytes
+        out = copy_without(asa, '_ydata')
+        out._ydata = np.zeros_like(asa._ydata)
+        out.__renew__()
+        assert out._epochdata._parent is out
+        assert out._interp is None
+        assert not np.shares_memory(out._time, asa._time)
+        assert np.array_equal(out.time, asa.time)
+
+    def test_smooth_allocates_only_the_output(self):
+        time = np.arange(0, 1000, 0.001)
+        asa = AnalogSignalArray(np.random.RandomState(0).randn(4, len(time)),
+                                timestamps=time, fs=1000,
+                                support=EpochArray([[0, 400], [500, 999.999]]))
+        nbytes = asa._ydata.nbytes
+        # output buffer plus copied timestamps, but no copy of the input:
+        assert peak_memory(asa.smooth, sigma=0.05) < 1.5*nbytes
+        assert peak_memory(asa.smooth, sigma=0.05, inplace=True) < 0.1*nbytes
+
+class TestDownsample:
+
+    def test_source_data_are_not_copied(self):
+        fs = 3000
+        time = np.arange(0, 200, 1/fs)
+        asa = AnalogSignalArray(np.random.RandomState(0).randn(4, len(time)),
+                                timestamps=time, fs=fs,
+                                support=EpochArray([[0, 80.1], [100, 199.9]]))
+        original = asa._ydata.copy()
+        nbytes = asa._ydata.nbytes
+        assert peak_memory(asa.downsample, fs_out=250, method='polyphase') < 0.5*nbytes
+        # interpolation copies the (boundary augmented) data once:
+        assert peak_memory(asa.downsample, fs_out=250, aafilter=False) < 3*nbytes
+        assert np.array_equal(asa._ydata, original)
+
+    def test_polyphase_timestamps_and_chunking(self):
+        from scipy.signal import resample_poly
+        from nelpy.utils import downsample_analogsignalarray
+        fs = 3000
+        time = np.arange(0, 10, 1/fs)
+        ydata = np.random.RandomState(0).randn(2, len(time))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=fs,
+                                support=EpochArray([[0, 4.1], [5, 10]]))
+        ds = asa.downsample(fs_out=250, method='polyphase')
+        assert ds.fs == 250
+        assert np.allclose(ds.time[:3], [0, 0.004, 0.008])
+        n_first = asa.lengths[0]
+        expected = resample_poly(asa._ydata[:,:n_first], 1, 12, axis=1)
+        assert np.allclose(ds._ydata[:,:expected.shape[1]], expected)
+        chunked = downsample_analogsignalarray(asa, fs_out=250, method='polyphase',
+                                               buffer_len=1000)
+        assert np.allclose(chunked._ydata, ds._ydata)
+
+    def test_polyphase_warns_about_approximate_rates(self):
+        from nelpy.utils import downsample_analogsignalarray
+        asa = AnalogSignalArray(np.zeros(3000), fs=3000)
+        with pytest.warns(UserWarning, match="instead of"):
+            ds = downsample_analogsignalarray(asa, fs_out=3000/1001.5, method='polyphase')
+        assert ds.fs != 3000/1001.5
+
+class TestSpectral:
+
+    def test_psd_matches_welch(self):
+        from scipy.signal import welch
+        fs = 1000
+        time = np.arange(0, 10, 1/fs)
+        rng = np.random.RandomState(0)
+        ydata = np.vstack((np.sin(2*np.pi*40*time) + rng.randn(len(time)),
+                           rng.randn(len(time))))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=fs)
+        psd = asa.psd(nperseg=500)
+        freqs, expected = welch(ydata, fs=fs, nperseg=500, axis=-1)
+        assert np.allclose(psd.freqs, freqs)
+        assert np.allclose(psd.power, expected)
+        multitaper = asa.psd(method='multitaper', nperseg=1000, NW=4)
+        assert abs(multitaper.freqs[np.argmax(multitaper.power[0])] - 40) <= 4
+
+    def test_multitaper_rejects_spectrum_scaling(self):
+        fs = 1000
+        time = np.arange(0, 10, 1/fs)
+        asa = AnalogSignalArray(np.sin(2*np.pi*40*time), timestamps=time, fs=fs)
+        assert np.isclose(asa.psd(nperseg=1000, scaling='spectrum').power.max(), 0.5)
+        with pytest.raises(ValueError):
+            asa.psd(method='multitaper', nperseg=1000, scaling='spectrum')
+        with pytest.raises(ValueError):
+            asa.spectrogram(method='multitaper', nperseg=1000, scaling='spectrum')
+        # the density still integrates to the power of the sine:
+        density = asa.psd(method='multitaper', nperseg=1000)
+        df = density.freqs[1] - density.freqs[0]
+        assert np.isclose(density.power.sum()*df, 0.5, rtol=0.01)
+
+    def test_segments_stay_within_epochs(self):
+        fs = 100
+        time = np.arange(0, 10, 1/fs)
+        asa = AnalogSignalArray(np.sin(time), timestamps=time, fs=fs,
+                                support=EpochArray([[0, 2.5], [3, 3.5], [6, 9]]))
+        spec = asa.spectrogram(nperseg=100, noverlap=0)
+        # 2 segments in the first epoch, none in the second, 3 in the third
+        assert spec.power.shape == (1, 51, 5)
+        assert np.allclose(spec.time, [0.495, 1.495, 6.495, 7.495, 8.495])
+        assert asa.psd(nperseg=100, noverlap=0).n_segments == 5
+
+class TestRegularlySampledTime:
+
+    def test_searchsorted_matches_materialized(self):
+        from nelpy.core._analogsignalarray import RegularlySampledTime
+        time = RegularlySampledTime([0, 5.3, 9], [100, 7, 40], 30)
+        materialized = np.asarray(time)
+        assert len(time) == len(materialized) == 147
+        values = np.concatenate((np.linspace(-1, 12, 500), materialized))
+        for side in ['left', 'right']:
+            assert np.array_equal(np.searchsorted(time, values, side=side),
+                                  np.searchsorted(materialized, values, side=side))
+        assert np.allclose(np.asarray(time.take_ranges([2, 95], [50, 110])),
+                           np.concatenate((materialized[2:50], materialized[95:110])))
+
+    def test_restriction_without_timestamps(self):
+        fs = 100
+        ydata = np.random.RandomState(0).randn(2, 3000)
+        compact = AnalogSignalArray(ydata, fs=fs)
+        explicit = AnalogSignalArray(ydata, timestamps=np.arange(3000)/fs, fs=fs)
+        assert compact._time.nbytes < explicit._time.nbytes
+        epochs = EpochArray([[1.005, 2.5], [3, 4.2], [10, 20.333]])
+        compact, explicit = compact[epochs], explicit[epochs]
+        assert np.array_equal(compact.lengths, explicit.lengths)
+        assert np.allclose(compact.time, explicit.time)
+        at = np.linspace(0, 31, 2000)
+        assert np.allclose(compact.asarray(at=at).yvals,
+                           explicit.asarray(at=at).yvals, equal_nan=True)
+
+    def test_extending_extern_does_not_materialize_needlessly(self):
+        from nelpy.auxiliary._tuningcurve import _extend_extern_to
+        asa = AnalogSignalArray(np.zeros((1, 1000)), fs=10)
+        assert _extend_extern_to(asa, np.array([1.0, 50.0])) is asa
+        extended = _extend_extern_to(asa, np.array([-1.0, 120.0]))
+        assert extended._time[0] == -1 and extended._time[-1] == 120
+        assert asa._time[0] == 0 and np.isclose(asa._time[-1], 99.9)
+
+    def test_collapse_time_materializes_once(self, monkeypatch):
+        from nelpy.core._analogsignalarray import RegularlySampledTime
+        from nelpy.utils import collapse_time
+        ydata = np.arange(3000, dtype=float)[None, :]
+        compact = AnalogSignalArray(ydata, fs=100)
+        explicit = AnalogSignalArray(ydata, timestamps=np.arange(3000)/100, fs=100)
+        epochs = EpochArray([[1, 2.5], [3, 4.2], [10, 20]])
+        compact, explicit = compact[epochs], explicit[epochs]
+        calls = []
+        to_array = RegularlySampledTime.__array__
+        def counting(self, dtype=None):
+            calls.append(1)
+            return to_array(self, dtype)
+        monkeypatch.setattr(RegularlySampledTime, '__array__', counting)
+        collapsed = collapse_time(compact)
+        assert len(calls) == 1
+        assert np.allclose(collapsed._time, collapse_time(explicit)._time)
@@ -0,0 +1,44 @@
+"""Tests for EventArray and ValueEventArray"""
+
+import numpy as np
+import nelpy as nel
+
+class TestValueEventArray:
+
+    def test_restriction_matches_per_source_masks(self):
+        rng = np.random.RandomState(0)
+        times = [np.sort(rng.rand(n)*100) for n in (50, 0, 80)]
+        values = [rng.rand(len(t)) for t in times]
+        vea = nel.ValueEventArray(times, eventvalues=values, fs=1000,
+                                  support=nel.EpochArray([[0, 30], [40, 90]]))
+        assert vea.n_sources == 3
+        for source in range(3):
+            keep = (times[source] < 30) | ((times[source] >= 40) & (times[source] < 90))
+            assert np.array_equal(vea.time[source], times[source][keep])
+            assert np.array_equal(vea.values[source], values[source][keep])
+        assert np.array_equal(vea.iloc[:, [2, 0]].n_events, vea.n_events[[2, 0]])
+        assert np.array_equal(vea[nel.EpochArray([10, 50])].n_events,
+                              [np.sum(((t >= 10) & (t < 30)) | ((t >= 40) & (t < 50))) for t in times])
+
+    def test_bin_reductions(self):
+        vea = nel.ValueEventArray([0.5, 1.5, 1.7, 3.2, 0.1, 3.9],
+                                  eventvalues=[1, 2, 4, 8, 16, 32],
+                                  source_idx=[0, 0, 0, 0, 1, 1], fs=1000,
+                                  support=nel.EpochArray([0, 4]))
+        assert np.array_equal(vea.columns.time, [0.1, 0.5, 1.5, 1.7, 3.2, 3.9])
+        binned = vea.bin(ds=1, reduce='sum')
+        assert np.allclose(binned.time, [0.5, 1.5, 2.5, 3.5])
+        assert np.allclose(binned._ydata, [[1, 6, 0, 8], [16, 0, 0, 32]])
+        assert np.allclose(vea.bin(ds=1, reduce='mean')._ydata,
+                           [[1, 3, np.nan, 8], [16, np.nan, np.nan, 32]], equal_nan=True)
+        assert np.allclose(vea.bin(ds=1, reduce='max')._ydata,
+                           [[1, 4, np.nan, 8], [16, np.nan, np.nan, 32]], equal_nan=True)
+
+    def test_reordering_keeps_source_id_and_label_types(self):
+        vea = nel.ValueEventArray([0.5, 1.5, 0.1], eventvalues=[1, 2, 3],
+                                  source_idx=[0, 0, 1], fs=1000, source_ids=[3, 7])
+        vea._source_labels = [1, 'x']
+        out = vea.reorder_sources_by_ids([7, 3])
+        assert out.source_ids == [7, 3]
+        assert out.source_labels == ['x', 1]
+        assert np.array_equal(out.n_events, [1, 2])
@@ -0,0 +1,258 @@
+"""Tests for TuningCurve1D and TuningCurve2D"""
+
+import numpy as np
+import pytest
+import nelpy as nel
+
+def _make_bst_and_position(n_units=5, duration=200, ds=0.05, seed=0):
+    rng = np.random.RandomState(seed)
+    st = nel.SpikeTrainArray([np.sort(rng.rand(rng.randint(200, 600))*duration)
+                              for _ in range(n_units)],
+                             fs=1000, support=nel.EpochArray([0, duration]))
+    bst = st.bin(ds=ds)
+    time = np.linspace(0, duration, duration*20)
+    pos = nel.AnalogSignalArray(50 + 45*np.sin(time/5), timestamps=time, fs=20)
+    return bst, pos
+
+class TestTuningCurve1D:
+
+    def test_ratemap_matches_per_bin_accumulation(self):
+        bst, pos = _make_bst_and_position()
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=20, extmin=0,
+                               extmax=100, min_duration=1, minbgrate=0)
+        ext = pos.asarray(at=bst.bin_centers).yvals.squeeze()
+        bin_idx = np.digitize(ext, tc.bins, right=True) - 1
+        counts = np.zeros((bst.n_units, 20))
+        for tt, bidx in enumerate(bin_idx):
+            counts[:, bidx] += bst.data[:, tt]
+        occupancy = np.bincount(bin_idx, minlength=20)
+        counts[:, occupancy*bst.ds < 1] = 0
+        expected = counts / bst.ds / np.maximum(occupancy, 1)
+        assert np.allclose(tc.ratemap, expected)
+
+    def test_spatial_information_significance(self):
+        _, pos = _make_bst_and_position()
+        rng = np.random.RandomState(1)
+        # unit 0 fires only around position 50; unit 1 fires randomly:
+        place_times = pos.time[np.abs(pos.ydata.squeeze() - 50) < 5]
+        st = nel.SpikeTrainArray([np.sort(place_times + rng.rand(len(place_times))/20),
+                                  np.sort(rng.rand(400)*200)],
+                                 fs=1000, support=nel.EpochArray([0, 200]))
+        bst = st.bin(ds=0.05)
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=20, extmin=0,
+                               extmax=100, sigma=5)
+        zscores, pvalues = tc.spatial_information_significance(
+            bst=bst, extern=pos, n_shuffles=50, random_state=0, batch_size=7)
+        assert zscores[0] > 3
+        assert pvalues[0] == 1/51
+        assert pvalues[1] > 0.05
+
+    def test_extern_not_covering_support(self):
+        st = nel.SpikeTrainArray([[0.2, 9.7]], fs=1000, support=nel.EpochArray([0, 10]))
+        bst = st.bin(ds=1)
+        time = np.arange(1, 9.5, 0.5) # samples only cover [1, 9]
+        pos = nel.AnalogSignalArray(10*time + 2, timestamps=time, fs=2)
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=10, extmin=0,
+                               extmax=100, min_duration=0, minbgrate=0)
+        # the first and last samples hold over to the first and last bins:
+        assert np.array_equal(tc.occupancy, [0, 2, 1, 1, 1, 1, 1, 1, 1, 1])
+        assert np.allclose(tc.ratemap, [[0, 0.5, 0, 0, 0, 0, 0, 0, 0, 1]])
+        assert np.array_equal(pos.time[[0, -1]], [1, 9])
+
+    def test_significance_with_extern_not_covering_support(self):
+        bst, _ = _make_bst_and_position()
+        time = np.arange(0.1, 199.95, 0.1)
+        pos = nel.AnalogSignalArray(50 + 45*np.sin(time/5), timestamps=time, fs=10)
+        # the same samples, with the extremes moved out to the bin centers:
+        extended = np.array(time)
+        extended[[0, -1]] = bst.bin_centers[[0, -1]]
+        pos_ext = nel.AnalogSignalArray(50 + 45*np.sin(time/5), timestamps=extended, fs=10)
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=20, extmin=0, extmax=100)
+        zscores, pvalues = tc.spatial_information_significance(
+            bst=bst, extern=pos, n_shuffles=20, random_state=0)
+        zscores_ext, pvalues_ext = tc.spatial_information_significance(
+            bst=bst, extern=pos_ext, n_shuffles=20, random_state=0)
+        assert np.all(np.isfinite(zscores))
+        assert np.allclose(zscores, zscores_ext)
+        assert np.array_equal(pvalues, pvalues_ext)
+        assert np.array_equal(pos.time, time) # extern itself is untouched
+
+    def test_significance_checks_its_inputs(self):
+        st = nel.SpikeTrainArray([[0.2, 3.1, 9.7], [1.5, 4.4]], fs=1000,
+                                 support=nel.EpochArray([0, 10]))
+        bst = st.bin(ds=1)
+        time = np.arange(0, 10.5, 0.5)
+        pos = nel.AnalogSignalArray(10*time, timestamps=time, fs=2)
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=10, extmin=0,
+                               extmax=100)
+        tc.spatial_information_significance(bst=bst, extern=pos, n_shuffles=5)
+        single = nel.SpikeTrainArray([[0.2, 3.1, 9.7]], fs=1000,
+                                     support=nel.EpochArray([0, 10])).bin(ds=1)
+        with pytest.raises(ValueError):
+            tc.spatial_information_significance(bst=single, extern=pos)
+        reordered = nel.SpikeTrainArray([[1.5, 4.4], [0.2, 3.1, 9.7]], fs=1000,
+                                         support=nel.EpochArray([0, 10]),
+                                         unit_ids=[2, 1]).bin(ds=1)
+        with pytest.raises(ValueError):
+            tc.spatial_information_significance(bst=reordered, extern=pos)
+        with pytest.raises(ValueError): # beyond extmax
+            tc.spatial_information_significance(
+                bst=bst, extern=nel.AnalogSignalArray(20*time, timestamps=time, fs=2))
+
+    def test_normalized_smoothing_ignores_unvisited_bins(self):
+        bst, _ = _make_bst_and_position()
+        time = np.linspace(0, 200, 4000)
+        pos = nel.AnalogSignalArray(50 + 40*np.sin(time/5), timestamps=time,
+                                    fs=20)
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=20, extmin=0,
+                               extmax=100, minbgrate=0)
+        smoothed = tc.smooth(sigma=10, normalized=True)
+        visited = tc.occupancy > 0
+        assert not visited.all()
+        assert np.all(smoothed.ratemap[:, ~visited] == 0)
+        # smoothed spike counts over smoothed occupancy:
+        expected = nel.TuningCurveND(bst=bst, extern=pos, n_extern=[20],
+                                     extmin=[0], extmax=[100], minbgrate=0,
+                                     sigma=10)
+        assert np.allclose(smoothed.ratemap[:, visited],
+                           expected.ratemap[:, visited])
+
+class TestTuningCurve2D:
+
+    def test_ratemap_matches_per_bin_accumulation(self):
+        bst, _ = _make_bst_and_position()
+        time = np.linspace(0, 200, 4000)
+        pos = nel.AnalogSignalArray(np.vstack((50 + 45*np.sin(time/5),
+                                               50 + 45*np.cos(time/3))),
+                                    timestamps=time, fs=20)
+        tc = nel.TuningCurve2D(bst=bst, extern=pos, ext_nx=8, ext_ny=6,
+                               ext_xmin=0, ext_xmax=100, ext_ymin=0,
+                               ext_ymax=100, min_duration=1, minbgrate=0)
+        x, y = pos.asarray(at=bst.bin_centers).yvals
+        xidx = np.digitize(x, tc.xbins, right=True) - 1
+        yidx = np.digitize(y, tc.ybins, right=True) - 1
+        counts = np.zeros((bst.n_units, 8, 6))
+        occupancy = np.zeros((8, 6))
+        for tt, (bx, by) in enumerate(zip(xidx, yidx)):
+            counts[:, bx, by] += bst.data[:, tt]
+            occupancy[bx, by] += 1
+        counts[:, occupancy*bst.ds < 1] = 0
+        expected = counts / bst.ds / np.maximum(occupancy, 1)
+        assert np.allclose(tc.ratemap, expected)
+
+class TestDirectionalTuningCurve1D:
+
+    def test_single_pass_matches_separate_bsts(self):
+        rng = np.random.RandomState(0)
+        time = np.linspace(0, 200, 6000)
+        lap = (time // 10).astype(int)
+        phase = (time % 10) / 10
+        x = np.where(lap % 2 == 0, 5 + 90*phase, 95 - 90*phase)
+        trains = []
+        for unit in range(6):
+            rate = 0.2 + 15*np.exp(-(x - rng.rand()*100)**2/50)
+            rate *= (lap % 2 == unit % 3) if unit % 3 < 2 else 1
+            trains.append(time[rng.rand(len(time)) < rate/30])
+        laps = nel.EpochArray([[10*ii, 10*ii + 9.5] for ii in range(20)])
+        bst = nel.SpikeTrainArray(trains, fs=1000, support=laps).bin(ds=0.05)
+        pos = nel.AnalogSignalArray(x, timestamps=time, fs=30)
+        outbound, inbound = list(range(0, 20, 2)), list(range(1, 20, 2))
+
+        expected = nel.DirectionalTuningCurve1D(
+            bst_l2r=bst[outbound], bst_r2l=bst[inbound], bst_combined=bst,
+            extern=pos, n_extern=40, extmin=0, extmax=100, sigma=3)
+        tc = nel.DirectionalTuningCurve1D(
+            bst=bst, direction=(laps[outbound], laps[inbound]), extern=pos,
+            n_extern=40, extmin=0, extmax=100, sigma=3)
+        assert np.allclose(tc.ratemap, expected.ratemap)
+        assert sorted(tc.unit_ids_l2r) == sorted(expected.unit_ids_l2r)
+        assert sorted(tc.unit_ids_r2l) == sorted(expected.unit_ids_r2l)
+
+        direction = np.where(lap[np.searchsorted(time, bst.bin_centers)] % 2 == 0,
+                             'out', 'in')
+        tcs = nel.conditional_tuningcurves(bst=bst, extern=pos,
+                                           conditions=direction, n_extern=40,
+                                           extmin=0, extmax=100, sigma=3)
+        assert sorted(tcs) == ['in', 'out']
+        expected_out = nel.TuningCurve1D(bst=bst[outbound], extern=pos,
+                                         n_extern=40, extmin=0, extmax=100,
+                                         sigma=3)
+        assert np.allclose(tcs['out'].ratemap, expected_out.ratemap)
+
+class TestTuningCurveND:
+
+    def test_unsmoothed_ratemap_matches_tuningcurve2d(self):
+        bst, _ = _make_bst_and_position()
+        time = np.linspace(0, 200, 4000)
+        pos = nel.AnalogSignalArray(np.vstack((50 + 45*np.sin(time/5),
+                                               50 + 45*np.cos(time/3))),
+                                    timestamps=time, fs=20)
+        tc2d = nel.TuningCurve2D(bst=bst, extern=pos, ext_nx=8, ext_ny=6,
+                                 ext_xmin=0, ext_xmax=100, ext_ymin=0,
+                                 ext_ymax=100, min_duration=1)
+        tcnd = nel.TuningCurveND(bst=bst, extern=pos, n_extern=[8, 6],
+                                 extmin=[0, 0], extmax=[100, 100],
+                                 min_duration=1)
+        assert tcnd.shape == tc2d.shape
+        assert np.allclose(tcnd.ratemap, tc2d.ratemap)
+        assert tcnd.n_visited == np.sum(tc2d.occupancy*bst.ds >= 1)
+        assert tcnd.unit_ids == bst.unit_ids
+
+    def test_smoothing_is_normalized_convolution(self):
+        import scipy.ndimage
+        bst, pos = _make_bst_and_position()
+        tcnd = nel.TuningCurveND(bst=bst, extern=pos, n_extern=[20],
+                                 extmin=[0], extmax=[100], sigma=10)
+        visited = tcnd.occupancy > 0
+        counts = np.zeros((bst.n_units, 20))
+        counts[:, visited] = tcnd._counts
+        smooth = lambda arr: scipy.ndimage.gaussian_filter1d(
+            arr*visited, 2, axis=-1, mode='constant', truncate=4)
+        expected = smooth(counts) / (smooth(tcnd.occupancy)*bst.ds)
+        expected = np.maximum(expected, 0.01)
+        assert np.allclose(tcnd.ratemap[:, visited], expected[:, visited])
+        assert np.all(tcnd.ratemap[:, ~visited] == 0.01)
+
+class TestTuningCurveAccumulator:
+
+    def test_chunked_and_merged_accumulation_matches_tuning_curve(self):
+        time = np.linspace(0, 200, 4000)
+        pos = nel.AnalogSignalArray(50 + 45*np.sin(time/5), timestamps=time, fs=20)
+        st = nel.SpikeTrainArray([np.sort(np.random.RandomState(unit).rand(400)*200)
+                                  for unit in range(5)],
+                                 fs=1000, support=nel.EpochArray([0, 200]))
+        bst = st.bin(ds=0.05)
+        tc = nel.TuningCurve1D(bst=bst, extern=pos, n_extern=20, extmin=0,
+                               extmax=100, sigma=3, min_duration=0.5)
+        acc1 = nel.TuningCurve1DAccumulator(n_extern=20, extmin=0, extmax=100)
+        acc2 = nel.TuningCurve1DAccumulator(n_extern=20, extmin=0, extmax=100)
+        acc1.update(st[nel.EpochArray([0, 70])].bin(ds=0.05), pos)
+        acc1.update(st[nel.EpochArray([70, 120])].bin(ds=0.05), pos)
+        acc2.update(st[nel.EpochArray([120, 200])].bin(ds=0.05), pos)
+        merged = acc1.merge(acc2)
+        assert np.isclose(merged.duration, 200)
+        assert np.isclose(acc1.duration, 120) # unchanged by merge
+        tc_acc = merged.finalize(sigma=3, min_duration=0.5)
+        assert np.allclose(tc_acc.occupancy, tc.occupancy)
+        assert np.allclose(tc_acc.ratemap, tc.ratemap)
+        assert tc_acc.unit_ids == tc.unit_ids
+
+    def test_mismatched_and_empty_chunks(self):
+        st = nel.SpikeTrainArray([[0.2, 3.1, 9.7], [1.5, 4.4]], fs=1000,
+                                 support=nel.EpochArray([0, 10]))
+        time = np.arange(0, 10.5, 0.5)
+        pos = nel.AnalogSignalArray(10*time, timestamps=time, fs=2)
+        acc = nel.TuningCurve1DAccumulator(n_extern=5, extmin=0, extmax=100)
+        acc.update(st.bin(ds=1), pos)
+        assert np.array_equal(acc.occupancy, [2, 2, 2, 2, 2])
+        assert np.array_equal(acc.counts, [[1, 1, 0, 0, 1], [1, 0, 1, 0, 0]])
+        # chunks without bins are skipped, whatever their bin width:
+        acc.update(st.bin(ds=0.1)[nel.EpochArray(empty=True)], pos)
+        assert np.isclose(acc.duration, 10)
+        with pytest.raises(ValueError):
+            acc.update(st.bin(ds=0.5), pos)
+        with pytest.raises(ValueError):
+            acc.update(st[:, 1].bin(ds=1), pos)
+        with pytest.raises(ValueError):
+            acc.merge(nel.TuningCurve1DAccumulator(n_extern=10, extmin=0,
+                                                   extmax=100))
@@ -0,0 +1,66 @@
+"""Tests for the content-addressed result cache"""
+
+import os
+import numpy as np
+import nelpy as nel
+from nelpy import filtering
+from nelpy.utils_ import cache
+
+class TestResultCache:
+
+    def test_fingerprint_depends_on_content_only(self):
+        ydata = np.random.RandomState(0).randn(2, 1000)
+        asa = nel.AnalogSignalArray(ydata, fs=100)
+        assert asa.fingerprint == nel.AnalogSignalArray(ydata.copy(), fs=100).fingerprint
+        assert asa.fingerprint != nel.AnalogSignalArray(ydata + 1, fs=100).fingerprint
+        assert asa.fingerprint != nel.AnalogSignalArray(ydata, fs=200).fingerprint
+        asa.asarray(n_points=10) # attaching an interpolation object is not a change
+        assert not asa._has_changed()
+
+    def test_in_place_changes_are_detected(self):
+        asa = nel.AnalogSignalArray(np.random.RandomState(0).randn(2, 1000), fs=100)
+        assert not asa._has_changed()
+        asa._ydata[1, 10] += 1
+        assert asa._has_changed()
+        asa.__bake__()
+        assert not asa._has_changed()
+        sliced = asa[:, 1]
+        sliced._ydata *= 2
+        assert sliced._has_changed()
+
+    def test_memoized_results_and_disk_eviction(self, tmpdir):
+        ydata = np.random.RandomState(0).randn(2, 20000)
+        asa = nel.AnalogSignalArray(ydata, fs=1000)
+        try:
+            results = cache.configure(maxsize=2, cache_dir=str(tmpdir), max_bytes=10**6)
+            filtered = filtering.sosfiltfilt(asa, fl=5, fh=50)
+            again = filtering.sosfiltfilt(nel.AnalogSignalArray(ydata.copy(), fs=1000),
+                                          fl=5, fh=50, n_jobs=2)
+            assert (results.hits, results.misses) == (1, 1)
+            assert again is not filtered
+            assert np.array_equal(again._ydata, filtered._ydata)
+            for fh in [100, 200, 300]:
+                filtering.sosfiltfilt(asa, fl=5, fh=fh)
+            assert len(results) == 2
+            sizes = [os.path.getsize(str(path)) for path in tmpdir.listdir()]
+            assert sum(sizes) <= 10**6
+        finally:
+            cache.configure(enabled=False)
+
+    def test_in_place_changes_invalidate_cached_results(self):
+        asa = nel.AnalogSignalArray(np.random.RandomState(0).randn(1, 1000), fs=100)
+        try:
+            cache.configure(maxsize=8)
+            assert asa.smooth(sigma=0.1).n_signals == 1
+            asa.add_signal(np.ones(1000))
+            assert asa.smooth(sigma=0.1).n_signals == 2
+        finally:
+            cache.configure(enabled=False)
+
+    def test_functions_are_fingerprinted_by_what_they_do(self):
+        def scaled(k):
+            return lambda x: k*x
+        assert cache.fingerprint(lambda x: x + 1) != cache.fingerprint(lambda x: x + 2)
+        assert cache.fingerprint(scaled(2)) != cache.fingerprint(scaled(3))
+        assert cache.fingerprint(scaled(2)) == cache.fingerprint(scaled(2))
+        assert cache.fingerprint(np.mean) == cache.fingerprint(np.mean)
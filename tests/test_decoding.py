@@ -0,0 +1,271 @@
+"""Tests for Bayesian decoding"""
+
+import tracemalloc
+import numpy as np
+import pytest
+import nelpy as nel
+
+def peak_memory(func, *args, **kwargs):
+    """Peak memory (in bytes) allocated while calling func(*args, **kwargs)."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _make_laps(n_laps=8, n_units=10, seed=0):
+    rng = np.random.RandomState(seed)
+    duration = 20*n_laps
+    time = np.linspace(0, duration, duration*30)
+    x = 50 + 45*np.sin(time/5)
+    trains = []
+    for _ in range(n_units):
+        rate = 0.2 + 15*np.exp(-(x - rng.rand()*100)**2/50)
+        trains.append(time[rng.rand(len(time)) < rate/30])
+    laps = nel.EpochArray([[20*ii, 20*ii + 19] for ii in range(n_laps)])
+    st = nel.SpikeTrainArray(trains, fs=1000, support=laps)
+    pos = nel.AnalogSignalArray(x, timestamps=time, fs=30)
+    return st.bin(ds=0.05), pos
+
+def _make_tuningcurve(bst, pos):
+    return nel.TuningCurve1D(bst=bst, extern=pos, n_extern=20, extmin=0,
+                             extmax=100, sigma=3)
+
+def _make_counts(lengths, n_units=3, n_shuffles=None, seed=0):
+    rng = np.random.RandomState(seed)
+    shape = (n_units, np.sum(lengths))
+    if n_shuffles is not None:
+        shape = (n_shuffles,) + shape
+    return rng.poisson(0.3, size=shape)
+
+RATEMAP = np.random.RandomState(0).gamma(2, 2, size=(3, 10)) + 0.1
+
+class TestCrossValidation:
+
+    def test_fold_tuningcurves_match_rebuilt_tuningcurves(self):
+        bst, pos = _make_laps()
+        n_folds = 0
+        for training, validation, tc in nel.decoding.cross_validated_tuningcurves(
+                bst, pos, k='loo', n_extern=20, extmin=0, extmax=100, sigma=3):
+            expected = nel.TuningCurve1D(bst=bst[training], extern=pos,
+                                         n_extern=20, extmin=0, extmax=100,
+                                         sigma=3)
+            assert np.allclose(tc.ratemap, expected.ratemap)
+            assert np.allclose(tc.occupancy, expected.occupancy)
+            n_folds += 1
+        assert n_folds == bst.n_epochs
+
+    def test_xval_decoding_error_matches_decoding_each_fold(self):
+        bst, pos = _make_laps(n_laps=4)
+        def decodefunc(bst, tc):
+            return nel.decoding.decode1D(bst, tc)
+        kwargs = dict(k=4, n_extern=20, extmin=0, extmax=100, sigma=3)
+        cumhist, bincenters = nel.decoding.cumulative_dist_decoding_error_using_xval(
+            bst, pos, **kwargs)
+        expected = nel.decoding.cumulative_dist_decoding_error_using_xval(
+            bst, pos, decodefunc=decodefunc, **kwargs)
+        assert np.allclose(cumhist, expected[0])
+        assert np.allclose(bincenters, expected[1])
+
+class TestDecode1D:
+
+    def test_matches_per_window_decoding(self):
+        bst, pos = _make_laps(n_laps=3)
+        tc = _make_tuningcurve(bst, pos)
+        w = 4
+        posterior, cum_lengths, mode_pth, mean_pth = nel.decoding.decode1D(bst, tc, w=w)
+        assert np.array_equal(cum_lengths, np.insert(np.cumsum(bst.lengths - w + 1), 0, 0))
+        lfx = np.log(tc.ratemap)
+        eterm = -tc.ratemap.sum(axis=0)*bst.ds*w
+        starts = np.insert(np.cumsum(bst.lengths), 0, 0)
+        for ii in range(bst.n_epochs):
+            for tt in range(bst.lengths[ii] - w + 1):
+                left = starts[ii] + tt
+                obs = bst.data[:, left:left+w].sum(axis=1)
+                post_idx = cum_lengths[ii] + tt
+                if obs.sum() == 0:
+                    assert np.all(np.isnan(posterior[:, post_idx]))
+                    continue
+                expected = np.exp((obs[:, np.newaxis]*lfx).sum(axis=0) + eterm)
+                assert np.allclose(posterior[:, post_idx], expected/expected.sum())
+        assert np.allclose(mean_pth, (tc.bin_centers*posterior.T).sum(axis=1), equal_nan=True)
+
+    def test_high_count_windows_do_not_overflow(self):
+        st = nel.SpikeTrainArray([np.linspace(0, 10, 5000, endpoint=False),
+                                  np.linspace(0, 10, 2000, endpoint=False)],
+                                 fs=1000, support=nel.EpochArray([0, 10]))
+        tc = nel.TuningCurve1D(ratemap=1e4*RATEMAP[:2, :5], extmin=0, extmax=5)
+        posterior, _, _, _ = nel.decoding.decode1D(st.bin(ds=0.05), tc, w=50)
+        assert not np.isnan(posterior).any()
+        assert np.allclose(posterior.sum(axis=0), 1)
+
+class TestDecode2D:
+
+    def test_matches_per_window_decoding(self, tmpdir):
+        rng = np.random.RandomState(0)
+        ratemap = rng.gamma(2, 2, size=(6, 5, 4)) + 0.1
+        tc = nel.TuningCurve2D(ratemap=ratemap, ext_xmin=0, ext_xmax=50,
+                               ext_ymin=0, ext_ymax=40)
+        bst, _ = _make_laps(n_laps=2, n_units=6)
+        w = 3
+        posterior, cum_lengths, mode_pth, mean_pth = nel.decoding.decode2D(
+            bst, tc, w=w, nospk_prior=1, chunk_size=17,
+            filename=str(tmpdir.join('posterior.dat')))
+        assert posterior.shape == (4, 5, cum_lengths[-1])
+        lfx = np.log(ratemap)
+        eterm = -ratemap.sum(axis=0)*bst.ds*w
+        for post_idx in rng.choice(cum_lengths[1], size=20, replace=False):
+            obs = bst.data[:, post_idx:post_idx+w].sum(axis=1)
+            if obs.sum() == 0:
+                expected = np.ones((5, 4)) # nospk_prior
+            else:
+                expected = np.exp(np.tensordot(obs, lfx, axes=1) + eterm)
+            expected /= expected.sum()
+            assert np.allclose(posterior[:, :, post_idx], expected.T)
+            x_, y_ = np.unravel_index(np.argmax(expected), expected.shape)
+            assert np.allclose(mode_pth[:, post_idx], [tc.xbins[x_], tc.ybins[y_]])
+            assert np.allclose(mean_pth[:, post_idx],
+                               [(tc.xbin_centers*expected.sum(axis=1)).sum(),
+                                (tc.ybin_centers*expected.sum(axis=0)).sum()])
+
+class TestBayesianDecoder:
+
+    def test_decode_matches_decode1D_for_reordered_units(self):
+        bst, pos = _make_laps(n_laps=3)
+        tc = _make_tuningcurve(bst, pos)
+        decoder = nel.decoding.BayesianDecoder(tc.reorder_units(), bst.ds, w=3)
+        for actual, expected in zip(decoder.decode(bst),
+                                    nel.decoding.decode1D(bst, tc, w=3)):
+            assert np.allclose(actual, expected, equal_nan=True)
+
+    def test_replay_scoring_accepts_a_decoder(self):
+        from nelpy.analysis import replay
+        bst, pos = _make_laps(n_laps=3)
+        tc = _make_tuningcurve(bst, pos)
+        decoder = nel.decoding.BayesianDecoder(tc, bst.ds)
+        for actual, expected in zip(replay.linregress_bst(bst, decoder),
+                                    replay.linregress_bst(bst, tc)):
+            assert np.allclose(actual, expected, equal_nan=True)
+        with pytest.raises(ValueError):
+            replay.linregress_bst(bst, nel.decoding.BayesianDecoder(tc, 2*bst.ds))
+
+    def test_short_and_empty_epochs(self):
+        ratemap = np.array([[1., 2.], [4., 1.]])
+        counts = np.array([[1, 0, 1, 0, 0, 0],
+                           [0, 1, 0, 0, 2, 0]])
+        lengths = [2, 0, 4] # shorter than w, empty, and longer than w
+        # posterior odds of bin 1 over bin 0 in every window, with the
+        # expected spike count term taken over w*ds = 1.5 seconds:
+        odds = np.array([2/4, 2/16, 1/16])*np.exp(3)
+        expected = np.vstack((1/(1 + odds), odds/(1 + odds)))
+        decoder = nel.decoding.BayesianDecoder(ratemap, ds=0.5, w=3)
+        posterior = decoder.decode_counts(counts, lengths)
+        assert posterior.shape == (2, 4)
+        assert np.allclose(posterior[:, [0, 2, 3]], expected)
+        assert np.all(np.isnan(posterior[:, 1]))
+        decoder = nel.decoding.BayesianDecoder(ratemap, ds=0.5, w=3, nospk_prior=1)
+        assert np.allclose(decoder.decode_counts(counts, lengths)[:, 1], 0.5)
+
+    def test_bin_size_must_match(self):
+        tc = nel.TuningCurve1D(ratemap=np.array([[1., 2.], [4., 1.], [2., 2.]]),
+                               extmin=0, extmax=2)
+        st = nel.SpikeTrainArray([[0.1, 0.7], [0.3], [1.2]],
+                                 support=nel.EpochArray([[0, 1.5]]))
+        decoder = nel.decoding.BayesianDecoder(tc, ds=0.5)
+        decoder.decode(st.bin(ds=0.5))
+        with pytest.raises(ValueError):
+            decoder.decode(st.bin(ds=0.25))
+        with pytest.raises(ValueError):
+            decoder.decode_counts(st.bin(ds=0.25).data, ds=0.25)
+
+    def test_unit_orders_are_bounded(self):
+        tc = nel.TuningCurve1D(ratemap=np.array([[1., 2.], [4., 1.], [2., 2.]]),
+                               extmin=0, extmax=2)
+        decoder = nel.decoding.BayesianDecoder(tc, ds=0.5)
+        counts = np.array([[1], [0], [2]])
+        orders = [[1, 2, 3], [1, 3, 2], [2, 1, 3], [2, 3, 1], [3, 1, 2], [3, 2, 1]]
+        for order in orders[1:]:
+            posterior = decoder.decode_counts(counts[np.array(order) - 1],
+                                              unit_ids=order)
+            assert np.allclose(posterior, decoder.decode_counts(counts))
+        assert len(decoder._unit_terms) == len(orders) - 1
+        decoder = nel.decoding.BayesianDecoder(tc, ds=0.5)
+        decoder._max_unit_orders = 2
+        for order in orders:
+            decoder.decode_counts(counts, unit_ids=order)
+        assert list(decoder._unit_terms) == [(3, 1, 2), (3, 2, 1)]
+
+    def test_batch_of_count_matrices(self):
+        tc = nel.TuningCurve1D(ratemap=RATEMAP, extmin=0, extmax=10)
+        decoder = nel.decoding.BayesianDecoder(tc, ds=0.1, w=2, nospk_prior=1)
+        lengths = [6, 0, 9]
+        counts = _make_counts(lengths, n_shuffles=4)
+        posterior = decoder.decode_counts(counts, lengths, chunk_size=4)
+        log_likelihood = decoder.log_likelihood(counts, lengths)
+        # the empty epoch still gets a (no spike) posterior:
+        assert posterior.shape == log_likelihood.shape == (4, 10, 5 + 1 + 8)
+        for ii in range(4):
+            assert np.allclose(posterior[ii], decoder.decode_counts(counts[ii], lengths))
+        spikes = counts[:, :, :2].sum(axis=(1, 2)) > 0
+        expected = np.exp(log_likelihood[spikes, :, 0])
+        assert np.allclose(posterior[spikes, :, 0],
+                           expected/expected.sum(axis=1, keepdims=True))
+        with pytest.raises(ValueError):
+            decoder.decode_counts(counts, lengths, unit_ids=[100, 2, 3])
+
+    def test_decode_surrogates_in_blocks(self):
+        from nelpy.analysis import replay
+        decoder = nel.decoding.BayesianDecoder(RATEMAP, ds=0.1, w=2)
+        lengths = [6, 0, 9]
+        counts = _make_counts(lengths)
+        surrogates = replay.time_swap_counts(counts, lengths, n_shuffles=5,
+                                             random_state=0)
+        assert surrogates.shape == (5,) + counts.shape
+        assert np.array_equal(surrogates[:, :, :6].sum(axis=2),
+                              np.tile(counts[:, :6].sum(axis=1), (5, 1)))
+        expected = decoder.decode_counts(surrogates, lengths)
+        for max_bytes in (2**30, 2**20, 1000):
+            posterior = decoder.decode_surrogates(surrogates, lengths,
+                                                  max_bytes=max_bytes)
+            assert np.allclose(posterior, expected, equal_nan=True)
+
+    def test_decode_surrogates_keeps_to_the_memory_budget(self):
+        decoder = nel.decoding.BayesianDecoder(RATEMAP, ds=0.1, w=2)
+        surrogates = _make_counts([2000], n_shuffles=50)
+        out_nbytes = 8*50*10*1999
+        max_bytes = 2**16
+        assert peak_memory(decoder.decode_surrogates, surrogates,
+                           max_bytes=max_bytes) < out_nbytes + 8*max_bytes
+
+class TestStreamingDecoder:
+
+    def test_matches_batch_decoding(self):
+        w = 4
+        counts = _make_counts([40])
+        decoder = nel.decoding.StreamingDecoder(RATEMAP, ds=0.1, w=w)
+        posterior, mode_pth, mean_pth = decoder.update(counts[:, :w-1])
+        assert posterior.shape == (10, w-1)
+        posterior, mode_pth, mean_pth = decoder.update(counts[:, w-1:])
+        expected = nel.decoding.BayesianDecoder(RATEMAP, ds=0.1, w=w).decode_counts(counts)
+        assert np.allclose(posterior, expected, equal_nan=True)
+        assert np.isnan(expected).any()
+        assert np.allclose(mode_pth, np.where(np.isnan(expected[0]), np.nan,
+                                              np.argmax(expected, axis=0)),
+                           equal_nan=True)
+        assert np.allclose(mean_pth, np.arange(10) @ expected, equal_nan=True)
+        decoder.reset()
+        for ii in range(counts.shape[1]):
+            posterior = decoder.update(counts[:, ii])[0]
+        assert np.allclose(posterior, expected[:, -1], equal_nan=True)
+
+    def test_spike_times_are_binned_as_they_arrive(self):
+        rng = np.random.RandomState(0)
+        ratemap = rng.gamma(2, 2, size=(3, 10)) + 0.1
+        decoder = nel.decoding.StreamingDecoder(ratemap, ds=0.1, w=2, t0=1)
+        assert decoder.update_spikes([1.05, 1.12], [0, 2], t=1.15)[0].shape == (10, 1)
+        posterior, _, _ = decoder.update_spikes([0.9, 1.18, 1.25], [1, 1, 0], t=1.3)
+        expected = nel.decoding.StreamingDecoder(ratemap, ds=0.1, w=2)
+        expected.update([1, 0, 0])
+        assert np.allclose(posterior[:, 0], expected.update([0, 1, 1])[0])
+        assert np.isclose(decoder.time, 1.3)
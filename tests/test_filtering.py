@@ -0,0 +1,75 @@
+"""Tests for nelpy.filtering"""
+
+import tracemalloc
+import numpy as np
+from nelpy.core import AnalogSignalArray, EpochArray
+from nelpy.filtering import sosfiltfilt, FilterBank
+
+def peak_memory(func, *args, **kwargs):
+    """Peak memory (in bytes) allocated while calling func(*args, **kwargs)."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _long_asa():
+    time = np.arange(0, 1000, 0.001)
+    return AnalogSignalArray(np.random.RandomState(0).randn(4, len(time)),
+                             timestamps=time, fs=1000,
+                             support=EpochArray([[0, 400], [500, 999.999]]))
+
+class TestSosfiltfilt:
+
+    def test_threaded_matches_serial(self):
+        fs = 1000
+        time = np.arange(0, 20, 1/fs)
+        ydata = np.random.RandomState(0).randn(3, len(time))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=fs,
+                                support=EpochArray([[0, 8], [10, 20]]))
+        original = asa._ydata.copy()
+        serial = sosfiltfilt(asa, fl=10, fh=50, buffer_len=4000)
+        threaded = sosfiltfilt(asa, fl=10, fh=50, buffer_len=4000, n_jobs=4)
+        assert np.allclose(serial._ydata, threaded._ydata)
+        assert np.array_equal(asa._ydata, original)
+
+    def test_cached_filter_design_is_not_shared(self):
+        from nelpy.filtering import _design_sos
+        sos = _design_sos(1000, 10, 50)
+        expected = sos.copy()
+        sos[:] = 0
+        assert np.array_equal(_design_sos(1000, 10, 50), expected)
+
+    def test_allocates_only_the_output(self):
+        asa = _long_asa()
+        # output buffer, copied timestamps (0.25) and chunk-sized temporaries:
+        peak = peak_memory(sosfiltfilt, asa, fl=10, fh=50, buffer_len=10000)
+        assert peak < 1.5*asa._ydata.nbytes
+
+class TestFilterBank:
+
+    def test_bands_match_sosfiltfilt(self):
+        fs = 1000
+        time = np.arange(0, 20, 1/fs)
+        ydata = np.random.RandomState(1).randn(2, len(time))
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=fs,
+                                support=EpochArray([[0, 8], [10, 20]]))
+        bank = FilterBank({'theta': (6, 12), 'ripple': (150, 250)},
+                          buffer_len=4000)
+        filtered = bank.filter(asa)
+        assert list(filtered.keys()) == ['theta', 'ripple']
+        for name, (fl, fh) in bank.bands.items():
+            expected = sosfiltfilt(asa, fl=fl, fh=fh, buffer_len=4000)
+            assert np.allclose(filtered[name]._ydata, expected._ydata)
+
+        stacked = bank.filter(asa, stacked=True)
+        assert stacked.n_signals == 4
+        assert np.allclose(stacked._ydata[2:], filtered['ripple']._ydata)
+
+    def test_allocates_only_the_outputs(self):
+        asa = _long_asa()
+        bank = FilterBank({'theta': (6, 12), 'ripple': (150, 250)},
+                          buffer_len=10000)
+        assert peak_memory(bank.filter, asa) < 2.75*asa._ydata.nbytes
+        assert peak_memory(bank.filter, asa, stacked=True) < 2.5*asa._ydata.nbytes
@@ -0,0 +1,36 @@
+"""Tests for nelpy.plotting"""
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import nelpy.plotting as npl
+from nelpy.core import AnalogSignalArray, EpochArray
+
+class TestPlot:
+
+    def test_decimated_matches_undecimated(self):
+        fs = 1000
+        time = np.arange(0, 100, 1/fs)
+        ydata = np.vstack((np.sin(time), 3*np.cos(time)))
+        ydata[0, 5000] = 10
+        asa = AnalogSignalArray(ydata, timestamps=time, fs=fs,
+                                support=EpochArray([[0, 40], [50, 90]]))
+        fig, (ax1, ax2) = plt.subplots(2)
+        try:
+            npl.plot(asa, ax=ax1, label='lfp')
+            npl.plot(asa, ax=ax2, label='lfp', decimate=True)
+            full, decimated = ax1.get_lines(), ax2.get_lines()
+            # every sample is drawn by default, one line per epoch and signal
+            assert len(full) == 4
+            assert sum(line.get_xdata().size for line in full) == 2*asa.n_samples
+            assert len(decimated) == 2
+            assert decimated[0].get_xdata().size < asa.n_samples
+            for ii, line in enumerate(decimated):
+                assert line.get_label() == 'lfp'
+                assert line.get_color() == full[ii].get_color()
+                assert np.isclose(np.nanmax(line.get_ydata()), asa._ydata[ii].max())
+                assert np.isclose(np.nanmin(line.get_ydata()), asa._ydata[ii].min())
+            assert [line.get_label() for line in full] == ['lfp', 'lfp', '_nolegend_', '_nolegend_']
+        finally:
+            plt.close(fig)
@@ -1,4 +1,7 @@
+import tracemalloc
+import numpy as np
 from nelpy.utils import *
+from nelpy.utils import signal_envelope, signal_envelope1D
 
 class TestUtils:
 
@@ -25,4 +28,47 @@ class TestUtils:
     def test_linear_merge5(self):
         """Merge two empty lists"""
         merged = linear_merge([],[])
-        assert list(merged) == []
\ No newline at end of file
+        assert list(merged) == []
+
+
+class TestSignalEnvelope:
+
+    def test_multiple_signals_and_blocks(self):
+        import nelpy as nel
+        fs = 1000
+        time = np.arange(0, 30, 1/fs)
+        ydata = np.sin(2*np.pi*8*time) * (1 + 0.5*np.sin(2*np.pi*0.3*time))
+        asa = nel.AnalogSignalArray(np.vstack((ydata, 2*ydata)), timestamps=time, fs=fs,
+                                    support=nel.EpochArray([[0, 1.5], [2, 3], [4, 30]]))
+        envelope = signal_envelope(asa, sigma=0)
+        assert envelope.n_signals == 2
+        assert np.allclose(envelope._ydata[1], 2*envelope._ydata[0])
+        single = signal_envelope1D(asa[:,0], sigma=0)
+        assert np.allclose(single._ydata, envelope._ydata[[0]])
+
+        blocked, phase, frequency = signal_envelope(asa, sigma=0, block_len=4000,
+                                                    overlap_len=2000,
+                                                    return_phase=True,
+                                                    return_frequency=True)
+        # documented error bound, for the 8 Hz carrier with amplitude <= 3:
+        bound = 3*fs / (2*np.pi**2*8*2000)
+        interior = slice(4000, -2000)
+        assert np.allclose(blocked._ydata[:,interior], envelope._ydata[:,interior], rtol=0, atol=bound)
+        assert np.all(np.abs(phase._ydata) <= np.pi)
+        assert np.isclose(np.median(frequency._ydata), 8, atol=0.1)
+
+    def test_analytic_signal_is_not_held_in_memory(self):
+        import nelpy as nel
+        time = np.arange(0, 1000, 0.001)
+        asa = nel.AnalogSignalArray(np.random.RandomState(0).randn(4, len(time)),
+                                    timestamps=time, fs=1000,
+                                    support=nel.EpochArray([[0, 400], [500, 999.999]]))
+        tracemalloc.start()
+        try:
+            signal_envelope(asa, block_len=2**14, return_phase=True)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # envelope and phase, plus copied timestamps (0.25 each), but not
+        # the complex analytic signal (2.0):
+        assert peak < 3*asa._ydata.nbytes